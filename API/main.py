@@ -9,6 +9,7 @@ append_to_sys_path()
 from chat.API.main import router as chat_router  # noqa: E402
 from embedding.API.main import router as embedding_router  # noqa: E402
 from tts.API.main import router as tts_asr_router  # noqa: E402
+from voice_chat.API.main import router as voice_chat_router  # noqa: E402
 from whisper_asr.API.main import router as whisper_asr_router  # noqa: E402
 
 app = FastAPI()
@@ -18,3 +19,4 @@ app.include_router(whisper_asr_router, tags=["Darija ASR"])
 app.include_router(tts_asr_router, tags=["Darija TTS"])
 app.include_router(chat_router, tags=["Darija Chat"])
 app.include_router(embedding_router, tags=["Text Embedding"])
+app.include_router(voice_chat_router, tags=["Darija Voice Chat"])
@@ -3,7 +3,10 @@ import streamlit as st
 
 st.title("Transcribe Audio")
 
-uploaded_file = st.file_uploader("Upload a WAV file for transcription", type=["wav"])
+uploaded_file = st.file_uploader(
+	"Upload an audio file for transcription",
+	type=["wav", "mp3", "ogg", "opus", "webm", "flac", "m4a"],
+)
 recorded_file = st.audio_input("Record an audio")
 
 if st.button("Transcribe"):
@@ -26,4 +29,4 @@ if st.button("Transcribe"):
 			except Exception as e:  # noqa: BLE001
 				st.error(f"An error occurred: {e}")
 	else:
-		st.warning("Please upload a WAV file before transcribing.")
+		st.warning("Please upload an audio file before transcribing.")
@@ -1,11 +1,15 @@
-import requests  # noqa: D100
+import uuid  # noqa: D100
+
+import requests
 import streamlit as st
 
 st.title("Chat with AI")
 
-# Initialize chat history
+# Initialize chat history, the API keeps its own copy under the session ID
 if "text_messages" not in st.session_state:
 	st.session_state.text_messages = []
+if "text_session_id" not in st.session_state:
+	st.session_state.text_session_id = uuid.uuid4().hex
 
 # Display chat messages from history on app rerun
 for message in st.session_state.text_messages:
@@ -24,7 +28,10 @@ if prompt := st.chat_input("You:"):
 		try:
 			response = requests.post(  # noqa: S113
 				"http://localhost:8001/chat",
-				json={"messages": st.session_state.text_messages},
+				json={
+					"messages": [{"role": "user", "content": prompt}],
+					"session_id": st.session_state.text_session_id,
+				},
 			)
 			if response.status_code == 200:  # noqa: PLR2004
 				reply = response.json()
@@ -4,15 +4,42 @@ It allows users to upload audio, transcribe it, and get AI responses in both tex
 speech.
 """
 
+import base64
+import io
+import json
+import uuid
+import wave
+
 import requests
 import streamlit as st
 
 st.set_page_config(page_title="End-to-End Voice Chat with AI in Darija", layout="wide")
 
 
-# Initialize chat history and input disabled state
+def concat_wavs(wavs: list[bytes]) -> bytes:
+	"""Concatenate WAV files sharing the same format into a single WAV file.
+
+	Args:
+		wavs (list[bytes]): The contents of the WAV files.
+
+	Returns:
+		bytes: The content of the concatenated WAV file.
+	"""
+	buf = io.BytesIO()
+	with wave.open(buf, "wb") as out:
+		for i, wav in enumerate(wavs):
+			with wave.open(io.BytesIO(wav), "rb") as part:
+				if i == 0:
+					out.setparams(part.getparams())
+				out.writeframes(part.readframes(part.getnframes()))
+	return buf.getvalue()
+
+
+# Initialize chat history, session ID and input disabled state
 if "messages" not in st.session_state:
 	st.session_state.messages = []
+if "session_id" not in st.session_state:
+	st.session_state.session_id = uuid.uuid4().hex
 if "input_disabled" not in st.session_state:
 	st.session_state.input_disabled = False
 
@@ -36,88 +63,63 @@ if send:
 	if uploaded_audio:
 		st.session_state.input_disabled = True  # Disable audio_input and send button
 
-		# Send audio to transcribe endpoint
-		with st.spinner("Transcribing your audio..."):
+		# Send audio to the voice chat endpoint, the response is streamed back
+		with st.spinner("AI is responding..."):
 			try:
-				files = {"files": uploaded_audio}
-				transcribe_response = requests.post(  # noqa: S113
-					"http://localhost:8001/transcribe",
-					files=files,
+				response = requests.post(  # noqa: S113
+					"http://localhost:8001/voice-chat",
+					files={"audio": uploaded_audio},
+					data={
+						"session_id": st.session_state.session_id,
+						"speaker": "Male",
+					},
+					stream=True,
 				)
-				if transcribe_response.status_code == 200:  # noqa: PLR2004
-					transcription = transcribe_response.json()[0]
+				if response.status_code == 200:  # noqa: PLR2004
+					audios = []
+					reply_placeholder = None
+					for line in response.iter_lines():
+						if not line:
+							continue
+						event = json.loads(line)
+						if event["event"] == "transcript" and not event["text"]:
+							container.warning("No speech was detected in your audio.")
+						elif event["event"] == "transcript":
+							# display user message
+							with container.chat_message("user"):
+								st.write(event["text"])
+								st.audio(uploaded_audio)
+							st.session_state.messages.append(
+								{
+									"role": "user",
+									"content": event["text"],
+									"audio": uploaded_audio,
+								},
+							)
+							reply_placeholder = container.chat_message("assistant")
+						elif event["event"] == "audio":
+							audios.append(base64.b64decode(event["audio"]))
+						elif event["event"] == "reply":
+							audio_bytes = concat_wavs(audios) if audios else None
+							with reply_placeholder:
+								st.write(event["text"])
+								if audio_bytes is not None:
+									st.audio(audio_bytes, format="audio/wav")
+							st.session_state.messages.append(
+								{
+									"role": "assistant",
+									"content": event["text"],
+									"audio": audio_bytes,
+								},
+							)
+						elif event["event"] == "error":
+							container.error(f"Voice Chat Error: {event['detail']}")
 				else:
 					container.error(
-						f"Transcription Error: {transcribe_response.json().get('detail')}",  # noqa: E501
+						f"Voice Chat Error: {response.json().get('detail')}",
 					)
-					transcription = ""
 			except Exception as e:  # noqa: BLE001
-				container.error(f"An error occurred during transcription: {e}")
-				transcription = ""
-
-		if transcription:
-			# display user message
-			with container.chat_message("user"):
-				st.write(transcription)
-				st.audio(uploaded_audio)
-
-			# Append transcribed text to messages
-			st.session_state.messages.append(
-				{"role": "user", "content": transcription, "audio": uploaded_audio},
-			)
-
-			# Send transcribed text to chat endpoint
-			with st.spinner("AI is responding..."):
-				try:
-					messages = [
-						{"role": message["role"], "content": message["content"]}
-						for message in st.session_state.messages
-					]
-					response = requests.post(  # noqa: S113
-						"http://localhost:8001/chat",
-						json={"messages": messages},
-					)
-					if response.status_code == 200:  # noqa: PLR2004
-						reply = response.json()
-					else:
-						container.error(
-							f"Chat Error: {response.json().get('detail', 'Unknown error')}",  # noqa: E501
-						)
-						reply = ""
-				except Exception as e:  # noqa: BLE001
-					container.error(f"An error occurred while getting AI response: {e}")
-					reply = ""
-
-		if reply:
-			# Convert AI's reply to speech
-			with st.spinner("Converting AI response to speech..."):
-				try:
-					generate_response = requests.post(  # noqa: S113
-						"http://localhost:8001/generate",
-						json={
-							"text": reply,
-							"voice": "Male",
-							"checkpoint": "states_6000",
-						},
-					)
-					if generate_response.status_code == 200:  # noqa: PLR2004
-						audio_bytes = generate_response.content
-						st.session_state.messages.append(
-							{
-								"role": "assistant",
-								"content": reply,
-								"audio": audio_bytes,
-							},
-						)
-						with container.chat_message("assistant"):
-							st.write(reply)
-							st.audio(audio_bytes, format="audio/wav")
-					else:
-						container.error(
-							f"TTS Error: {generate_response.json().get('detail')}",
-						)
-				except Exception as e:  # noqa: BLE001
-					container.error(f"An error occurred during TTS conversion: {e}")
+				container.error(f"An error occurred during the voice chat: {e}")
 
 		st.session_state.input_disabled = False  # Re-enable audio_input and send button
 	else:
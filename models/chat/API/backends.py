@@ -0,0 +1,253 @@
+"""Backends generating the chat responses.
+
+The backend is selected with the `CHAT_BACKEND` environment variable:
+- `anthropic` (default): the Claude model, through the Anthropic API.
+- `local`: a stand-in answering canned or templated Darija responses, with a
+  tunable latency and generation speed, to benchmark the API without network,
+  see `local_backend.LocalBackend`.
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Iterator
+from os import environ
+from pathlib import Path
+
+import anthropic
+import httpx
+from lgg import logger
+
+# token counts reported in the usage of a response
+USAGE_KEYS = (
+	"input_tokens",
+	"output_tokens",
+	"cache_creation_input_tokens",
+	"cache_read_input_tokens",
+)
+
+# Maximum seconds of a call to the chat model, or before its first streamed delta
+DEADLINE = float(environ.get("CHAT_DEADLINE_S", "30"))
+
+
+class ChatBackend(ABC):
+	"""Generate the response to a conversation.
+
+	The messages and system prompt follow the format of the Anthropic Messages
+	API. The responses are returned raw, ie. without cleanup. If `usage` is given,
+	it's updated with the token usage of the response.
+	"""
+
+	@abstractmethod
+	def complete(
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		"""Generate the whole response to a conversation."""
+
+	@abstractmethod
+	def stream(
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> Iterator[str]:
+		"""Generate the response to a conversation, yielding the text deltas."""
+
+	@abstractmethod
+	async def acomplete(
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		"""Generate the whole response to a conversation, without blocking."""
+
+	@abstractmethod
+	def astream(
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> AsyncIterator[str]:
+		"""Generate the response to a conversation, yielding the text deltas."""
+
+
+class AnthropicBackend(ChatBackend):
+	"""The Claude model, through the Anthropic API.
+
+	The clients are created on first use, so the API can start without an API key
+	when the chat isn't needed. They don't retry failed calls, retries are left to
+	the `ResilientBackend` wrapping this backend.
+	"""
+
+	def __init__(
+		self,
+		model: str,
+		max_connections: int,
+		max_keepalive: int,
+		timeout: float,
+	) -> None:
+		"""Initialize the backend.
+
+		Args:
+			model (str): The name of the Claude model.
+			max_connections (int): The maximum number of concurrent connections.
+			max_keepalive (int): The maximum number of idle keep-alive connections.
+			timeout (float): The timeout of the HTTP requests, in seconds.
+		"""
+		self.model = model
+		self.max_connections = max_connections
+		self.max_keepalive = max_keepalive
+		self.timeout = timeout
+		self._client = None
+		self._async_client = None
+
+	@property
+	def client(self) -> anthropic.Anthropic:
+		"""The synchronous client."""
+		if self._client is None:
+			self._client = anthropic.Anthropic(
+				api_key=environ.get("ANTHROPIC_API_KEY"),
+				timeout=self.timeout,
+				max_retries=0,
+			)
+		return self._client
+
+	@property
+	def async_client(self) -> anthropic.AsyncAnthropic:
+		"""The async client, sharing a pool of keep-alive connections."""
+		if self._async_client is None:
+			self._async_client = anthropic.AsyncAnthropic(
+				api_key=environ.get("ANTHROPIC_API_KEY"),
+				timeout=self.timeout,
+				max_retries=0,
+				http_client=anthropic.DefaultAsyncHttpxClient(
+					limits=httpx.Limits(
+						max_connections=self.max_connections,
+						max_keepalive_connections=self.max_keepalive,
+						keepalive_expiry=30,
+					),
+				),
+			)
+		return self._async_client
+
+	@staticmethod
+	def _record_usage(message: anthropic.types.Message, usage: dict | None) -> None:
+		"""Copy the token usage of a response into `usage`, if it's given."""
+		if usage is not None:
+			usage.update(
+				{key: getattr(message.usage, key, 0) or 0 for key in USAGE_KEYS},
+			)
+
+	def complete(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		message = self.client.messages.create(
+			model=self.model,
+			max_tokens=max_tokens,
+			system=system,
+			messages=messages,
+		)
+		self._record_usage(message, usage)
+		return message.content[0].text
+
+	def stream(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> Iterator[str]:
+		with self.client.messages.stream(
+			model=self.model,
+			max_tokens=max_tokens,
+			system=system,
+			messages=messages,
+		) as stream:
+			yield from stream.text_stream
+			self._record_usage(stream.get_final_message(), usage)
+
+	async def acomplete(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		message = await self.async_client.messages.create(
+			model=self.model,
+			max_tokens=max_tokens,
+			system=system,
+			messages=messages,
+		)
+		self._record_usage(message, usage)
+		return message.content[0].text
+
+	async def astream(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> AsyncIterator[str]:
+		async with self.async_client.messages.stream(
+			model=self.model,
+			max_tokens=max_tokens,
+			system=system,
+			messages=messages,
+		) as stream:
+			async for delta in stream.text_stream:
+				yield delta
+			self._record_usage(await stream.get_final_message(), usage)
+
+
+def load_backend() -> ChatBackend:
+	"""Create the chat backend selected by the environment variables.
+
+	Returns:
+		ChatBackend: The chat backend.
+
+	Raises:
+		ValueError: If the backend is unknown, or the responses file of the local
+			backend is empty, or its speed isn't positive.
+	"""
+	name = environ.get("CHAT_BACKEND", "anthropic")
+	logger.info(f"Using the {name} chat backend")
+	if name == "anthropic":
+		return AnthropicBackend(
+			model=environ.get("CHAT_MODEL", "claude-3-5-haiku-20241022"),
+			max_connections=int(environ.get("CHAT_MAX_CONNECTIONS", "100")),
+			max_keepalive=int(environ.get("CHAT_MAX_KEEPALIVE_CONNECTIONS", "20")),
+			timeout=DEADLINE,
+		)
+	if name == "local":
+		from .local_backend import LOCAL_RESPONSES, LocalBackend
+
+		responses = LOCAL_RESPONSES
+		if responses_path := environ.get("CHAT_LOCAL_RESPONSES"):
+			# one response per line
+			lines = Path(responses_path).read_text(encoding="utf-8").splitlines()
+			responses = [line for line in lines if line.strip()]
+			if not responses:
+				msg = f"The chat responses file {responses_path} has no responses."
+				raise ValueError(msg)
+		tokens_per_second = float(environ.get("CHAT_LOCAL_TOKENS_PER_SECOND", "80"))
+		if tokens_per_second <= 0:
+			msg = f"The local chat speed {tokens_per_second} tokens/s isn't positive."
+			raise ValueError(msg)
+		return LocalBackend(
+			responses=responses,
+			latency=float(environ.get("CHAT_LOCAL_LATENCY_S", "0.3")),
+			tokens_per_second=tokens_per_second,
+		)
+	msg = f"Unknown chat backend: {name}"
+	raise ValueError(msg)
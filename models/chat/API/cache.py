@@ -0,0 +1,194 @@
+"""Semantic cache of the chat responses to short exchanges.
+
+Near-duplicate user turns (greetings, thanks, ...) are served from the cache
+instead of calling the chat model. The last user turn is embedded and compared to
+the cached ones, while the preceding messages and the system prompt must match
+exactly.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections.abc import Callable
+from os import environ
+
+import numpy as np
+from lgg import logger
+
+ENABLED = environ.get("CHAT_CACHE_ENABLED", "0") == "1"
+# Minimum cosine similarity between two user turns to serve the cached response
+THRESHOLD = float(environ.get("CHAT_CACHE_THRESHOLD", "0.92"))
+TTL = float(environ.get("CHAT_CACHE_TTL_S", "3600"))
+MAX_ENTRIES = int(environ.get("CHAT_CACHE_MAX_ENTRIES", "10000"))
+# Longest conversation, in messages, whose response can be cached
+MAX_MESSAGES = int(environ.get("CHAT_CACHE_MAX_MESSAGES", "1"))
+
+
+def _text(content: str | list[dict]) -> str:
+	"""Get the text of a message content, given as a string or content blocks."""
+	if isinstance(content, str):
+		return content
+	return "".join(block["text"] for block in content)
+
+
+def _context_key(messages: list[dict], prompt: str | list[dict] | None) -> str:
+	"""Hash the system prompt and the messages preceding the last user turn."""
+	prompt = prompt if prompt is None else _text(prompt)
+	context = [prompt] + [[m["role"], _text(m["content"])] for m in messages[:-1]]
+	context = json.dumps(context, ensure_ascii=False)
+	return hashlib.sha256(context.encode()).hexdigest()
+
+
+class SemanticCache:
+	"""An in-memory vector index of user turns and the responses to them.
+
+	Entries expire after `ttl` seconds. When the cache is full, an expired entry
+	or else the least recently used one is replaced.
+	"""
+
+	def __init__(
+		self,
+		embed: Callable[[list[str]], np.ndarray],
+		threshold: float,
+		ttl: float,
+		max_entries: int,
+		max_messages: int,
+	) -> None:
+		"""Initialize an empty cache.
+
+		Args:
+			embed (Callable): Computes the embeddings of a list of texts.
+			threshold (float): The minimum cosine similarity of a cache hit.
+			ttl (float): The time to live of an entry, in seconds.
+			max_entries (int): The maximum number of entries.
+			max_messages (int): The longest conversation that can be cached.
+		"""
+		self.embed = embed
+		self.threshold = threshold
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.max_messages = max_messages
+		self._lock = threading.Lock()
+		self._vectors = None  # allocated once the embedding size is known
+		self._expires = np.zeros(max_entries)
+		self._last_used = np.zeros(max_entries)
+		self._keys = [None] * max_entries
+		self._responses = [None] * max_entries
+		self._size = 0
+		self._stats = {"hits": 0, "misses": 0, "skipped": 0, "evictions": 0}
+
+	def eligible(self, messages: list[dict]) -> bool:
+		"""Check whether the response to a conversation can be cached.
+
+		Args:
+			messages (list[dict]): The messages of the conversation.
+
+		Returns:
+			bool: Whether the conversation is short enough and ends with a user turn.
+		"""
+		return (
+			0 < len(messages) <= self.max_messages
+			and messages[-1]["role"] == "user"
+			and isinstance(messages[-1]["content"], str)
+		)
+
+	def _embed(self, text: str) -> np.ndarray:
+		"""Compute the normalized embedding of a text."""
+		vector = np.asarray(self.embed([text])[0], dtype=np.float32)
+		return vector / (np.linalg.norm(vector) + 1e-9)
+
+	def lookup(
+		self,
+		messages: list[dict],
+		prompt: str | list[dict] | None,
+	) -> tuple[str | None, np.ndarray | None]:
+		"""Look for the cached response to a conversation.
+
+		Args:
+			messages (list[dict]): The messages of the conversation.
+			prompt (str | list[dict], optional): The system prompt.
+
+		Returns:
+			tuple[str | None, np.ndarray | None]: The cached response, or None on a
+			miss, and the embedding of the last user turn, to pass to `insert`.
+			Both are None if the conversation isn't eligible.
+		"""
+		if not self.eligible(messages):
+			with self._lock:
+				self._stats["skipped"] += 1
+			return None, None
+		vector = self._embed(messages[-1]["content"])
+		key = _context_key(messages, prompt)
+		now = time.time()
+		with self._lock:
+			if self._size:
+				similarities = self._vectors[: self._size] @ vector
+				candidates = np.flatnonzero(
+					(similarities >= self.threshold)
+					& (self._expires[: self._size] >= now),
+				)
+				# most similar first, the context must match exactly
+				for i in candidates[np.argsort(-similarities[candidates])]:
+					if self._keys[i] == key:
+						self._last_used[i] = now
+						self._stats["hits"] += 1
+						return self._responses[i], vector
+			self._stats["misses"] += 1
+		return None, vector
+
+	def insert(
+		self,
+		messages: list[dict],
+		prompt: str | list[dict] | None,
+		vector: np.ndarray,
+		response: str,
+	) -> None:
+		"""Cache the response to a conversation.
+
+		Args:
+			messages (list[dict]): The messages of the conversation.
+			prompt (str | list[dict], optional): The system prompt.
+			vector (np.ndarray): The embedding returned by `lookup`.
+			response (str): The response to cache.
+		"""
+		key = _context_key(messages, prompt)
+		now = time.time()
+		with self._lock:
+			if self._vectors is None:
+				dim = vector.shape[0]
+				self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+			if self._size < self.max_entries:
+				i = self._size
+				self._size += 1
+			else:
+				expired = np.flatnonzero(self._expires < now)
+				i = expired[0] if len(expired) else int(np.argmin(self._last_used))
+				self._stats["evictions"] += 1
+			self._vectors[i] = vector
+			self._expires[i] = now + self.ttl
+			self._last_used[i] = now
+			self._keys[i] = key
+			self._responses[i] = response
+
+	def stats(self) -> dict:
+		"""Get the hit rate and size of the cache."""
+		with self._lock:
+			stats = dict(self._stats)
+			stats["entries"] = self._size
+		lookups = stats["hits"] + stats["misses"]
+		stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+		return stats
+
+
+def _load_cache() -> SemanticCache | None:
+	"""Load the cache, with the embedding model, if it is enabled."""
+	if not ENABLED:
+		return None
+	from embedding.API.predict import predict as embed
+
+	logger.info(f"Chat cache enabled with a similarity threshold of {THRESHOLD}")
+	return SemanticCache(embed, THRESHOLD, TTL, MAX_ENTRIES, MAX_MESSAGES)
+
+
+cache = _load_cache()
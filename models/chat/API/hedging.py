@@ -0,0 +1,212 @@
+"""Deadlines and hedging of the calls to the chat backend.
+
+Each attempt of a call is bounded by a deadline. Optionally, a call is hedged:
+once it runs longer than a percentile of the recent latencies, a second identical
+attempt is sent, and the first one to answer wins. Synchronous attempts run in
+threads, abandoned when late, and asynchronous ones are tasks, cancelled when
+late.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any
+
+import numpy as np
+
+# Number of recent latencies the percentile is computed on, and the minimum
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+def _run_in_thread(function: Callable, *args: Any) -> Future:  # noqa: ANN401
+	"""Run a function in a daemon thread, so it can be abandoned if too slow."""
+	future = Future()
+
+	def run() -> None:
+		try:
+			future.set_result(function(*args))
+		except Exception as e:  # noqa: BLE001
+			future.set_exception(e)
+
+	threading.Thread(target=run, daemon=True).start()
+	return future
+
+
+class Hedger:
+	"""Run the attempts of calls with a deadline, hedging the slow ones."""
+
+	def __init__(self, deadline: float, percentile: float) -> None:
+		"""Initialize the hedger.
+
+		Args:
+			deadline (float): The maximum seconds of an attempt.
+			percentile (float): The latency percentile after which a call is
+				hedged, 0 to disable hedging.
+		"""
+		self.deadline = deadline
+		self.percentile = percentile
+		self._lock = threading.Lock()
+		# the latencies of the whole responses and of the first streamed deltas
+		self._latencies = {
+			"complete": deque(maxlen=HEDGE_WINDOW),
+			"stream": deque(maxlen=HEDGE_WINDOW),
+		}
+		self._stats = {"attempts": 0, "hedges": 0, "hedge_wins": 0}
+
+	def _count(self, key: str) -> None:
+		with self._lock:
+			self._stats[key] += 1
+
+	def delay(self, kind: str) -> float | None:
+		"""Get the seconds after which a call is hedged, or None not to hedge."""
+		if not self.percentile:
+			return None
+		with self._lock:
+			latencies = list(self._latencies[kind])
+		if len(latencies) < HEDGE_MIN_SAMPLES:
+			return None
+		return float(np.percentile(latencies, self.percentile))
+
+	def _result(
+		self,
+		kind: str,
+		attempts: dict,
+		winner: Future | asyncio.Future | None,
+		error: BaseException | None,
+	) -> tuple[Any, dict]:
+		"""Get the result of the winning attempt, or raise the last error."""
+		if winner is None:
+			raise error
+		usage, start = attempts[winner]
+		with self._lock:
+			self._latencies[kind].append(time.perf_counter() - start)
+		if winner is not next(iter(attempts)):
+			self._count("hedge_wins")
+		return winner.result(), usage
+
+	def run(
+		self,
+		kind: str,
+		call: Callable[[dict], Any],
+		discard: Callable[[Any], None] | None = None,
+	) -> tuple[Any, dict]:
+		"""Run a call with a deadline, hedging it if it is slow.
+
+		Args:
+			kind (str): The kind of latency measured, `complete` or `stream`.
+			call (Callable): Runs one attempt, given the usage dict to update.
+			discard (Callable, optional): Releases the result of a losing attempt.
+
+		Returns:
+			tuple[Any, dict]: The result and usage of the first successful attempt.
+		"""
+		attempts = {}  # future -> (usage, start time)
+
+		def launch() -> None:
+			self._count("attempts")
+			usage = {}
+			attempts[_run_in_thread(call, usage)] = (usage, time.perf_counter())
+
+		launch()
+		delay = self.delay(kind)
+		if delay is not None and not wait(attempts, timeout=delay).done:
+			self._count("hedges")
+			launch()
+		pending, error, winner = set(attempts), None, None
+		while pending and winner is None:
+			expires = min(attempts[f][1] for f in pending) + self.deadline
+			timeout = max(expires - time.perf_counter(), 0)
+			done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+			if not done:
+				# the oldest attempt is past its deadline, abandon it
+				oldest = min(pending, key=lambda f: attempts[f][1])
+				pending.discard(oldest)
+				error = TimeoutError(f"No chat response in {self.deadline} s")
+			for future in done:
+				if future.exception() is None:
+					winner = future
+					break
+				error = future.exception()
+		for future in attempts:
+			if future is not winner and discard is not None:
+				future.add_done_callback(
+					lambda f: f.exception() is None and discard(f.result()),
+				)
+		return self._result(kind, attempts, winner, error)
+
+	async def arun(
+		self,
+		kind: str,
+		call: Callable[[dict], Awaitable],
+		discard: Callable[[Any], Awaitable] | None = None,
+	) -> tuple[Any, dict]:
+		"""Run a call with a deadline, hedging it if it is slow, see `run`."""
+		attempts = {}  # task -> (usage, start time)
+
+		def launch() -> None:
+			self._count("attempts")
+			usage = {}
+			task = asyncio.ensure_future(asyncio.wait_for(call(usage), self.deadline))
+			attempts[task] = (usage, time.perf_counter())
+
+		launch()
+		delay = self.delay(kind)
+		pending, error, winner = set(attempts), None, None
+		try:
+			if delay is not None:
+				done, _ = await asyncio.wait(pending, timeout=delay)
+				if not done:
+					self._count("hedges")
+					launch()
+					pending = set(attempts)
+			while pending and winner is None:
+				done, pending = await asyncio.wait(
+					pending,
+					return_when=asyncio.FIRST_COMPLETED,
+				)
+				for task in done:
+					if task.exception() is None:
+						winner = task
+						break
+					error = task.exception()
+		finally:
+			await self._release(attempts, winner, discard)
+		return self._result(kind, attempts, winner, error)
+
+	@staticmethod
+	async def _release(
+		attempts: dict,
+		winner: asyncio.Future | None,
+		discard: Callable[[Any], Awaitable] | None,
+	) -> None:
+		"""Cancel the pending losing attempts, and discard the finished ones."""
+		for task in attempts:
+			if task is winner:
+				continue
+			if not task.done():
+				task.cancel()
+			elif discard is not None and task.exception() is None:
+				await discard(task.result())
+
+	def stats(self) -> dict:
+		"""Get the attempt counts and the recent latency percentiles.
+
+		Returns:
+			dict: The numbers of attempts, hedges and hedges that answered first,
+			the p50/p95/p99 latencies of the whole responses and of the first
+			streamed deltas, and the current hedging delay.
+		"""
+		with self._lock:
+			stats = dict(self._stats)
+			latencies = {kind: list(values) for kind, values in self._latencies.items()}
+		for kind, values in latencies.items():
+			for p in (50, 95, 99):
+				stats[f"{kind}_p{p}_s"] = (
+					float(np.percentile(values, p)) if values else None
+				)
+		stats["hedge_delay_s"] = self.delay("complete")
+		return stats
@@ -0,0 +1,110 @@
+"""A local stand-in for the chat model, to benchmark the API without network.
+
+It answers canned or templated Darija responses, with a tunable latency and
+generation speed, see `backends.load_backend` for its environment variables.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections.abc import AsyncIterator, Iterator
+
+from .backends import USAGE_KEYS, ChatBackend
+
+# responses of the local backend, when no responses file is given
+LOCAL_RESPONSES = [
+	"السلام عليكم، لاباس عليك؟ انا هنا باش نعاونك. شنو بغيتي تعرف اليوم؟",
+	"مزيان بزاف! قول ليا كثر على هاد الموضوع باش نفهمك مزيان.",
+	"الله يعطيك الصحة على السؤال. هادشي اللي كنعرف عليه: خاصك تاخد وقتك و تفكر فيه مزيان.",  # noqa: E501
+	"واخا، فهمتك. واش بغيتي نزيدك شي معلومات اخرين؟",
+]
+
+
+class LocalBackend(ChatBackend):
+	"""A stand-in answering canned or templated Darija responses, without network.
+
+	The response to a conversation is picked deterministically from the last user
+	message. Responses may contain a `{message}` placeholder, replaced by the last
+	user message. Each word is generated as one token, after a first-token latency
+	and at a fixed number of tokens per second.
+	"""
+
+	def __init__(
+		self,
+		responses: list[str],
+		latency: float,
+		tokens_per_second: float,
+	) -> None:
+		"""Initialize the backend.
+
+		Args:
+			responses (list[str]): The canned responses, possibly templated.
+			latency (float): The seconds before the first token is generated.
+			tokens_per_second (float): The generation speed.
+		"""
+		self.responses = responses
+		self.latency = latency
+		self.tokens_per_second = tokens_per_second
+
+	def _tokens(self, messages: list[dict], usage: dict | None) -> list[str]:
+		"""Pick the response to a conversation and split it into tokens."""
+		content = messages[-1]["content"] if messages else ""
+		if not isinstance(content, str):
+			content = "".join(block["text"] for block in content)
+		digest = hashlib.sha256(content.encode()).digest()
+		response = self.responses[digest[0] % len(self.responses)]
+		response = response.replace("{message}", content)
+		words = response.split(" ")
+		tokens = [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+		if usage is not None:
+			# rough estimation, at ~4 characters per token
+			chars = sum(len(str(message["content"])) for message in messages)
+			usage.update(dict.fromkeys(USAGE_KEYS, 0))
+			usage.update({"input_tokens": chars // 4, "output_tokens": len(tokens)})
+		return tokens
+
+	def complete(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],  # noqa: ARG002
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		tokens = self._tokens(messages, usage)[:max_tokens]
+		time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+		return "".join(tokens)
+
+	def stream(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],  # noqa: ARG002
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> Iterator[str]:
+		time.sleep(self.latency)
+		for token in self._tokens(messages, usage)[:max_tokens]:
+			time.sleep(1 / self.tokens_per_second)
+			yield token
+
+	async def acomplete(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],  # noqa: ARG002
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		tokens = self._tokens(messages, usage)[:max_tokens]
+		await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+		return "".join(tokens)
+
+	async def astream(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],  # noqa: ARG002
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> AsyncIterator[str]:
+		await asyncio.sleep(self.latency)
+		for token in self._tokens(messages, usage)[:max_tokens]:
+			await asyncio.sleep(1 / self.tokens_per_second)
+			yield token
@@ -1,9 +1,17 @@
 """Main API module for the Whisper ASR."""
 
+import json
+from collections.abc import AsyncIterator
+
+import numpy as np
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from .predict import predict
+from .cache import cache
+from .predict import apredict, astream_predict, backend, build_system
+from .sessions import sessions
 
 router = APIRouter()
 
@@ -16,12 +24,33 @@ class Message(BaseModel):  # noqa: D101
 class Dialog(BaseModel):  # noqa: D101
 	messages: list[Message]
 	prompt: str = None
+	session_id: str | None = None
+
+
+async def _cache_lookup(
+	messages: list[dict],
+	system: list[dict],
+) -> tuple[str | None, np.ndarray | None]:
+	"""Look for a cached response, if the cache is enabled.
+
+	Returns:
+		tuple[str | None, np.ndarray | None]: The cached response and the
+		embedding of the last user turn, see `SemanticCache.lookup`.
+	"""
+	if cache is None:
+		return None, None
+	# computing the embedding is CPU-bound, so don't block the event loop
+	return await run_in_threadpool(cache.lookup, messages, system)
 
 
 @router.post("/chat")
-def respond_to_dialog(dialog: Dialog) -> str:
+async def respond_to_dialog(dialog: Dialog) -> str:
 	"""Process a dialog and generate a response.
 
+	If a session ID is given, the history of the conversation is kept
+	server-side, and the dialog must only contain the new messages. Responses
+	to short conversations may be served from the semantic cache.
+
 	Args:
 		dialog (Dialog): An instance of the Dialog class containing the
 		conversation messages.
@@ -38,6 +67,131 @@ def respond_to_dialog(dialog: Dialog) -> str:
 		dialog = dialog.model_dump()
 		messages = dialog["messages"]
 		prompt = dialog.get("prompt", None)
-		return predict(messages, prompt)
+		system, turn, usage = build_system(prompt), None, {}
+		if dialog["session_id"] is not None:
+			turn = sessions.start_turn(dialog["session_id"], messages, prompt)
+			messages, system = turn.messages, turn.system
+		reply, vector = await _cache_lookup(messages, system)
+		if reply is None:
+			reply = await apredict(messages, system, usage)
+			if vector is not None:
+				cache.insert(messages, system, vector, reply)
+		if turn is not None:
+			sessions.end_turn(turn, reply, usage)
+		return reply  # noqa: TRY300
 	except Exception as e:  # noqa: BLE001
 		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+
+
+def _sse(data: dict, event: str | None = None) -> str:
+	"""Format a server-sent event.
+
+	Args:
+		data (dict): The data of the event, sent as JSON.
+		event (str, optional): The type of the event.
+
+	Returns:
+		str: The formatted event.
+	"""
+	data = json.dumps(data, ensure_ascii=False)
+	return f"event: {event}\ndata: {data}\n\n" if event else f"data: {data}\n\n"
+
+
+@router.post("/chat/stream")
+async def stream_dialog_response(dialog: Dialog) -> StreamingResponse:
+	"""Process a dialog and stream the response as server-sent events.
+
+	Each text delta is sent as a `data: {"text": ...}` event as soon as it is
+	generated. The stream ends with a `done` event, or an `error` event if the
+	generation fails. Sessions are handled as in `/chat`.
+
+	Args:
+		dialog (Dialog): An instance of the Dialog class containing the
+		conversation messages.
+
+	Returns:
+		StreamingResponse: The stream of server-sent events.
+	"""
+	dialog = dialog.model_dump()
+	messages, system, turn = dialog["messages"], build_system(dialog["prompt"]), None
+	if dialog["session_id"] is not None:
+		turn = sessions.start_turn(dialog["session_id"], messages, dialog["prompt"])
+		messages, system = turn.messages, turn.system
+
+	async def events() -> AsyncIterator[str]:
+		try:
+			usage = {}
+			reply, vector = await _cache_lookup(messages, system)
+			if reply is not None:
+				yield _sse({"text": reply})
+			else:
+				reply = []
+				async for text in astream_predict(messages, system, usage):
+					reply.append(text)
+					yield _sse({"text": text})
+				reply = "".join(reply)
+				if vector is not None:
+					cache.insert(messages, system, vector, reply)
+			if turn is not None:
+				sessions.end_turn(turn, reply, usage)
+			yield _sse({}, event="done")
+		except Exception as e:  # noqa: BLE001
+			yield _sse({"detail": str(e)}, event="error")
+
+	return StreamingResponse(
+		events(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@router.get("/chat/stats")
+def get_chat_stats() -> dict:
+	"""Get the retry and hedge counts and the latencies of the chat model calls.
+
+	Returns:
+		dict: The statistics of the calls, see `ResilientBackend.stats`.
+	"""
+	return backend.stats()
+
+
+@router.get("/chat/cache/stats")
+def get_cache_stats() -> dict:
+	"""Get the hit rate and size of the semantic response cache.
+
+	Returns:
+		dict: The statistics of the cache, or only `enabled: false` if it is
+		disabled.
+	"""
+	if cache is None:
+		return {"enabled": False}
+	return {"enabled": True, **cache.stats()}
+
+
+@router.get("/chat/sessions/{session_id}")
+def get_session_stats(session_id: str) -> dict:
+	"""Get the history size, token usage and payload sizes of a chat session.
+
+	Args:
+		session_id (str): The ID of the session.
+
+	Returns:
+		dict: The statistics of the session.
+
+	Raises:
+		HTTPException: If the session doesn't exist, with status code 404.
+	"""
+	stats = sessions.stats(session_id)
+	if stats is None:
+		raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+	return stats
+
+
+@router.delete("/chat/sessions/{session_id}")
+def delete_session(session_id: str) -> None:
+	"""Forget the history of a chat session.
+
+	Args:
+		session_id (str): The ID of the session.
+	"""
+	sessions.delete(session_id)
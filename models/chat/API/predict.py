@@ -1,39 +1,182 @@
-"""Module to interact with the Claude model using the anthropic API."""
+"""Module to generate the chat responses, with the Claude model by default."""
 
-from os import environ
+from collections.abc import AsyncIterator, Iterator
 
-import anthropic
+from .backends import load_backend
+from .resilience import make_resilient
 
-ANTHROPIC_API_KEY = environ["ANTHROPIC_API_KEY"]
-
-client = anthropic.Anthropic(
-	api_key=ANTHROPIC_API_KEY,
-)
+backend = make_resilient(load_backend())
 
 DEFAUTL_PROMPT = "انا كندوي بالدارجة و بغيت تبقى تجاوبني بها و بغيتك تبقى تجاوبني بلا حروف لاتينية و بلا ارقام"  # noqa: E501
 
+MAX_TOKENS = 512
+
 
-def predict(messages: list, prompt: str | None = None) -> str:
-	"""Respond to messages using the Claude model.
+def build_system(prompt: str | list[dict] | None) -> list[dict]:
+	"""Build the system prompt, marking the fixed prompt as cacheable.
 
 	Args:
-		messages (list): A list of message dictionaries.
-		prompt (str, optional): The prompt to use for the Claude model.
+		prompt (str | list[dict], optional): The prompt, or its content blocks.
 
 	Returns:
-		str: The response text from the Claude model.
+		list[dict]: The content blocks of the system prompt.
 	"""
 	if prompt is None:
 		prompt = DEFAUTL_PROMPT
-	message = client.messages.create(
-		model="claude-3-5-haiku-20241022",
-		max_tokens=512,
-		system=prompt,
-		messages=messages,
-	)
-	text = message.content[0].text
+	if isinstance(prompt, str):
+		prompt = [
+			{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}},
+		]
+	return prompt
+
+
+def clean_text(text: str) -> str:
+	"""Remove the redundant new lines and quotes of a response.
+
+	Args:
+		text (str): The response text of the chat model.
+
+	Returns:
+		str: The cleaned text.
+	"""
 	# replace duplicate "\n" with single "\n"
 	text = "\n".join(line for line in text.split("\n") if line.strip())
 	# replace duplicate '"' with single '"'
-	text = '"'.join(line for line in text.split('"') if line.strip())
-	return text  # noqa: RET504
+	return '"'.join(line for line in text.split('"') if line.strip())
+
+
+class _SegmentFilter:
+	"""Drop the blank segments between the separators of a streamed text.
+
+	Feeding a text by pieces gives the same output as
+	`sep.join(segment for segment in text.split(sep) if segment.strip())`.
+	"""
+
+	def __init__(self, sep: str) -> None:
+		self.sep = sep
+		self._pending = ""  # the current segment, while it is still blank
+		self._blank = True  # whether the current segment is blank so far
+		self._emitted = False  # whether a segment was already emitted
+
+	def feed(self, text: str) -> str:
+		"""Filter the next piece of the text.
+
+		Args:
+			text (str): The next piece of the text.
+
+		Returns:
+			str: The part of the filtered text that can be emitted.
+		"""
+		out = []
+		for char in text:
+			if char == self.sep:
+				self._pending = ""
+				self._blank = True
+			elif not self._blank:
+				out.append(char)
+			else:
+				self._pending += char
+				if not char.isspace():
+					# the segment isn't blank, emit it with its separator
+					out.append((self.sep if self._emitted else "") + self._pending)
+					self._pending = ""
+					self._blank = False
+					self._emitted = True
+		return "".join(out)
+
+
+class StreamCleaner:
+	"""Apply the cleanup of `clean_text` incrementally to a streamed response."""
+
+	def __init__(self) -> None:  # noqa: D107
+		self._lines = _SegmentFilter("\n")
+		self._quotes = _SegmentFilter('"')
+
+	def feed(self, delta: str) -> str:
+		"""Clean the next text delta of a response.
+
+		Args:
+			delta (str): The next text delta.
+
+		Returns:
+			str: The cleaned text that can be emitted, possibly empty.
+		"""
+		return self._quotes.feed(self._lines.feed(delta))
+
+
+def predict(
+	messages: list,
+	prompt: str | list[dict] | None = None,
+	usage: dict | None = None,
+) -> str:
+	"""Respond to messages using the chat model.
+
+	Args:
+		messages (list): A list of message dictionaries.
+		prompt (str | list[dict], optional): The prompt to use for the chat model.
+		usage (dict, optional): If given, it's updated with the token usage.
+
+	Returns:
+		str: The response text from the chat model.
+	"""
+	text = backend.complete(messages, build_system(prompt), MAX_TOKENS, usage)
+	return clean_text(text)
+
+
+def stream_predict(
+	messages: list,
+	prompt: str | list[dict] | None = None,
+	usage: dict | None = None,
+) -> Iterator[str]:
+	"""Respond to messages using the chat model, yielding the text as it comes.
+
+	Args:
+		messages (list): A list of message dictionaries.
+		prompt (str | list[dict], optional): The prompt to use for the chat model.
+		usage (dict, optional): If given, it's updated with the token usage.
+
+	Yields:
+		str: The raw text deltas of the response.
+	"""
+	yield from backend.stream(messages, build_system(prompt), MAX_TOKENS, usage)
+
+
+async def apredict(
+	messages: list,
+	prompt: str | list[dict] | None = None,
+	usage: dict | None = None,
+) -> str:
+	"""Respond to messages using the chat model, without blocking a thread.
+
+	Args:
+		messages (list): A list of message dictionaries.
+		prompt (str | list[dict], optional): The prompt to use for the chat model.
+		usage (dict, optional): If given, it's updated with the token usage.
+
+	Returns:
+		str: The response text from the chat model.
+	"""
+	text = await backend.acomplete(messages, build_system(prompt), MAX_TOKENS, usage)
+	return clean_text(text)
+
+
+async def astream_predict(
+	messages: list,
+	prompt: str | list[dict] | None = None,
+	usage: dict | None = None,
+) -> AsyncIterator[str]:
+	"""Respond to messages using the chat model, yielding the cleaned text deltas.
+
+	Args:
+		messages (list): A list of message dictionaries.
+		prompt (str | list[dict], optional): The prompt to use for the chat model.
+		usage (dict, optional): If given, it's updated with the token usage.
+
+	Yields:
+		str: The cleaned text deltas of the response.
+	"""
+	cleaner = StreamCleaner()
+	system = build_system(prompt)
+	async for delta in backend.astream(messages, system, MAX_TOKENS, usage):
+		if text := cleaner.feed(delta):
+			yield text
@@ -0,0 +1,274 @@
+"""Deadlines, retries and hedging of the calls to the chat backend.
+
+The latency of the chat model has a long tail, so each call is bounded by a
+deadline, and retried with a jittered exponential backoff on retryable errors.
+Optionally, a call is hedged, see `hedging.Hedger`.
+
+For streamed responses, the deadline and the hedging apply to the first text
+delta, and a call is only retried before any delta is yielded.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from os import environ
+from typing import Any
+
+import anthropic
+from lgg import logger
+
+from .backends import DEADLINE, ChatBackend
+from .hedging import Hedger
+
+MAX_RETRIES = int(environ.get("CHAT_MAX_RETRIES", "2"))
+# Base delay of the exponential backoff between retries, in seconds
+RETRY_BACKOFF = float(environ.get("CHAT_RETRY_BACKOFF_S", "0.25"))
+MAX_RETRY_BACKOFF = 4.0
+# Latency percentile after which a call is hedged, 0 to disable hedging
+HEDGE_PERCENTILE = float(environ.get("CHAT_HEDGE_PERCENTILE", "0"))
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and overloads
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+_END = object()  # marks an empty stream
+
+
+def is_retryable(error: BaseException) -> bool:
+	"""Check whether a failed call to the chat backend is worth retrying.
+
+	Args:
+		error (BaseException): The error raised by the call.
+
+	Returns:
+		bool: Whether the error is a timeout, a connection error or a transient
+		HTTP status.
+	"""
+	if isinstance(error, TimeoutError | asyncio.TimeoutError):
+		return True
+	if isinstance(error, anthropic.APIConnectionError):
+		return True
+	if isinstance(error, anthropic.APIStatusError):
+		return error.status_code in RETRYABLE_STATUSES
+	return False
+
+
+class ResilientBackend(ChatBackend):
+	"""Wrap a chat backend with deadlines, retries and hedging."""
+
+	def __init__(
+		self,
+		backend: ChatBackend,
+		deadline: float,
+		max_retries: int,
+		backoff: float,
+		hedge_percentile: float,
+	) -> None:
+		"""Initialize the wrapper.
+
+		Args:
+			backend (ChatBackend): The backend to call.
+			deadline (float): The maximum seconds of a call, or before the first
+				delta of a streamed call.
+			max_retries (int): The maximum number of retries of a call.
+			backoff (float): The base delay between retries, in seconds.
+			hedge_percentile (float): The latency percentile after which a call is
+				hedged, 0 to disable hedging.
+		"""
+		self.backend = backend
+		self.deadline = deadline
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.hedger = Hedger(deadline, hedge_percentile)
+		self._lock = threading.Lock()
+		self._stats = {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0}
+
+	def _count(self, key: str) -> None:
+		with self._lock:
+			self._stats[key] += 1
+
+	def _backoff(self, retry: int) -> float:
+		"""Get the delay before a retry, with full jitter."""
+		return random.uniform(  # noqa: S311
+			0,
+			min(MAX_RETRY_BACKOFF, self.backoff * 2 ** (retry - 1)),
+		)
+
+	def _failed(self, error: Exception, retry: int) -> bool:
+		"""Record a failed call, and check whether it should be retried."""
+		if isinstance(error, TimeoutError | asyncio.TimeoutError):
+			self._count("timeouts")
+		if retry >= self.max_retries or not is_retryable(error):
+			self._count("failures")
+			return False
+		logger.warning(f"Chat call failed, retrying: {error!r}")
+		self._count("retries")
+		return True
+
+	def stats(self) -> dict:
+		"""Get the call counts and the recent latency percentiles.
+
+		Returns:
+			dict: The numbers of calls, retries, timeouts and failures, with the
+			statistics of the hedging, see `Hedger.stats`, and the deadline.
+		"""
+		with self._lock:
+			stats = dict(self._stats)
+		stats.update(self.hedger.stats())
+		stats["deadline_s"] = self.deadline
+		return stats
+
+	# synchronous calls
+
+	def _call(
+		self,
+		kind: str,
+		call: Callable[[dict], Any],
+		discard: Callable[[Any], None] | None = None,
+	) -> tuple[Any, dict]:
+		"""Run a hedged call, retrying it on retryable errors."""
+		self._count("calls")
+		retry = 0
+		while True:
+			try:
+				return self.hedger.run(kind, call, discard)
+			except Exception as e:  # noqa: PERF203
+				retry += 1
+				if not self._failed(e, retry - 1):
+					raise
+				time.sleep(self._backoff(retry))
+
+	def complete(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		text, attempt_usage = self._call(
+			"complete",
+			lambda u: self.backend.complete(messages, system, max_tokens, u),
+		)
+		if usage is not None:
+			usage.update(attempt_usage)
+		return text
+
+	def stream(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> Iterator[str]:
+		def first_delta(attempt_usage: dict) -> tuple[Iterator[str], str]:
+			deltas = self.backend.stream(messages, system, max_tokens, attempt_usage)
+			return deltas, next(deltas, _END)
+
+		(deltas, first), attempt_usage = self._call(
+			"stream",
+			first_delta,
+			discard=lambda result: result[0].close(),
+		)
+		try:
+			if first is not _END:
+				yield first
+			# the stalls between the following deltas are bounded by the client
+			yield from deltas
+		finally:
+			deltas.close()
+		if usage is not None:
+			usage.update(attempt_usage)
+
+	# asynchronous calls
+
+	async def _acall(
+		self,
+		kind: str,
+		call: Callable[[dict], Awaitable],
+		discard: Callable[[Any], Awaitable] | None = None,
+	) -> tuple[Any, dict]:
+		"""Run a hedged call, retrying it on retryable errors."""
+		self._count("calls")
+		retry = 0
+		while True:
+			try:
+				return await self.hedger.arun(kind, call, discard)
+			except Exception as e:  # noqa: PERF203
+				retry += 1
+				if not self._failed(e, retry - 1):
+					raise
+				await asyncio.sleep(self._backoff(retry))
+
+	async def acomplete(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> str:
+		text, attempt_usage = await self._acall(
+			"complete",
+			lambda u: self.backend.acomplete(messages, system, max_tokens, u),
+		)
+		if usage is not None:
+			usage.update(attempt_usage)
+		return text
+
+	async def astream(  # noqa: D102
+		self,
+		messages: list[dict],
+		system: list[dict],
+		max_tokens: int,
+		usage: dict | None = None,
+	) -> AsyncIterator[str]:
+		async def first_delta(attempt_usage: dict) -> tuple[AsyncIterator[str], str]:
+			deltas = self.backend.astream(messages, system, max_tokens, attempt_usage)
+			try:
+				return deltas, await deltas.__anext__()
+			except StopAsyncIteration:
+				return deltas, _END
+
+		async def discard(result: tuple[AsyncIterator[str], str]) -> None:
+			await result[0].aclose()
+
+		(deltas, first), attempt_usage = await self._acall(
+			"stream",
+			first_delta,
+			discard,
+		)
+		try:
+			if first is not _END:
+				yield first
+			while True:
+				try:
+					delta = await asyncio.wait_for(deltas.__anext__(), self.deadline)
+				except StopAsyncIteration:
+					break
+				yield delta
+		finally:
+			await deltas.aclose()
+		if usage is not None:
+			usage.update(attempt_usage)
+
+
+def make_resilient(backend: ChatBackend) -> ResilientBackend:
+	"""Wrap a chat backend with the policy set by the environment variables.
+
+	Args:
+		backend (ChatBackend): The backend to wrap.
+
+	Returns:
+		ResilientBackend: The wrapped backend.
+	"""
+	logger.info(
+		f"Chat calls have a {DEADLINE} s deadline and up to {MAX_RETRIES} retries"
+		+ (f", hedged at p{HEDGE_PERCENTILE:g}" if HEDGE_PERCENTILE else ""),
+	)
+	return ResilientBackend(
+		backend,
+		deadline=DEADLINE,
+		max_retries=MAX_RETRIES,
+		backoff=RETRY_BACKOFF,
+		hedge_percentile=HEDGE_PERCENTILE,
+	)
@@ -0,0 +1,296 @@
+"""Server-side storage of the chat histories.
+
+Clients only send the new turn of a conversation, the history is kept here. Once
+the history, with its summary, grows beyond a token budget, its oldest turns are
+trimmed, and optionally summarized into the system prompt. The summaries of a
+session are made one at a time, in the background, and its trimmed turns are
+still sent until they are summarized.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from os import environ
+
+from lgg import logger
+
+from .backends import USAGE_KEYS
+from .predict import build_system, predict
+
+MAX_SESSIONS = int(environ.get("CHAT_MAX_SESSIONS", "1000"))
+# Maximum number of tokens of the history sent with each request
+TOKEN_BUDGET = int(environ.get("CHAT_SESSION_TOKEN_BUDGET", "2000"))
+# Whether the trimmed turns are summarized instead of simply dropped
+SUMMARIZE = environ.get("CHAT_SESSION_SUMMARIZE", "0") == "1"
+
+SUMMARY_PROMPT = "لخص هاد الهضرة فجمل قصيرة بالدارجة، و خلي غير المعلومات المهمة"
+SUMMARY_HEADER = "هادا ملخص ديال الهضرة اللي فاتت:"
+
+# Initial guess of the number of tokens per character, refined with the usage
+TOKENS_PER_CHAR = 0.5
+
+
+@dataclass
+class Session:
+	"""The history and usage statistics of a chat session."""
+
+	messages: list[dict] = field(default_factory=list)
+	summary: str | None = None
+	# the trimmed messages not summarized yet, and whether they are summarized
+	pending: list[dict] = field(default_factory=list)
+	summarizing: bool = False
+	tokens_per_char: float = TOKENS_PER_CHAR
+	trimmed_messages: int = 0
+	requests: int = 0
+	client_bytes: int = 0
+	upstream_bytes: int = 0
+	usage: dict[str, int] = field(default_factory=lambda: dict.fromkeys(USAGE_KEYS, 0))
+
+	def estimate_tokens(self) -> int:
+		"""Estimate the number of tokens of the history and its summary."""
+		chars = sum(len(message["content"]) for message in self.messages)
+		if self.summary is not None:
+			chars += len(self.summary)
+		return int(chars * self.tokens_per_char)
+
+	def stats(self) -> dict:
+		"""Get the statistics of the session."""
+		return {
+			"messages": len(self.messages),
+			"history_tokens": self.estimate_tokens(),
+			"trimmed_messages": self.trimmed_messages,
+			"summarized": self.summary is not None,
+			"requests": self.requests,
+			"client_bytes": self.client_bytes,
+			"upstream_bytes": self.upstream_bytes,
+			"usage": dict(self.usage),
+		}
+
+
+@dataclass
+class ChatTurn:
+	"""A turn of a session, ie. the request sent to the chat model."""
+
+	session_id: str
+	new_messages: list[dict]
+	messages: list[dict]
+	system: list[dict]
+
+
+def _chars(messages: list[dict], system: list[dict]) -> int:
+	"""Count the characters of the text sent to the chat model."""
+	chars = sum(len(block["text"]) for block in system)
+	for message in messages:
+		content = message["content"]
+		if isinstance(content, str):
+			chars += len(content)
+		else:
+			chars += sum(len(block["text"]) for block in content)
+	return chars
+
+
+def summarize(summary: str | None, messages: list[dict]) -> str:
+	"""Summarize the messages of a conversation.
+
+	Args:
+		summary (str, optional): The summary of the preceding messages.
+		messages (list[dict]): The messages to summarize.
+
+	Returns:
+		str: The summary of the whole conversation.
+	"""
+	dialog = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+	if summary is not None:
+		dialog = f"{summary}\n{dialog}"
+	return predict([{"role": "user", "content": dialog}], SUMMARY_PROMPT)
+
+
+class SessionStore:
+	"""An in-memory store of chat sessions keyed by session ID.
+
+	The least recently used sessions are dropped once `max_sessions` is reached.
+	"""
+
+	def __init__(
+		self,
+		max_sessions: int,
+		token_budget: int,
+		*,
+		summarize: bool = False,
+	) -> None:
+		"""Initialize an empty store.
+
+		Args:
+			max_sessions (int): The maximum number of sessions kept in memory.
+			token_budget (int): The maximum number of tokens of a session's history.
+			summarize (bool): Whether to summarize the trimmed turns.
+		"""
+		self.max_sessions = max_sessions
+		self.token_budget = token_budget
+		self.summarize = summarize
+		self._lock = threading.Lock()
+		self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+	def _get(self, session_id: str) -> Session:
+		"""Get a session, creating it if needed. Must be called with the lock held."""
+		if session_id not in self._sessions:
+			self._sessions[session_id] = Session()
+			while len(self._sessions) > self.max_sessions:
+				self._sessions.popitem(last=False)
+		self._sessions.move_to_end(session_id)
+		return self._sessions[session_id]
+
+	def start_turn(
+		self,
+		session_id: str,
+		new_messages: list[dict],
+		prompt: str | None = None,
+	) -> ChatTurn:
+		"""Build the request of a new turn from the history of the session.
+
+		The fixed system prompt and the history are marked as cacheable, so the
+		chat model only processes the new turn in full.
+
+		Args:
+			session_id (str): The ID of the session.
+			new_messages (list[dict]): The new messages sent by the client.
+			prompt (str, optional): The system prompt of the chat model.
+
+		Returns:
+			ChatTurn: The turn, with the messages and system prompt to send.
+		"""
+		with self._lock:
+			session = self._get(session_id)
+			session.client_bytes += len(json.dumps(new_messages).encode())
+			# the trimmed messages are sent until they are summarized
+			history = [dict(m) for m in [*session.pending, *session.messages]]
+			summary = session.summary
+		if history:
+			# cache the whole history, it is the prefix of every following request
+			last = history[-1]
+			last["content"] = [
+				{
+					"type": "text",
+					"text": last["content"],
+					"cache_control": {"type": "ephemeral"},
+				},
+			]
+		system = build_system(prompt)
+		if summary is not None:
+			system = [*system, {"type": "text", "text": f"{SUMMARY_HEADER}\n{summary}"}]
+		return ChatTurn(session_id, new_messages, [*history, *new_messages], system)
+
+	def end_turn(self, turn: ChatTurn, reply: str, usage: dict) -> None:
+		"""Record a turn in the history of its session, then trim the history.
+
+		Args:
+			turn (ChatTurn): The turn started with `start_turn`.
+			reply (str): The reply of the chat model.
+			usage (dict): The token usage of the turn.
+		"""
+		payload = {"system": turn.system, "messages": turn.messages}
+		with self._lock:
+			session = self._get(turn.session_id)
+			session.messages.extend(
+				[*turn.new_messages, {"role": "assistant", "content": reply}],
+			)
+			session.requests += 1
+			session.upstream_bytes += len(json.dumps(payload).encode())
+			for key in USAGE_KEYS:
+				session.usage[key] += usage.get(key, 0)
+			input_tokens = sum(
+				usage.get(key, 0)
+				for key in (
+					"input_tokens",
+					"cache_creation_input_tokens",
+					"cache_read_input_tokens",
+				)
+			)
+			if input_tokens:
+				session.tokens_per_char = input_tokens / max(
+					_chars(turn.messages, turn.system),
+					1,
+				)
+			trimmed = self._trim(session)
+			if not trimmed or not self.summarize:
+				return
+			session.pending.extend(trimmed)
+			if session.summarizing:
+				# the running summary picks them up once it is done
+				return
+			session.summarizing = True
+		# summarize in the background, so the client doesn't wait for it
+		threading.Thread(
+			target=self._summarize,
+			args=(turn.session_id, session),
+			daemon=True,
+		).start()
+
+	def _trim(self, session: Session) -> list[dict]:
+		"""Drop the oldest turns of a session until it fits in the token budget.
+
+		The summary counts towards the budget. The last turn is always kept, and the
+		history always starts with a user message. Must be called with the lock
+		held.
+
+		Returns:
+			list[dict]: The dropped messages.
+		"""
+		trimmed = []
+		while session.estimate_tokens() > self.token_budget and (
+			len(session.messages) > 2  # noqa: PLR2004
+		):
+			trimmed.append(session.messages.pop(0))
+			while session.messages and session.messages[0]["role"] != "user":
+				trimmed.append(session.messages.pop(0))
+		session.trimmed_messages += len(trimmed)
+		return trimmed
+
+	def _summarize(self, session_id: str, session: Session) -> None:
+		"""Merge the pending messages of a session into its summary, until none is.
+
+		Only one summary of a session runs at a time, so each one starts from the
+		summary of the previous one.
+		"""
+		while True:
+			with self._lock:
+				messages = list(session.pending)
+				summary = session.summary
+				if not messages:
+					session.summarizing = False
+					return
+			try:
+				summary = summarize(summary, messages)
+			except Exception as e:  # noqa: BLE001
+				logger.warning(f"Failed to summarize the session {session_id}: {e}")
+			with self._lock:
+				# on a failure, the summary is kept and the messages are dropped
+				session.summary = summary
+				del session.pending[: len(messages)]
+
+	def stats(self, session_id: str) -> dict | None:
+		"""Get the statistics of a session.
+
+		Args:
+			session_id (str): The ID of the session.
+
+		Returns:
+			dict | None: The statistics, or None if the session doesn't exist.
+		"""
+		with self._lock:
+			if session_id not in self._sessions:
+				return None
+			return self._sessions[session_id].stats()
+
+	def delete(self, session_id: str) -> None:
+		"""Forget a session.
+
+		Args:
+			session_id (str): The ID of the session.
+		"""
+		with self._lock:
+			self._sessions.pop(session_id, None)
+
+
+sessions = SessionStore(MAX_SESSIONS, TOKEN_BUDGET, summarize=SUMMARIZE)
@@ -0,0 +1,147 @@
+"""Measure the latency and throughput of the chat endpoints under concurrent load.
+
+To benchmark without network access, run it against an API started with the local
+chat backend (`CHAT_BACKEND=local`), or with the mock Anthropic server (see
+`mock-anthropic-server.py`).
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+from lgg import logger
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Measure the latency and throughput of the chat endpoints.",
+)
+parser.add_argument(
+	"--url",
+	type=str,
+	default="http://localhost:8001",
+	help="Base URL of the API",
+)
+parser.add_argument(
+	"--endpoint",
+	type=str,
+	choices=["/chat", "/chat/stream", "/voice-chat"],
+	default="/chat",
+	help="The endpoint to benchmark.",
+)
+parser.add_argument(
+	"--audio",
+	type=str,
+	help="The audio file sent to /voice-chat.",
+)
+parser.add_argument("--requests", type=int, default=100, help="Number of requests")
+parser.add_argument(
+	"--concurrency",
+	type=int,
+	default=10,
+	help="Number of requests sent concurrently",
+)
+parser.add_argument(
+	"--message",
+	type=str,
+	default="السلام عليكم، كي داير؟",
+	help="The user message sent in each request",
+)
+args = parser.parse_args()
+if args.endpoint == "/voice-chat" and args.audio is None:
+	parser.error("--audio is required to benchmark /voice-chat")
+
+
+async def _request(client: httpx.AsyncClient, semaphore: asyncio.Semaphore) -> dict:
+	"""Send one chat request and time it.
+
+	Returns:
+		dict: The total latency and the time to the first output (text, or audio
+		for /voice-chat), in seconds.
+	"""
+	payload = {"messages": [{"role": "user", "content": args.message}]}
+	async with semaphore:
+		start = time.perf_counter()
+		if args.endpoint == "/chat":
+			response = await client.post("/chat", json=payload)
+			response.raise_for_status()
+			latency = time.perf_counter() - start
+			return {"latency": latency, "first_output": latency}
+		if args.endpoint == "/chat/stream":
+			request = client.build_request("POST", "/chat/stream", json=payload)
+			first_marker, error_marker = "data:", "event: error"
+		else:
+			request = client.build_request(
+				"POST",
+				"/voice-chat",
+				files={"audio": audio},
+				data={"session_id": uuid.uuid4().hex},
+			)
+			first_marker, error_marker = '{"event": "audio"', '{"event": "error"'
+		first_output = None
+		response = await client.send(request, stream=True)
+		try:
+			response.raise_for_status()
+			async for line in response.aiter_lines():
+				if line.startswith(first_marker) and first_output is None:
+					first_output = time.perf_counter() - start
+				elif line.startswith(error_marker):
+					msg = f"The stream ended with an error: {line}"
+					raise RuntimeError(msg)
+		finally:
+			await response.aclose()
+		return {"latency": time.perf_counter() - start, "first_output": first_output}
+
+
+audio = Path(args.audio).read_bytes() if args.audio else None
+
+
+def _percentile(values: list[float], q: float) -> float:
+	values = sorted(values)
+	return values[min(int(q / 100 * len(values)), len(values) - 1)]
+
+
+async def main() -> None:  # noqa: D103
+	semaphore = asyncio.Semaphore(args.concurrency)
+	limits = httpx.Limits(max_connections=args.concurrency)
+	async with httpx.AsyncClient(
+		base_url=args.url,
+		limits=limits,
+		timeout=120,
+	) as client:
+		start = time.perf_counter()
+		results = await asyncio.gather(
+			*(_request(client, semaphore) for _ in range(args.requests)),
+			return_exceptions=True,
+		)
+		duration = time.perf_counter() - start
+		stats = (await client.get("/chat/stats")).json()
+	errors = [res for res in results if isinstance(res, BaseException)]
+	results = [res for res in results if not isinstance(res, BaseException)]
+	if errors:
+		logger.warning(f"{len(errors)} requests failed, eg. {errors[0]!r}")
+	if not results:
+		return
+	latencies = [res["latency"] for res in results]
+	first_outputs = [res["first_output"] for res in results if res["first_output"]]
+	logger.info(f"Endpoint: {args.endpoint}")
+	logger.info(f"Requests: {len(results)} ok, {len(errors)} failed")
+	logger.info(f"Throughput: {len(results) / duration:.2f} requests/s")
+	for q in (50, 95, 99):
+		logger.info(f"Latency p{q}: {_percentile(latencies, q) * 1000:.0f} ms")
+	if first_outputs:
+		mean_first_output = statistics.mean(first_outputs) * 1000
+		logger.info(f"Mean time to first output: {mean_first_output:.0f} ms")
+	logger.info(
+		f"Chat calls: {stats['calls']}, retries: {stats['retries']}, "
+		f"timeouts: {stats['timeouts']}, hedges: {stats['hedges']} "
+		f"({stats['hedge_wins']} answered first)",
+	)
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
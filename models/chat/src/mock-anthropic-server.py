@@ -0,0 +1,161 @@
+"""A mock of the Anthropic Messages API, to test the chat latency and load offline.
+
+It answers every request with the same Darija text, after a configurable latency
+and at a configurable tokens-per-second rate, streamed or not. A fraction of the
+requests can be made slow or fail with an overloaded error, to test the deadlines,
+retries and hedging of the chat calls.
+
+Point the chat API to it with:
+	export ANTHROPIC_BASE_URL=http://localhost:8010 ANTHROPIC_API_KEY=mock
+	bash API/start_api.sh
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from collections.abc import AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+parser = argparse.ArgumentParser(description="Run a mock of the Anthropic API.")
+parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind")
+parser.add_argument("--port", type=int, default=8010, help="Port to bind")
+parser.add_argument(
+	"--latency",
+	type=float,
+	default=0.4,
+	help="Seconds before the first token is generated.",
+)
+parser.add_argument(
+	"--tokens-per-second",
+	type=float,
+	default=80,
+	help="Rate at which the tokens are generated.",
+)
+parser.add_argument(
+	"--slow-fraction",
+	type=float,
+	default=0,
+	help="Fraction of the requests answered after --slow-latency instead.",
+)
+parser.add_argument(
+	"--slow-latency",
+	type=float,
+	default=5,
+	help="Seconds before the first token is generated, for slow requests.",
+)
+parser.add_argument(
+	"--error-rate",
+	type=float,
+	default=0,
+	help="Fraction of the requests failing with an overloaded (529) error.",
+)
+parser.add_argument(
+	"--text",
+	type=str,
+	default="السلام عليكم، لاباس عليك؟ انا هنا باش نعاونك. شنو بغيتي تعرف اليوم؟",
+	help="The text of every response. Each word is streamed as one token.",
+)
+args = parser.parse_args()
+
+app = FastAPI()
+
+# each word, with the space preceding it, is a token
+tokens = [word if i == 0 else f" {word}" for i, word in enumerate(args.text.split())]
+
+
+def _usage(body: dict) -> dict:
+	"""Estimate the token usage of a request, at ~4 characters per token."""
+	input_tokens = len(json.dumps(body, ensure_ascii=False)) // 4
+	return {"input_tokens": input_tokens, "output_tokens": len(tokens)}
+
+
+def _sse(event: str, data: dict) -> str:
+	return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _latency() -> float:
+	"""Draw the latency of a request, slow or not."""
+	slow = random.random() < args.slow_fraction  # noqa: S311
+	return args.slow_latency if slow else args.latency
+
+
+async def _stream(message: dict, latency: float) -> AsyncIterator[str]:
+	"""Stream a message the way the Anthropic API does."""
+	usage = message.pop("usage")
+	yield _sse(
+		"message_start",
+		{
+			"type": "message_start",
+			"message": {
+				**message,
+				"content": [],
+				"usage": {**usage, "output_tokens": 1},
+			},
+		},
+	)
+	yield _sse(
+		"content_block_start",
+		{
+			"type": "content_block_start",
+			"index": 0,
+			"content_block": {"type": "text", "text": ""},
+		},
+	)
+	await asyncio.sleep(latency)
+	for token in tokens:
+		yield _sse(
+			"content_block_delta",
+			{
+				"type": "content_block_delta",
+				"index": 0,
+				"delta": {"type": "text_delta", "text": token},
+			},
+		)
+		await asyncio.sleep(1 / args.tokens_per_second)
+	yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+	yield _sse(
+		"message_delta",
+		{
+			"type": "message_delta",
+			"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+			"usage": {"output_tokens": usage["output_tokens"]},
+		},
+	)
+	yield _sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages", response_model=None)
+async def create_message(request: Request) -> JSONResponse | StreamingResponse:
+	"""Mock the creation of a message, streamed or not."""
+	body = await request.json()
+	if random.random() < args.error_rate:  # noqa: S311
+		error = {"type": "overloaded_error", "message": "Overloaded"}
+		return JSONResponse({"type": "error", "error": error}, status_code=529)
+	latency = _latency()
+	message = {
+		"id": f"msg_{uuid.uuid4().hex}",
+		"type": "message",
+		"role": "assistant",
+		"model": body.get("model", "mock"),
+		"content": [{"type": "text", "text": "".join(tokens)}],
+		"stop_reason": "end_turn",
+		"stop_sequence": None,
+		"usage": _usage(body),
+	}
+	if body.get("stream", False):
+		message["stop_reason"] = None
+		return StreamingResponse(
+			_stream(message, latency),
+			media_type="text/event-stream",
+		)
+	await asyncio.sleep(latency + len(tokens) / args.tokens_per_second)
+	return JSONResponse(message)
+
+
+if __name__ == "__main__":
+	uvicorn.run(app, host=args.host, port=args.port)
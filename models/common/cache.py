@@ -0,0 +1,170 @@
+"""A two-tier, size-capped LRU cache, shared by the caches of the models.
+
+Values are kept in memory, and optionally on disk, one file per key, so they
+survive restarts. Each tier evicts its least recently used entries beyond its
+size cap. The subclasses choose how a value is sized, written and read.
+"""
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from lgg import logger
+
+
+class TieredCache:
+	"""A two-tier, size-capped cache of values keyed on hexadecimal digests.
+
+	Attributes:
+		suffix (str): The extension of the files of the values on disk.
+		read_errors (tuple): The errors raised reading a corrupt file.
+	"""
+
+	suffix = ".bin"
+	read_errors: tuple[type[Exception], ...] = (OSError,)
+
+	def __init__(
+		self,
+		memory_max_bytes: int,
+		disk_dir: Path | None,
+		disk_max_bytes: int,
+	) -> None:
+		"""Initialize the cache and index the values left on disk.
+
+		Args:
+			memory_max_bytes (int): The maximum size of the values in memory.
+			disk_dir (Path, optional): The directory of the values on disk, or None
+				to keep them in memory only.
+			disk_max_bytes (int): The maximum size of the values on disk.
+		"""
+		self.memory_max_bytes = memory_max_bytes
+		self.disk_dir = disk_dir
+		self.disk_max_bytes = disk_max_bytes
+		self._lock = threading.Lock()
+		self._memory: OrderedDict[str, Any] = OrderedDict()
+		self._memory_bytes = 0
+		self._disk: OrderedDict[str, int] = OrderedDict()  # key -> size in bytes
+		self._disk_bytes = 0
+		self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+		if disk_dir is not None:
+			disk_dir.mkdir(parents=True, exist_ok=True)
+			files = disk_dir.glob(f"*{self.suffix}")
+			for file in sorted(files, key=lambda p: p.stat().st_mtime):
+				self._disk[file.stem] = file.stat().st_size
+				self._disk_bytes += self._disk[file.stem]
+			self._evict_disk()
+
+	def size(self, value: Any) -> int:  # noqa: ANN401
+		"""Get the size of a value in memory, in bytes."""
+		raise NotImplementedError
+
+	def write(self, path: Path, value: Any) -> None:  # noqa: ANN401
+		"""Write a value to a file."""
+		raise NotImplementedError
+
+	def read(self, path: Path) -> Any:  # noqa: ANN401
+		"""Read a value from a file."""
+		raise NotImplementedError
+
+	def _path(self, key: str) -> Path:
+		"""Get the file of a value on disk."""
+		return self.disk_dir / f"{key}{self.suffix}"
+
+	def get(self, key: str) -> Any | None:  # noqa: ANN401
+		"""Get a cached value, and mark it as recently used.
+
+		Args:
+			key (str): The key of the value.
+
+		Returns:
+			Any | None: The value, or None if it isn't cached.
+		"""
+		with self._lock:
+			if key in self._memory:
+				self._memory.move_to_end(key)
+				self._stats["memory_hits"] += 1
+				return self._memory[key]
+			if key not in self._disk:
+				self._stats["misses"] += 1
+				return None
+			self._disk.move_to_end(key)
+		path = self._path(key)
+		try:
+			value = self.read(path)
+			path.touch()  # keep the order of use across restarts
+		except self.read_errors:
+			with self._lock:
+				self._stats["misses"] += 1
+			return None
+		with self._lock:
+			self._stats["disk_hits"] += 1
+			self._put_memory(key, value)
+		return value
+
+	def put(self, key: str, value: Any) -> None:  # noqa: ANN401
+		"""Cache a value in both tiers.
+
+		Args:
+			key (str): The key of the value.
+			value (Any): The value.
+		"""
+		with self._lock:
+			self._put_memory(key, value)
+			if self.disk_dir is None or key in self._disk:
+				return
+		path = self._path(key)
+		# unique per thread, so concurrent writes of the same key don't mix
+		tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+		try:
+			self.write(tmp_path, value)
+			size = tmp_path.stat().st_size
+			tmp_path.replace(path)  # atomic, readers never see a partial file
+		except OSError as e:
+			logger.warning(f"Failed to cache a value on disk: {e}")
+			tmp_path.unlink(missing_ok=True)
+			return
+		with self._lock:
+			# the key may have been written concurrently, it is only counted once
+			self._disk_bytes += size - self._disk.get(key, 0)
+			self._disk[key] = size
+			self._disk.move_to_end(key)
+			self._evict_disk()
+
+	def _put_memory(self, key: str, value: Any) -> None:  # noqa: ANN401
+		"""Cache a value in memory. Must be called with the lock held."""
+		if key in self._memory:
+			self._memory.move_to_end(key)
+			return
+		self._memory[key] = value
+		self._memory_bytes += self.size(value)
+		while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+			_, evicted = self._memory.popitem(last=False)
+			self._memory_bytes -= self.size(evicted)
+			self._stats["evictions"] += 1
+
+	def _evict_disk(self) -> None:
+		"""Remove the least recently used files. Must be called with the lock held."""
+		while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+			key, size = self._disk.popitem(last=False)
+			self._disk_bytes -= size
+			self._stats["evictions"] += 1
+			self._path(key).unlink(missing_ok=True)
+
+	def stats(self) -> dict:
+		"""Get the hit rate and the size of the cache.
+
+		Returns:
+			dict: The hits of each tier, the misses, the evictions, the hit rate,
+			and the number and size of the values in each tier.
+		"""
+		with self._lock:
+			stats = dict(self._stats)
+			stats["memory_entries"] = len(self._memory)
+			stats["memory_bytes"] = self._memory_bytes
+			stats["disk_entries"] = len(self._disk)
+			stats["disk_bytes"] = self._disk_bytes
+		lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+		hits = stats["memory_hits"] + stats["disk_hits"]
+		stats["hit_rate"] = hits / lookups if lookups else 0.0
+		return stats
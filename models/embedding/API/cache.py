@@ -0,0 +1,114 @@
+"""Cache of the embeddings, text by text.
+
+Clients embed the same captions, intents and FAQ entries over and over, so each
+text is looked up on its own, keyed on its normalized form and the revision of
+the model, and only the texts missed are encoded. The embeddings are kept in
+memory and optionally on disk, see `common.cache.TieredCache`.
+"""
+
+import hashlib
+import re
+import unicodedata
+from os import environ
+from pathlib import Path
+
+import numpy as np
+from common.cache import TieredCache
+
+ENABLED = environ.get("EMBEDDING_CACHE_ENABLED", "1") == "1"
+MEMORY_MAX_BYTES = int(environ.get("EMBEDDING_CACHE_MEMORY_MAX_MB", "64")) * 1024 * 1024
+# Where the embeddings are stored on disk, empty to keep them in memory only
+DISK_DIR = environ.get("EMBEDDING_CACHE_DIR", "")
+DISK_MAX_BYTES = int(environ.get("EMBEDDING_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024
+
+
+def normalize(text: str) -> str:
+	"""Normalize the unicode form and the whitespaces of a text."""
+	return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def fingerprint(text: str, revision: str) -> str:
+	"""Compute the cache key of the embedding of a normalized text.
+
+	Args:
+		text (str): The normalized text.
+		revision (str): The name and the revision of the model.
+
+	Returns:
+		str: The hexadecimal SHA-256 digest of the revision and the text.
+	"""
+	return hashlib.sha256(f"{revision}\0{text}".encode()).hexdigest()
+
+
+class EmbeddingCache(TieredCache):
+	"""A two-tier, size-capped cache of embeddings, one `.npy` file each.
+
+	It also counts the requests whose texts were all cached, so the model wasn't
+	called at all.
+	"""
+
+	suffix = ".npy"
+	read_errors = (OSError, ValueError)
+
+	def __init__(
+		self,
+		memory_max_bytes: int,
+		disk_dir: Path | None,
+		disk_max_bytes: int,
+	) -> None:
+		"""Initialize the cache, see `TieredCache`."""
+		super().__init__(memory_max_bytes, disk_dir, disk_max_bytes)
+		self._stats["requests"] = 0
+		self._stats["encode_calls"] = 0
+
+	def size(self, value: np.ndarray) -> int:
+		"""Get the size of an embedding, in bytes."""
+		return value.nbytes
+
+	def write(self, path: Path, value: np.ndarray) -> None:
+		"""Write an embedding to a file."""
+		with path.open("wb") as file:
+			np.save(file, value)
+
+	def read(self, path: Path) -> np.ndarray:
+		"""Read an embedding from a file."""
+		return np.load(path)
+
+	def put(self, key: str, value: np.ndarray) -> None:
+		"""Cache an embedding in both tiers.
+
+		Args:
+			key (str): The key of the embedding, see `fingerprint`.
+			value (np.ndarray): The embedding.
+		"""
+		# a row of a batch keeps the whole batch alive, so it isn't counted right
+		super().put(key, value.copy())
+
+	def record(self, *, encoded: bool) -> None:
+		"""Record a request, and whether the model had to encode some of its texts."""
+		with self._lock:
+			self._stats["requests"] += 1
+			self._stats["encode_calls"] += encoded
+
+	def stats(self) -> dict:
+		"""Get the hit rate and the size of the cache.
+
+		Returns:
+			dict: The statistics of `TieredCache.stats`, with the requests, the
+			calls to the model and the calls saved, ie. the requests whose texts
+			were all cached.
+		"""
+		stats = super().stats()
+		stats["encode_calls_saved"] = stats["requests"] - stats["encode_calls"]
+		return stats
+
+
+def _load_cache() -> EmbeddingCache | None:
+	"""Load the cache, if it is enabled."""
+	if not ENABLED:
+		return None
+	disk_dir = Path(DISK_DIR) if DISK_DIR else None
+	return EmbeddingCache(MEMORY_MAX_BYTES, disk_dir, DISK_MAX_BYTES)
+
+
+cache = _load_cache()
@@ -0,0 +1,272 @@
+"""A named collection of embedded texts, searched by cosine similarity.
+
+The embeddings of a collection are normalized and stored in a contiguous float32
+or float16 array, memory-mapped from disk, so a collection is available again
+right after a restart, without being loaded or embedded again. A search is a
+product of this matrix with the queries, block by block.
+
+For large collections, the search is approximate: the model is trained with a
+Matryoshka loss, so the first `EMBEDDING_INDEX_PREFIX_DIMENSION` dimensions of
+the embeddings, normalized again, are an embedding on their own. They are kept
+in a second, smaller array, searched first for the best candidates, which are
+then ranked again with the full embeddings.
+"""
+
+import json
+import shutil
+import threading
+from os import environ
+from pathlib import Path
+
+import numpy as np
+
+from .compression import truncate
+
+# The type of the stored embeddings of the new collections: float32 or float16
+DTYPE = environ.get("EMBEDDING_INDEX_DTYPE", "float16")
+PREFIX_DIMENSION = int(environ.get("EMBEDDING_INDEX_PREFIX_DIMENSION", "64"))
+# Number of candidates of the approximate search ranked with the full embeddings
+CANDIDATES = int(environ.get("EMBEDDING_INDEX_CANDIDATES", "256"))
+# Number of rows multiplied with the queries at once, to bound the memory used
+BLOCK_ROWS = 65536
+INITIAL_CAPACITY = 1024
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+	"""Normalize embeddings, so their dot product is their cosine similarity."""
+	embeddings = np.asarray(embeddings, dtype=np.float32)
+	norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+	return embeddings / np.maximum(norms, 1e-12)
+
+
+def _top_k(
+	matrix: np.ndarray,
+	queries: np.ndarray,
+	k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+	"""Find the rows of a matrix with the largest dot products with each query.
+
+	Args:
+		matrix (np.ndarray): The rows, eg. a memory-mapped array.
+		queries (np.ndarray): The float32 queries, one per row.
+		k (int): The number of rows found per query.
+
+	Returns:
+		tuple[np.ndarray, np.ndarray]: The indices of the rows found and their
+		scores, from the best, one row per query.
+	"""
+	k = min(k, len(matrix))
+	indices = np.empty((len(queries), 0), dtype=np.int64)
+	scores = np.empty((len(queries), 0), dtype=np.float32)
+	for start in range(0, len(matrix), BLOCK_ROWS):
+		block = np.asarray(matrix[start : start + BLOCK_ROWS], dtype=np.float32)
+		block_scores = queries @ block.T
+		# keep the best k rows of each block, then the best k of all of them
+		best = np.argpartition(-block_scores, min(k, len(block)) - 1, axis=1)[:, :k]
+		indices = np.concatenate([indices, start + best], axis=1)
+		block_scores = np.take_along_axis(block_scores, best, axis=1)
+		scores = np.concatenate([scores, block_scores], axis=1)
+	order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+	indices = np.take_along_axis(indices, order, axis=1)
+	return indices, np.take_along_axis(scores, order, axis=1)
+
+
+class Collection:
+	"""A named collection of texts and their embeddings, stored on disk.
+
+	The directory of a collection holds the embeddings, `vectors.npy`, their
+	prefixes, `prefix.npy`, both with spare rows to add texts to, the texts,
+	`texts.jsonl`, and the number of texts and the settings, `metadata.json`,
+	written last so an interrupted addition is ignored.
+
+	A request may still hold a collection once it is deleted: it is then marked
+	deleted, and adding to it or searching it raises a `LookupError`.
+	"""
+
+	def __init__(self, directory: Path) -> None:
+		"""Open a collection created with `create`.
+
+		Args:
+			directory (Path): The directory of the collection.
+		"""
+		self.directory = directory
+		self.name = directory.name
+		metadata = json.loads((directory / "metadata.json").read_text())
+		self.size = metadata["size"]
+		self.dimension = metadata["dimension"]
+		self.prefix_dimension = metadata["prefix_dimension"]
+		self.dtype = np.dtype(metadata["dtype"])
+		self.revision = metadata["revision"]
+		self._vectors = np.load(directory / "vectors.npy", mmap_mode="r+")
+		self._prefix = np.load(directory / "prefix.npy", mmap_mode="r+")
+		texts_path = directory / "texts.jsonl"
+		lines = texts_path.read_text(encoding="utf-8").splitlines(keepends=True)
+		if len(lines) > self.size:
+			# drop the texts of an interrupted addition
+			lines = lines[: self.size]
+			texts_path.write_text("".join(lines), encoding="utf-8")
+		self._texts = [json.loads(line) for line in lines]
+		self._lock = threading.Lock()
+		self.deleted = False
+
+	@classmethod
+	def create(
+		cls,
+		directory: Path,
+		dimension: int,
+		revision: str,
+		dtype: str = DTYPE,
+	) -> "Collection":
+		"""Create an empty collection.
+
+		Args:
+			directory (Path): The directory of the collection.
+			dimension (int): The dimension of the embeddings.
+			revision (str): The model the embeddings are computed with.
+			dtype (str): The type of the stored embeddings, float32 or float16.
+
+		Returns:
+			Collection: The collection.
+		"""
+		directory.mkdir(parents=True)
+		prefix_dimension = min(PREFIX_DIMENSION, dimension)
+		for file, columns in (("vectors", dimension), ("prefix", prefix_dimension)):
+			np.lib.format.open_memmap(
+				directory / f"{file}.npy",
+				mode="w+",
+				dtype=dtype,
+				shape=(INITIAL_CAPACITY, columns),
+			).flush()
+		(directory / "texts.jsonl").touch()
+		metadata = {
+			"size": 0,
+			"dimension": dimension,
+			"prefix_dimension": prefix_dimension,
+			"dtype": np.dtype(dtype).name,
+			"revision": revision,
+		}
+		(directory / "metadata.json").write_text(json.dumps(metadata, indent=2))
+		return cls(directory)
+
+	def _grow(self, capacity: int) -> None:
+		"""Copy the embeddings to larger arrays. Must be called with the lock held."""
+		for file in ("vectors", "prefix"):
+			old = getattr(self, f"_{file}")
+			tmp_path = self.directory / f"{file}.tmp.npy"
+			new = np.lib.format.open_memmap(
+				tmp_path,
+				mode="w+",
+				dtype=self.dtype,
+				shape=(capacity, old.shape[1]),
+			)
+			new[: self.size] = old[: self.size]
+			new.flush()
+			tmp_path.replace(self.directory / f"{file}.npy")
+			setattr(self, f"_{file}", new)
+
+	def add(self, texts: list[str], embeddings: np.ndarray) -> list[int]:
+		"""Add texts and their embeddings to the collection.
+
+		Args:
+			texts (list[str]): The texts.
+			embeddings (np.ndarray): Their embeddings, one per row.
+
+		Returns:
+			list[int]: The ids of the texts, ie. their positions in the collection.
+
+		Raises:
+			LookupError: If the collection was deleted.
+		"""
+		embeddings = _normalize(embeddings)
+		prefix = truncate(embeddings, self.prefix_dimension)
+		with self._lock:
+			self._check_deleted()
+			start, end = self.size, self.size + len(texts)
+			if end > len(self._vectors):
+				self._grow(max(end, 2 * len(self._vectors)))
+			self._vectors[start:end] = embeddings
+			self._prefix[start:end] = prefix
+			self._vectors.flush()
+			self._prefix.flush()
+			with (self.directory / "texts.jsonl").open("a", encoding="utf-8") as file:
+				file.writelines(json.dumps(text) + "\n" for text in texts)
+			self._texts.extend(texts)
+			self.size = end
+			metadata_path = self.directory / "metadata.json"
+			metadata = json.loads(metadata_path.read_text()) | {"size": end}
+			tmp_path = metadata_path.with_suffix(".tmp")
+			tmp_path.write_text(json.dumps(metadata, indent=2))
+			tmp_path.replace(metadata_path)
+		return list(range(start, end))
+
+	def search(
+		self,
+		queries: np.ndarray,
+		k: int,
+		approximate: bool,  # noqa: FBT001
+	) -> list[list[dict]]:
+		"""Find the texts most similar to each query.
+
+		Args:
+			queries (np.ndarray): The embeddings of the queries, one per row.
+			k (int): The number of texts found per query.
+			approximate (bool): Whether the candidates are found with the prefixes
+				of the embeddings first.
+
+		Returns:
+			list[list[dict]]: The `id`, `text` and cosine `score` of the texts
+			found for each query, from the most similar.
+
+		Raises:
+			LookupError: If the collection was deleted.
+		"""
+		with self._lock:
+			self._check_deleted()
+			size = self.size
+			vectors = self._vectors[:size]
+			prefix = self._prefix[:size]
+		queries = _normalize(queries)
+		if approximate and size > max(CANDIDATES, k):
+			candidates, _ = _top_k(
+				prefix,
+				truncate(queries, self.prefix_dimension),
+				max(CANDIDATES, k),
+			)
+			indices, scores = [], []
+			for query, query_candidates in zip(queries, candidates, strict=True):
+				# read the memory-mapped rows in order
+				rows = np.sort(query_candidates)
+				best, best_scores = _top_k(vectors[rows], query[None], k)
+				indices.append(rows[best[0]])
+				scores.append(best_scores[0])
+		else:
+			indices, scores = _top_k(vectors, queries, k)
+		return [
+			[
+				{"id": int(i), "text": self._texts[i], "score": float(score)}
+				for i, score in zip(row_indices, row_scores, strict=True)
+			]
+			for row_indices, row_scores in zip(indices, scores, strict=True)
+		]
+
+	def _check_deleted(self) -> None:
+		"""Raise a `LookupError` if the collection was deleted."""
+		if self.deleted:
+			msg = f"No collection {self.name}."
+			raise LookupError(msg)
+
+	def delete(self) -> None:
+		"""Delete the files of the collection, once no addition is running."""
+		with self._lock:
+			self.deleted = True
+			shutil.rmtree(self.directory)
+
+	def describe(self) -> dict:
+		"""Describe the size and the settings of the collection."""
+		return {
+			"size": self.size,
+			"dimension": self.dimension,
+			"prefix_dimension": self.prefix_dimension,
+			"dtype": self.dtype.name,
+			"revision": self.revision,
+		}
@@ -0,0 +1,124 @@
+"""Compact representations of the embeddings.
+
+The embedding model is trained with a Matryoshka loss, so the first dimensions of
+its embeddings are an embedding on their own: they can be truncated, then
+normalized again. They can also be stored in fewer bits: float16, int8 with a
+scale per embedding, or 1 bit per dimension, its sign, packed in bytes.
+"""
+
+from enum import Enum
+from io import BytesIO
+
+import numpy as np
+
+
+class Dtype(str, Enum):
+	"""The type of the values of the embeddings."""
+
+	FLOAT32 = "float32"
+	FLOAT16 = "float16"
+	INT8 = "int8"
+	BINARY = "binary"
+
+
+def truncate(
+	embeddings: np.ndarray,
+	dimension: int | None = None,
+	normalize: bool = True,  # noqa: FBT001, FBT002
+) -> np.ndarray:
+	"""Keep the first dimensions of the embeddings.
+
+	Args:
+		embeddings (np.ndarray): The embeddings, one per row.
+		dimension (int, optional): The number of dimensions kept, all of them if
+			None.
+		normalize (bool): Whether the truncated embeddings are normalized again.
+
+	Returns:
+		np.ndarray: The truncated embeddings, in float32.
+	"""
+	embeddings = np.asarray(embeddings, dtype=np.float32)
+	if dimension is None or dimension >= embeddings.shape[-1]:
+		return embeddings
+	embeddings = embeddings[..., :dimension]
+	if normalize:
+		norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+		embeddings = embeddings / np.maximum(norms, 1e-12)
+	return embeddings
+
+
+def quantize(
+	embeddings: np.ndarray,
+	dtype: Dtype,
+) -> tuple[np.ndarray, np.ndarray | None]:
+	"""Convert the embeddings to a compact type.
+
+	Args:
+		embeddings (np.ndarray): The float32 embeddings, one per row.
+		dtype (Dtype): The type of the values.
+
+	Returns:
+		tuple[np.ndarray, np.ndarray | None]: The converted embeddings, and for
+		int8 the scale of each embedding, ie. the value of an int8 step. Binary
+		embeddings are packed, 8 dimensions per byte.
+	"""
+	if dtype == Dtype.FLOAT16:
+		return embeddings.astype(np.float16), None
+	if dtype == Dtype.INT8:
+		scales = np.abs(embeddings).max(axis=-1, keepdims=True) / 127
+		scales = np.maximum(scales, np.finfo(np.float32).tiny)
+		return np.round(embeddings / scales).astype(np.int8), scales[..., 0]
+	if dtype == Dtype.BINARY:
+		return np.packbits(embeddings > 0, axis=-1), None
+	return embeddings, None
+
+
+def dequantize(
+	embeddings: np.ndarray,
+	dtype: Dtype,
+	scales: np.ndarray | None = None,
+	dimension: int | None = None,
+) -> np.ndarray:
+	"""Convert compact embeddings back to float32, eg. to compare them.
+
+	Args:
+		embeddings (np.ndarray): The embeddings returned by `quantize`.
+		dtype (Dtype): The type of their values.
+		scales (np.ndarray, optional): The scales of the int8 embeddings.
+		dimension (int, optional): The number of dimensions of the binary
+			embeddings, if it isn't a multiple of 8.
+
+	Returns:
+		np.ndarray: The float32 embeddings. Binary embeddings are -1 or 1, so
+		their dot product is the number of dimensions minus twice the Hamming
+		distance.
+	"""
+	if dtype == Dtype.INT8:
+		return embeddings.astype(np.float32) * scales[..., None]
+	if dtype == Dtype.BINARY:
+		bits = np.unpackbits(embeddings, axis=-1, count=dimension)
+		return bits.astype(np.float32) * 2 - 1
+	return embeddings.astype(np.float32)
+
+
+def serialize(embeddings: np.ndarray, scales: np.ndarray | None = None) -> bytes:
+	"""Serialize the embeddings, keeping their shape and type.
+
+	Args:
+		embeddings (np.ndarray): The embeddings returned by `quantize`.
+		scales (np.ndarray, optional): The scales of the int8 embeddings.
+
+	Returns:
+		bytes: The embeddings saved with `np.save`. With scales, each row is a
+		record of its `scale` and its `embedding`, so they are saved in one array.
+	"""
+	if scales is not None:
+		records = np.empty(
+			len(embeddings),
+			dtype=[("scale", "<f4"), ("embedding", "i1", embeddings.shape[1:])],
+		)
+		records["scale"], records["embedding"] = scales, embeddings
+		embeddings = records
+	buf = BytesIO()
+	np.save(buf, embeddings)
+	return buf.getvalue()
@@ -0,0 +1,153 @@
+"""The collections of embedded texts, and the statistics of their searches.
+
+Each collection is stored in its own directory, see `collection.Collection`, and
+the collections are opened again on startup.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from os import environ
+from pathlib import Path
+
+import numpy as np
+from lgg import logger
+
+from .collection import Collection
+
+# Where the collections are stored, one directory per collection
+INDEX_DIR = Path(
+	environ.get("EMBEDDING_INDEX_DIR", Path(__file__).parents[1] / "collections"),
+)
+# Size from which the search is approximate by default
+APPROXIMATE_MIN_SIZE = int(environ.get("EMBEDDING_INDEX_APPROXIMATE_MIN_SIZE", "50000"))
+NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+# Number of recent searches the statistics are computed on
+STATS_WINDOW = 1000
+
+
+class Index:
+	"""The collections, and the statistics of their searches."""
+
+	def __init__(self, directory: Path) -> None:
+		"""Open the collections stored in a directory.
+
+		Args:
+			directory (Path): The directory of the collections.
+		"""
+		self.directory = directory
+		self.collections: dict[str, Collection] = {}
+		self._lock = threading.Lock()
+		self._latencies = {
+			True: deque(maxlen=STATS_WINDOW),
+			False: deque(maxlen=STATS_WINDOW),
+		}
+		directory.mkdir(parents=True, exist_ok=True)
+		for path in sorted(directory.glob("*/metadata.json")):
+			collection = self._open(path.parent)
+			if collection is not None:
+				self.collections[collection.name] = collection
+		logger.info(f"Opened {len(self.collections)} collections from {directory}")
+
+	@staticmethod
+	def _open(directory: Path) -> Collection | None:
+		"""Open a collection, or log why it can't be opened."""
+		try:
+			return Collection(directory)
+		except (OSError, ValueError, KeyError) as e:
+			logger.warning(f"Failed to open the collection {directory}: {e}")
+			return None
+
+	def get(self, name: str) -> Collection | None:
+		"""Get a collection, or None if it doesn't exist."""
+		return self.collections.get(name)
+
+	def get_or_create(self, name: str, dimension: int, revision: str) -> Collection:
+		"""Get a collection, and create it if it doesn't exist.
+
+		Args:
+			name (str): The name of the collection, of letters, digits, `_` and
+				`-`.
+			dimension (int): The dimension of the embeddings.
+			revision (str): The model the embeddings of a new collection are
+				computed with.
+
+		Returns:
+			Collection: The collection, whose revision may differ.
+
+		Raises:
+			ValueError: If the name isn't valid.
+		"""
+		if not NAME_PATTERN.fullmatch(name):
+			msg = "A collection name is made of at most 64 letters, digits, _ and -."
+			raise ValueError(msg)
+		with self._lock:
+			if name not in self.collections:
+				self.collections[name] = Collection.create(
+					self.directory / name,
+					dimension,
+					revision,
+				)
+			return self.collections[name]
+
+	def delete(self, name: str) -> bool:
+		"""Delete a collection and its files, see `Collection.delete`.
+
+		Returns:
+			bool: Whether the collection existed.
+		"""
+		with self._lock:
+			collection = self.collections.pop(name, None)
+			if collection is None:
+				return False
+			# with the lock held, so a collection of the same name isn't created
+			# while the files are removed
+			collection.delete()
+		return True
+
+	def search(
+		self,
+		collection: Collection,
+		queries: np.ndarray,
+		k: int,
+		approximate: bool | None = None,
+	) -> list[list[dict]]:
+		"""Search a collection, see `Collection.search`, and record its latency.
+
+		By default, the search is approximate if the collection has at least
+		`EMBEDDING_INDEX_APPROXIMATE_MIN_SIZE` texts.
+		"""
+		if approximate is None:
+			approximate = collection.size >= APPROXIMATE_MIN_SIZE
+		start = time.perf_counter()
+		results = collection.search(queries, k, approximate)
+		with self._lock:
+			self._latencies[approximate].append(time.perf_counter() - start)
+		return results
+
+	def stats(self) -> dict:
+		"""Get the size of the collections and the latency of the searches.
+
+		Returns:
+			dict: The size and settings of each collection, and the number and the
+			mean and p95 latencies of the recent exact and approximate searches.
+		"""
+		with self._lock:
+			latencies = {key: list(values) for key, values in self._latencies.items()}
+			stats = {
+				"collections": {
+					name: collection.describe()
+					for name, collection in self.collections.items()
+				},
+			}
+		for approximate, values in latencies.items():
+			mode = "approximate" if approximate else "exact"
+			stats[f"{mode}_searches"] = len(values)
+			if values:
+				stats[f"mean_{mode}_search_ms"] = float(np.mean(values)) * 1000
+				stats[f"p95_{mode}_search_ms"] = float(np.percentile(values, 95)) * 1000
+		return stats
+
+
+index = Index(INDEX_DIR)
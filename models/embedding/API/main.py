@@ -1,33 +1,211 @@
 """Main API module for the Whisper ASR."""
 
-from io import BytesIO
+from functools import partial
 
 import numpy as np
 from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
 
-from .predict import predict
-from .utils import EmbeddingRequest
+from .cache import cache
+from .collection import Collection
+from .compression import quantize, serialize, truncate
+from .index import index
+from .predict import DIMENSION, REVISION, predict, scheduler
+from .streaming import MEDIA_TYPES, stream_embeddings
+from .utils import AddTextsRequest, EmbeddingRequest, SearchRequest
 
 router = APIRouter(prefix="/embedding")
 
 
+def _embed(
+	texts: list[str],
+	texts_list: EmbeddingRequest,
+	dimension: int,
+) -> tuple[np.ndarray, np.ndarray | None]:
+	"""Compute the compact embeddings of texts, as requested."""
+	embeddings = truncate(predict(texts), dimension, texts_list.normalize)
+	return quantize(embeddings, texts_list.dtype)
+
+
+def _check_revision(collection: Collection) -> None:
+	"""Reject a collection embedded by another model, with a status code of 409.
+
+	Its embeddings can't be compared with the embeddings of the current model.
+	"""
+	if collection.revision != REVISION:
+		detail = (
+			f"The collection {collection.name} was embedded with "
+			f"{collection.revision}, not {REVISION}. Delete it and add its texts "
+			"again."
+		)
+		raise HTTPException(status_code=409, detail=detail)
+
+
 @router.post("")
 def compute_embedding(texts_list: EmbeddingRequest) -> bytes:
 	"""Transcribes the given audio file(s) using a pre-trained model.
 
+	The embeddings can be truncated to their first `dimension` dimensions, eg. 64,
+	128 or 256, and normalized again, and their values converted to `float16`,
+	`int8` or `binary`, so the response is as small as needed. For large
+	requests, set `stream` to `ndjson` or `frames` to receive the embeddings
+	batch by batch, as soon as they are computed, see `streaming`.
+
+	Args:
+		texts_list (EmbeddingRequest): A list of texts, and the representation of
+			their embeddings.
+
+	Returns:
+		bytes: The embeddings of the input texts, saved with `np.save`. For `int8`,
+		each row is a record of the `scale` and the `embedding`. For `binary`, the
+		signs of the dimensions are packed, 8 per byte. When streamed, the
+		embeddings are JSON lines or length-prefixed `np.save` frames, one per
+		batch. The `X-Embedding-Dtype` and `X-Embedding-Dimension` headers describe
+		them.
+
+	Raises:
+		HTTPException: If the dimension is larger than the embeddings, an
+		HTTPException is raised with a status code of 422. If an error occurs
+		while computing the embeddings, an HTTPException is raised with a status
+		code of 500 and the error details.
+	"""
+	dimension = texts_list.dimension or DIMENSION
+	if dimension > DIMENSION:
+		detail = f"The dimension must be at most {DIMENSION}."
+		raise HTTPException(status_code=422, detail=detail)
+	headers = {
+		"X-Embedding-Dtype": texts_list.dtype.value,
+		"X-Embedding-Dimension": str(dimension),
+	}
+	if texts_list.stream is not None:
+		return StreamingResponse(
+			stream_embeddings(
+				texts_list.texts,
+				partial(_embed, texts_list=texts_list, dimension=dimension),
+				texts_list.stream,
+			),
+			media_type=MEDIA_TYPES[texts_list.stream],
+			headers=headers,
+		)
+	try:
+		embeddings, scales = _embed(texts_list.texts, texts_list, dimension)
+		return Response(
+			content=serialize(embeddings, scales),
+			media_type="application/octet-stream",
+			headers=headers,
+		)
+	except Exception as e:  # noqa: BLE001
+		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+
+
+@router.get("/collections")
+def list_collections() -> dict:
+	"""List the collections of texts.
+
+	Returns:
+		dict: The size and the settings of each collection.
+	"""
+	return {
+		name: collection.describe() for name, collection in index.collections.items()
+	}
+
+
+@router.post("/collections/{name}")
+def add_texts(name: str, request: AddTextsRequest) -> dict:
+	"""Embed texts and add them to a collection, created if it doesn't exist.
+
 	Args:
-		texts_list (EmbeddingRequest): A list of texts.
+		name (str): The name of the collection, of letters, digits, `_` and `-`.
+		request (AddTextsRequest): The texts.
 
 	Returns:
-		bytes: The embeddings of the input texts.
+		dict: The ids of the texts in the collection, and its size.
+
+	Raises:
+		HTTPException: If the name isn't valid, an HTTPException is raised with a
+		status code of 422. If the collection was embedded by another model, with
+		a status code of 409. If it is deleted meanwhile, with a status code of
+		404. If an error occurs while adding the texts, an
+		HTTPException is raised with a status code of 500 and the error details.
 	"""
 	try:
-		texts = texts_list.texts
-		embeddings = predict(texts)
-		# Preserve the array shape by saving the array with np.save
-		buf = BytesIO()
-		np.save(buf, embeddings)
-		buf.seek(0)
-		return Response(content=buf.getvalue(), media_type="application/octet-stream")
+		collection = index.get_or_create(name, DIMENSION, REVISION)
+	except ValueError as e:
+		raise HTTPException(status_code=422, detail=str(e))  # noqa: B904
+	_check_revision(collection)
+	try:
+		ids = collection.add(request.texts, predict(request.texts))
+	except LookupError as e:
+		# deleted meanwhile
+		raise HTTPException(status_code=404, detail=str(e))  # noqa: B904
 	except Exception as e:  # noqa: BLE001
 		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+	return {"ids": ids, "size": collection.size}
+
+
+@router.delete("/collections/{name}")
+def delete_collection(name: str) -> dict:
+	"""Delete a collection and its texts.
+
+	Raises:
+		HTTPException: If the collection doesn't exist, an HTTPException is
+		raised with a status code of 404.
+	"""
+	if not index.delete(name):
+		raise HTTPException(status_code=404, detail=f"No collection {name}.")
+	return {"deleted": name}
+
+
+@router.post("/search")
+def search(request: SearchRequest) -> dict:
+	"""Find the texts of a collection most similar to each query.
+
+	Large collections are searched approximately by default: candidates are
+	found with the first dimensions of the embeddings, then ranked with all of
+	them. Set `approximate` to choose.
+
+	Args:
+		request (SearchRequest): The collection, the queries, the number of texts
+			found per query, and whether the search is approximate.
+
+	Returns:
+		dict: The `id`, `text` and cosine `score` of the texts found for each
+		query, from the most similar.
+
+	Raises:
+		HTTPException: If the collection doesn't exist, or is deleted meanwhile, an
+		HTTPException is raised with a status code of 404. If it was embedded by
+		another model, with a status code of 409. If an error occurs while searching, an
+		HTTPException is raised with a status code of 500 and the error details.
+	"""
+	collection = index.get(request.collection)
+	if collection is None:
+		detail = f"No collection {request.collection}."
+		raise HTTPException(status_code=404, detail=detail)
+	_check_revision(collection)
+	try:
+		queries = predict(request.queries)
+		results = index.search(collection, queries, request.k, request.approximate)
+	except LookupError as e:
+		# deleted meanwhile
+		raise HTTPException(status_code=404, detail=str(e))  # noqa: B904
+	except Exception as e:  # noqa: BLE001
+		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+	return {"results": results}
+
+
+@router.get("/stats")
+def get_embedding_stats() -> dict:
+	"""Get the statistics of the embedding cache and of the batches.
+
+	Returns:
+		dict: The hit rate of the cache and the calls to the model it saved, see
+		`EmbeddingCache.stats`, the tokens per second and padding ratio of the
+		batches, see `EmbeddingScheduler.stats`, and the collections and the
+		latency of their searches, see `Index.stats`.
+	"""
+	return {
+		"cache": cache.stats() if cache else {"enabled": False},
+		"batching": scheduler.stats(),
+		"index": index.stats(),
+	}
@@ -2,17 +2,45 @@
 
 import numpy as np
 from lgg import logger
-from sentence_transformers import SentenceTransformer
+
+from .cache import cache, fingerprint, normalize
+from .runtime import MODEL_NAME, load_model, revision
+from .scheduler import EmbeddingScheduler
 
 # Load the model
-_model = SentenceTransformer(
-	"Omartificial-Intelligence-Space/Arabic-Triplet-Matryoshka-V2",
-)
+_model = load_model(MODEL_NAME)
+DIMENSION = _model.get_sentence_embedding_dimension()
+# The model the cached embeddings depend on, with the commit of its weights
+REVISION = revision(MODEL_NAME, _model)
+
+
+def encode_batch(texts: list[str]) -> np.ndarray:
+	"""Encode a batch of texts in one forward pass."""
+	return _model.encode(texts, batch_size=max(len(texts), 1))
+
+
+def count_tokens(texts: list[str]) -> list[int]:
+	"""Count the tokens of texts, with the special tokens, once truncated."""
+	input_ids = _model.tokenizer(
+		texts,
+		truncation=True,
+		max_length=_model.max_seq_length,
+	)["input_ids"]
+	return [len(ids) for ids in input_ids]
+
+
+# Batch the texts of concurrent requests
+scheduler = EmbeddingScheduler(encode_batch, count_tokens)
 
 
 def predict(texts: list[str]) -> np.ndarray:
 	"""Compute the embeddings of the input texts.
 
+	The texts are normalized, so the embeddings don't depend on whether the cache
+	is enabled. The embeddings are cached text by text, so only the texts missed,
+	without duplicates, are encoded, batched with the texts of concurrent requests
+	by the scheduler.
+
 	Args:
 		texts (list[str]): A list of texts.
 
@@ -20,4 +48,19 @@ def predict(texts: list[str]) -> np.ndarray:
 		np.ndarray: The embeddings of the input texts.
 	"""
 	logger.debug(f"Computing the embeddings of {len(texts)} input texts.")
-	return _model.encode(texts)
+	if not texts:
+		return _model.encode(texts)
+	texts = [normalize(text) for text in texts]
+	if cache is None:
+		return scheduler.submit(texts).result()
+	keys = [fingerprint(text, REVISION) for text in texts]
+	vectors = {key: cache.get(key) for key in dict.fromkeys(keys)}
+	missed = [key for key, vector in vectors.items() if vector is None]
+	if missed:
+		missed_texts = dict(zip(keys, texts, strict=True))
+		encoded = scheduler.submit([missed_texts[key] for key in missed]).result()
+		for key, vector in zip(missed, encoded, strict=True):
+			vectors[key] = vector
+			cache.put(key, vector)
+	cache.record(encoded=bool(missed))
+	return np.stack([vectors[key] for key in keys])
@@ -0,0 +1,225 @@
+"""Load the embedding model with torch or ONNX Runtime.
+
+On CPU, the forward pass of the SentenceTransformer dominates the latency of the
+embeddings, and loading torch slows the startup of the API. With
+`EMBEDDING_ONNX=1`, the model and its pooling are exported to a single ONNX
+graph, whose weights are quantized to int8 dynamically, and run with ONNX
+Runtime. The graph returns the embeddings as the SentenceTransformer does,
+without normalizing them, so both runtimes return the same vectors, up to the
+quantization. The graph is exported once, to `EMBEDDING_ONNX_DIR`, eg. with
+`src/export-onnx.py`, then only ONNX Runtime and the tokenizer are loaded. It is
+exported again if it was exported in another format, see `GRAPH_VERSION`.
+
+torch, sentence-transformers and ONNX Runtime are only imported when needed.
+"""
+
+import json
+from os import environ
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from lgg import logger
+
+if TYPE_CHECKING:
+	from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "Omartificial-Intelligence-Space/Arabic-Triplet-Matryoshka-V2"
+# Whether the model runs with ONNX Runtime, in int8
+ONNX = environ.get("EMBEDDING_ONNX", "0") == "1"
+# Where the ONNX graphs are exported, one directory per model
+ONNX_DIR = Path(
+	environ.get("EMBEDDING_ONNX_DIR", Path(__file__).parents[1] / "onnx"),
+)
+# Number of threads of ONNX Runtime, 0 to let it choose
+ONNX_THREADS = int(environ.get("EMBEDDING_ONNX_THREADS", "0"))
+OPSET = 17
+# The format of the exported graphs, bumped when their outputs change, so older
+# graphs are exported again and their embeddings aren't mixed with the new ones:
+# 2 for the embeddings not normalized
+GRAPH_VERSION = 2
+
+
+def onnx_dir(model_name: str) -> Path:
+	"""Get the directory of the ONNX graph of a model."""
+	return ONNX_DIR / model_name.replace("/", "--")
+
+
+def export_onnx(model_name: str, output_dir: Path) -> Path:
+	"""Export a SentenceTransformer to an int8 ONNX graph, with its tokenizer.
+
+	The graph takes the inputs of the tokenizer, padded, and returns the
+	embeddings of the SentenceTransformer, so the pooling runs in ONNX Runtime
+	too.
+
+	Args:
+		model_name (str): The name of the SentenceTransformer.
+		output_dir (Path): The directory of the graph.
+
+	Returns:
+		Path: The int8 graph.
+	"""
+	import torch
+	from onnxruntime.quantization import QuantType, quantize_dynamic
+	from sentence_transformers import SentenceTransformer
+
+	class _Encoder(torch.nn.Module):
+		"""The SentenceTransformer with named inputs, returning the embeddings."""
+
+		def __init__(self, model: SentenceTransformer, input_names: list[str]) -> None:
+			super().__init__()
+			self.model = model
+			self.input_names = input_names
+
+		def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+			features = dict(zip(self.input_names, inputs, strict=True))
+			return self.model(features)["sentence_embedding"]
+
+	logger.info(f"Exporting {model_name} to ONNX in {output_dir}")
+	model = SentenceTransformer(model_name, device="cpu").eval()
+	output_dir.mkdir(parents=True, exist_ok=True)
+	model.tokenizer.save_pretrained(output_dir)
+	sample = model.tokenizer(
+		["مرحبا، كيف داير؟", "واش نقدر نعاونك"],
+		padding=True,
+		return_tensors="pt",
+	)
+	input_names = list(sample.keys())
+	float_path = output_dir / "model-float32.onnx"
+	with torch.no_grad():
+		torch.onnx.export(
+			_Encoder(model, input_names),
+			tuple(sample.values()),
+			float_path.as_posix(),
+			input_names=input_names,
+			output_names=["sentence_embedding"],
+			dynamic_axes={
+				**{name: {0: "batch", 1: "sequence"} for name in input_names},
+				"sentence_embedding": {0: "batch"},
+			},
+			opset_version=OPSET,
+		)
+	int8_path = output_dir / "model-int8.onnx"
+	quantize_dynamic(float_path, int8_path, weight_type=QuantType.QInt8)
+	config = model[0].auto_model.config
+	metadata = {
+		"model_name": model_name,
+		"revision": getattr(config, "_commit_hash", ""),
+		"max_seq_length": model.max_seq_length,
+		"dimension": model.get_sentence_embedding_dimension(),
+		"graph_version": GRAPH_VERSION,
+	}
+	(output_dir / "metadata.json").write_text(json.dumps(metadata, indent=2))
+	logger.info(f"Exported the int8 graph to {int8_path}")
+	return int8_path
+
+
+class OnnxEncoder:
+	"""Encode texts with the int8 ONNX graph of a SentenceTransformer.
+
+	It has the methods and attributes of the SentenceTransformer the API uses.
+	"""
+
+	def __init__(self, graph_dir: Path, threads: int = ONNX_THREADS) -> None:
+		"""Load the graph and the tokenizer.
+
+		Args:
+			graph_dir (Path): The directory of the graph, see `export_onnx`.
+			threads (int): The number of threads of ONNX Runtime, 0 to let it
+				choose.
+		"""
+		import onnxruntime as ort
+		from transformers import AutoTokenizer
+
+		metadata = json.loads((graph_dir / "metadata.json").read_text())
+		self.model_name = metadata["model_name"]
+		self.revision = metadata["revision"]
+		self.max_seq_length = metadata["max_seq_length"]
+		self.dimension = metadata["dimension"]
+		self.graph_version = metadata.get("graph_version", 1)
+		self.tokenizer = AutoTokenizer.from_pretrained(graph_dir)
+		options = ort.SessionOptions()
+		options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+		options.intra_op_num_threads = threads
+		self.session = ort.InferenceSession(
+			(graph_dir / "model-int8.onnx").as_posix(),
+			options,
+			providers=["CPUExecutionProvider"],
+		)
+		self.input_names = [node.name for node in self.session.get_inputs()]
+
+	def get_sentence_embedding_dimension(self) -> int:
+		"""Get the dimension of the embeddings."""
+		return self.dimension
+
+	def encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+		"""Compute the embeddings of texts, like `SentenceTransformer.encode`.
+
+		Args:
+			texts (list[str]): The texts.
+			batch_size (int): The number of texts per forward pass.
+
+		Returns:
+			np.ndarray: The float32 embeddings, one per row.
+		"""
+		embeddings = [np.empty((0, self.dimension), dtype=np.float32)]
+		for start in range(0, len(texts), batch_size):
+			inputs = self.tokenizer(
+				texts[start : start + batch_size],
+				padding=True,
+				truncation=True,
+				max_length=self.max_seq_length,
+				return_tensors="np",
+			)
+			feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+			embeddings.append(self.session.run(None, feed)[0])
+		return np.concatenate(embeddings)
+
+
+def _graph_version(graph_dir: Path) -> int | None:
+	"""Get the format of an exported graph, or None if there is none."""
+	metadata_path = graph_dir / "metadata.json"
+	if not metadata_path.exists():
+		return None
+	version = json.loads(metadata_path.read_text()).get("graph_version", 1)
+	if version != GRAPH_VERSION:
+		logger.warning(
+			f"The graph in {graph_dir} has the format {version}, not "
+			f"{GRAPH_VERSION}, it is exported again.",
+		)
+	return version
+
+
+def load_model(
+	model_name: str,
+	onnx: bool = ONNX,  # noqa: FBT001
+) -> "SentenceTransformer | OnnxEncoder":
+	"""Load the embedding model.
+
+	Args:
+		model_name (str): The name of the SentenceTransformer.
+		onnx (bool): Whether the model runs with ONNX Runtime, in int8. The graph
+			is exported first if it isn't in `EMBEDDING_ONNX_DIR`, or was exported
+			in another format.
+
+	Returns:
+		SentenceTransformer | OnnxEncoder: The model.
+	"""
+	if onnx:
+		graph_dir = onnx_dir(model_name)
+		if _graph_version(graph_dir) != GRAPH_VERSION:
+			export_onnx(model_name, graph_dir)
+		logger.info(f"Loading {model_name} with ONNX Runtime from {graph_dir}")
+		return OnnxEncoder(graph_dir)
+	from sentence_transformers import SentenceTransformer
+
+	logger.info(f"Loading {model_name} with torch")
+	return SentenceTransformer(model_name)
+
+
+def revision(model_name: str, model: "SentenceTransformer | OnnxEncoder") -> str:
+	"""Describe the weights and the runtime of a model, for the cache keys."""
+	if isinstance(model, OnnxEncoder):
+		return f"{model_name}@{model.revision}/onnx-int8-v{model.graph_version}"
+	config = model[0].auto_model.config
+	return f"{model_name}@{getattr(config, '_commit_hash', '')}"
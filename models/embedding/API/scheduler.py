@@ -0,0 +1,202 @@
+"""Batch the texts of concurrent embedding requests together, by length.
+
+Each request submits its texts to a queue. A worker thread gathers the queued
+requests, waiting at most `EMBEDDING_MAX_WAIT_MS` after the first one, sorts all
+their texts by number of tokens, and encodes them in buckets of similar lengths,
+of at most `EMBEDDING_MAX_BATCH_SIZE` texts and `EMBEDDING_MAX_BATCH_TOKENS`
+tokens with the padding, so little of each batch is padding. The embeddings are
+then scattered back to the requests, in the order of their texts.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from os import environ
+
+import numpy as np
+from lgg import logger
+
+MAX_BATCH_SIZE = int(environ.get("EMBEDDING_MAX_BATCH_SIZE", "64"))
+MAX_BATCH_TOKENS = int(environ.get("EMBEDDING_MAX_BATCH_TOKENS", "8192"))
+MAX_WAIT = float(environ.get("EMBEDDING_MAX_WAIT_MS", "5")) / 1000
+# Number of recent batches the statistics are computed on
+STATS_WINDOW = 1000
+
+
+@dataclass
+class _Request:
+	"""The texts of a request waiting to be encoded."""
+
+	texts: list[str]
+	future: Future = field(default_factory=Future)
+	queued_at: float = field(default_factory=time.perf_counter)
+	embeddings: list[np.ndarray | None] = field(default_factory=list)
+
+
+class EmbeddingScheduler:
+	"""Encode the texts of concurrent requests in length-bucketed batches."""
+
+	def __init__(
+		self,
+		encode: Callable[[list[str]], np.ndarray],
+		count_tokens: Callable[[list[str]], list[int]],
+		max_batch_size: int = MAX_BATCH_SIZE,
+		max_batch_tokens: int = MAX_BATCH_TOKENS,
+		max_wait: float = MAX_WAIT,
+	) -> None:
+		"""Initialize the scheduler and start its worker thread.
+
+		Args:
+			encode (Callable): Encodes a batch of texts in one forward pass.
+			count_tokens (Callable): Counts the tokens of texts, as encoded.
+			max_batch_size (int): The maximum number of texts in a batch.
+			max_batch_tokens (int): The maximum number of tokens in a batch, with
+				the padding.
+			max_wait (float): The maximum seconds to wait for more requests.
+		"""
+		self.encode = encode
+		self.count_tokens = count_tokens
+		self.max_batch_size = max_batch_size
+		self.max_batch_tokens = max_batch_tokens
+		self.max_wait = max_wait
+		self._queue: queue.Queue[_Request] = queue.Queue()
+		self._lock = threading.Lock()
+		self._batch_sizes = deque(maxlen=STATS_WINDOW)
+		self._tokens = deque(maxlen=STATS_WINDOW)
+		self._padded_tokens = deque(maxlen=STATS_WINDOW)
+		self._batch_latencies = deque(maxlen=STATS_WINDOW)
+		self._queue_waits = deque(maxlen=STATS_WINDOW)
+		self._texts = 0
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def submit(self, texts: list[str]) -> Future:
+		"""Queue the texts of a request to be encoded.
+
+		Args:
+			texts (list[str]): The texts.
+
+		Returns:
+			Future: The future embeddings of the texts, one per row.
+		"""
+		request = _Request(texts)
+		self._queue.put(request)
+		return request.future
+
+	def _gather(self) -> list[_Request]:
+		"""Wait for the queued requests, see the module documentation."""
+		requests = [self._queue.get()]
+		texts = len(requests[0].texts)
+		deadline = requests[0].queued_at + self.max_wait
+		while texts < self.max_batch_size:
+			timeout = deadline - time.perf_counter()
+			if timeout <= 0:
+				break
+			try:
+				requests.append(self._queue.get(timeout=timeout))
+			except queue.Empty:
+				break
+			texts += len(requests[-1].texts)
+		return requests
+
+	def _buckets(self, lengths: list[int]) -> list[list[int]]:
+		"""Group the texts of similar lengths into batches.
+
+		Returns:
+			list[list[int]]: The indices of the texts of each batch, from the
+			shortest to the longest.
+		"""
+		buckets = []
+		for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+			# sorted, so the text is the longest of its bucket
+			if (
+				buckets
+				and len(buckets[-1]) < self.max_batch_size
+				and lengths[i] * (len(buckets[-1]) + 1) <= self.max_batch_tokens
+			):
+				buckets[-1].append(i)
+			else:
+				buckets.append([i])
+		return buckets
+
+	def _run(self) -> None:
+		"""Encode the queued requests, batch by batch, forever."""
+		while True:
+			# drop the requests cancelled meanwhile
+			requests = [
+				r for r in self._gather() if r.future.set_running_or_notify_cancel()
+			]
+			# the request and the position of each text
+			owners = [
+				(request, j) for request in requests for j in range(len(request.texts))
+			]
+			texts = [request.texts[j] for request, j in owners]
+			for request in requests:
+				request.embeddings = [None] * len(request.texts)
+			try:
+				lengths = self.count_tokens(texts)
+				for bucket in self._buckets(lengths):
+					self._run_batch(bucket, owners, lengths)
+			except Exception as e:  # noqa: BLE001
+				logger.warning(f"Failed to encode {len(texts)} texts: {e}")
+				for request in requests:
+					request.future.set_exception(e)
+				continue
+			for request in requests:
+				if request.texts:
+					request.future.set_result(np.stack(request.embeddings))
+				else:
+					request.future.set_result(self.encode([]))
+
+	def _run_batch(
+		self,
+		bucket: list[int],
+		owners: list[tuple[_Request, int]],
+		lengths: list[int],
+	) -> None:
+		"""Encode a batch and scatter the embeddings to the requests."""
+		start = time.perf_counter()
+		embeddings = self.encode([owners[i][0].texts[owners[i][1]] for i in bucket])
+		end = time.perf_counter()
+		for i, embedding in zip(bucket, embeddings, strict=True):
+			request, j = owners[i]
+			request.embeddings[j] = embedding
+		with self._lock:
+			self._texts += len(bucket)
+			self._batch_sizes.append(len(bucket))
+			self._tokens.append(sum(lengths[i] for i in bucket))
+			self._padded_tokens.append(max(lengths[i] for i in bucket) * len(bucket))
+			self._batch_latencies.append(end - start)
+			self._queue_waits.extend(start - owners[i][0].queued_at for i in bucket)
+
+	def stats(self) -> dict:
+		"""Get the throughput and the padding of the recent batches.
+
+		Returns:
+			dict: The number of texts encoded, the mean batch size, the tokens
+			encoded per second, the padding ratio, ie. the share of the padded
+			tokens that are padding, the mean and p95 queue waits, the mean batch
+			latency and the number of queued requests.
+		"""
+		with self._lock:
+			sizes = list(self._batch_sizes)
+			tokens = sum(self._tokens)
+			padded_tokens = sum(self._padded_tokens)
+			latencies = list(self._batch_latencies)
+			waits = list(self._queue_waits)
+			stats = {"texts": self._texts}
+		if sizes:
+			stats["mean_batch_size"] = float(np.mean(sizes))
+			stats["tokens_per_second"] = tokens / sum(latencies)
+			stats["padding_ratio"] = 1 - tokens / padded_tokens
+			stats["mean_queue_wait_ms"] = float(np.mean(waits)) * 1000
+			stats["p95_queue_wait_ms"] = float(np.percentile(waits, 95)) * 1000
+			stats["mean_batch_latency_ms"] = float(np.mean(latencies)) * 1000
+		stats["queued"] = self._queue.qsize()
+		stats["max_batch_size"] = self.max_batch_size
+		stats["max_batch_tokens"] = self.max_batch_tokens
+		stats["max_wait_ms"] = self.max_wait * 1000
+		return stats
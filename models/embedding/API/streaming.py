@@ -0,0 +1,99 @@
+"""Stream the embeddings of large requests, batch by batch.
+
+The texts are embedded `EMBEDDING_STREAM_BATCH_SIZE` at a time, and the
+embeddings of each batch are written to the response as soon as they are
+computed, so the first ones arrive early and only one batch is held in memory,
+whatever the number of texts. Two formats are available:
+
+- `ndjson`: one JSON line per text, with its `index`, its `embedding`, and for
+  int8 its `scale`.
+- `frames`: one frame per batch, a little-endian uint32 length followed by the
+  `np.save` payload of the batch, as returned by `/embedding` for all the texts.
+
+The response has already started when a batch fails, so its status can't tell
+the failure. The stream then ends with an error marker: a JSON line with the
+`index` of the first text of the batch and the `error`, preceded for `frames` by
+a frame of length 0, which no batch has.
+"""
+
+import json
+import struct
+from collections.abc import Callable, Iterator
+from enum import Enum
+from os import environ
+
+import numpy as np
+from lgg import logger
+
+from .compression import serialize
+
+BATCH_SIZE = int(environ.get("EMBEDDING_STREAM_BATCH_SIZE", "256"))
+
+
+class StreamFormat(str, Enum):
+	"""The format of the streamed embeddings."""
+
+	NDJSON = "ndjson"
+	FRAMES = "frames"
+
+
+MEDIA_TYPES = {
+	StreamFormat.NDJSON: "application/x-ndjson",
+	StreamFormat.FRAMES: "application/octet-stream",
+}
+
+
+def _ndjson(
+	start: int,
+	embeddings: np.ndarray,
+	scales: np.ndarray | None,
+) -> bytes:
+	"""Write the embeddings of a batch as JSON lines."""
+	lines = []
+	for i, embedding in enumerate(embeddings):
+		line = {"index": start + i, "embedding": embedding.tolist()}
+		if scales is not None:
+			line["scale"] = float(scales[i])
+		lines.append(json.dumps(line) + "\n")
+	return "".join(lines).encode()
+
+
+def _frame(embeddings: np.ndarray, scales: np.ndarray | None) -> bytes:
+	"""Write the embeddings of a batch as a length-prefixed `np.save` payload."""
+	payload = serialize(embeddings, scales)
+	return struct.pack("<I", len(payload)) + payload
+
+
+def stream_embeddings(
+	texts: list[str],
+	embed: Callable[[list[str]], tuple[np.ndarray, np.ndarray | None]],
+	stream_format: StreamFormat,
+	batch_size: int = BATCH_SIZE,
+) -> Iterator[bytes]:
+	"""Embed texts batch by batch, and write each batch once it is embedded.
+
+	Args:
+		texts (list[str]): The texts.
+		embed (Callable): Computes the embeddings of a batch of texts, and their
+			int8 scales, see `compression.quantize`.
+		stream_format (StreamFormat): The format of the embeddings.
+		batch_size (int): The number of texts embedded at once.
+
+	Yields:
+		bytes: The embeddings of each batch. If a batch fails, the stream ends
+		with an error marker, see the module documentation.
+	"""
+	for start in range(0, len(texts), batch_size):
+		try:
+			embeddings, scales = embed(texts[start : start + batch_size])
+		except Exception as e:  # noqa: BLE001
+			logger.warning(f"Failed to embed the texts from {start}: {e}")
+			error = (json.dumps({"index": start, "error": str(e)}) + "\n").encode()
+			if stream_format == StreamFormat.FRAMES:
+				error = struct.pack("<I", 0) + error
+			yield error
+			return
+		if stream_format == StreamFormat.NDJSON:
+			yield _ndjson(start, embeddings, scales)
+		else:
+			yield _frame(embeddings, scales)
@@ -1,5 +1,27 @@
-from pydantic import BaseModel  # noqa: D100
+from pydantic import BaseModel, Field  # noqa: D100
+
+from .compression import Dtype
+from .streaming import StreamFormat
 
 
 class EmbeddingRequest(BaseModel):  # noqa: D101
 	texts: list[str]
+	# the number of dimensions kept, all of them by default
+	dimension: int | None = Field(default=None, gt=0)
+	# whether the truncated embeddings are normalized again
+	normalize: bool = True
+	dtype: Dtype = Dtype.FLOAT32
+	# whether the embeddings are streamed batch by batch, and in which format
+	stream: StreamFormat | None = None
+
+
+class AddTextsRequest(BaseModel):  # noqa: D101
+	texts: list[str] = Field(min_length=1)
+
+
+class SearchRequest(BaseModel):  # noqa: D101
+	collection: str
+	queries: list[str] = Field(min_length=1)
+	k: int = Field(default=10, gt=0, le=1000)
+	# whether the search is approximate, by default for large collections
+	approximate: bool | None = None
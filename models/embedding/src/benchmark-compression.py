@@ -0,0 +1,108 @@
+"""Compare the retrieval quality and the size of the compact embeddings.
+
+Each caption of the dataset is retrieved from a query made of part of its words,
+among all the captions. For each dimension and dtype, the table reports the
+recall@1 and the MRR of this retrieval, the recall@10 of the float32 full-size
+neighbors, and the size of an embedding. See `API/compression.py` for the
+representations.
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from evaluation import DEFAULT_DATA_DIR, load_captions
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from embedding.API.compression import Dtype, dequantize, quantize, truncate
+from embedding.API.predict import DIMENSION, predict
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Compare the retrieval quality and the size of compact embeddings.",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="directory of the CSV file with the Darija captions, in a `caption` column",
+)
+parser.add_argument(
+	"--num-texts",
+	type=int,
+	default=2000,
+	help="Number of captions, 0 for all of them",
+)
+parser.add_argument(
+	"--query-fraction",
+	type=float,
+	default=0.5,
+	help="Fraction of the words of a caption kept in its query",
+)
+parser.add_argument(
+	"--dimensions",
+	type=int,
+	nargs="+",
+	default=[64, 128, 256, DIMENSION],
+	help="The dimensions to compare",
+)
+args = parser.parse_args()
+
+random.seed(0)
+# each query keeps part of the words of its caption
+captions = load_captions(Path(args.data_dir), args.num_texts, min_words=2)
+
+
+def _query(caption: str) -> str:
+	"""Keep a random part of the words of a caption, in order."""
+	words = caption.split()
+	kept = max(1, round(len(words) * args.query_fraction))
+	return " ".join(words[i] for i in sorted(random.sample(range(len(words)), kept)))
+
+
+logger.info(f"Embedding {len(captions)} captions and their queries")
+documents = predict(captions)
+queries = predict([_query(caption) for caption in captions])
+reference = truncate(documents) @ truncate(queries).T
+reference_neighbors = np.argsort(-reference, axis=0)[:10]
+
+
+def _evaluate(dimension: int, dtype: Dtype) -> dict:
+	"""Evaluate the retrieval with the compact embeddings."""
+	compact = []
+	for embeddings in (documents, queries):
+		values, scales = quantize(truncate(embeddings, dimension), dtype)
+		compact.append(dequantize(values, dtype, scales, dimension))
+	scores = compact[0] @ compact[1].T  # documents x queries
+	target = scores[np.arange(len(captions)), np.arange(len(captions))]
+	ranks = 1 + (scores > target[None]).sum(axis=0)
+	neighbors = np.argsort(-scores, axis=0)[:10]
+	overlap = [
+		len(set(neighbors[:, i]) & set(reference_neighbors[:, i])) / 10
+		for i in range(len(captions))
+	]
+	size = {
+		Dtype.FLOAT32: 4 * dimension,
+		Dtype.FLOAT16: 2 * dimension,
+		Dtype.INT8: dimension + 4,
+		Dtype.BINARY: -(-dimension // 8),
+	}[dtype]
+	return {
+		"dimension": dimension,
+		"dtype": dtype.value,
+		"bytes": size,
+		"recall@1": float((ranks == 1).mean()),
+		"mrr": float((1 / ranks).mean()),
+		"neighbors_recall@10": float(np.mean(overlap)),
+	}
+
+
+results = pd.DataFrame(
+	[_evaluate(dimension, dtype) for dimension in args.dimensions for dtype in Dtype],
+)
+logger.info(f"Retrieval quality versus size:\n{results.to_string(index=False)}")
@@ -0,0 +1,69 @@
+"""Compare the throughput of the embedding model with torch and ONNX Runtime.
+
+The Darija captions are embedded in batches of each size, with the
+SentenceTransformer and with the int8 ONNX graph, see `API/runtime.py`, and the
+table reports the texts embedded per second and the mean latency of a batch.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from evaluation import DEFAULT_DATA_DIR, load_captions
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from embedding.API.runtime import MODEL_NAME, load_model
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Compare the throughput of the embedding model with torch and ONNX.",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="directory of the CSV file with the Darija captions, in a `caption` column",
+)
+parser.add_argument(
+	"--num-texts",
+	type=int,
+	default=512,
+	help="Number of captions, 0 for all of them",
+)
+parser.add_argument(
+	"--batch-sizes",
+	type=int,
+	nargs="+",
+	default=[1, 8, 32, 64],
+	help="The batch sizes to compare",
+)
+args = parser.parse_args()
+
+captions = load_captions(Path(args.data_dir), args.num_texts)
+results = []
+for name, onnx in (("torch", False), ("onnx-int8", True)):
+	model = load_model(MODEL_NAME, onnx=onnx)
+	model.encode(captions[: max(args.batch_sizes)])  # warm up
+	for batch_size in args.batch_sizes:
+		latencies = []
+		for start in range(0, len(captions), batch_size):
+			batch = captions[start : start + batch_size]
+			begin = time.perf_counter()
+			model.encode(batch, batch_size=batch_size)
+			latencies.append(time.perf_counter() - begin)
+		results.append(
+			{
+				"backend": name,
+				"batch_size": batch_size,
+				"texts_per_second": len(captions) / sum(latencies),
+				"mean_batch_latency_ms": 1000 * sum(latencies) / len(latencies),
+			},
+		)
+		logger.info(f"{name}, batch size {batch_size}: {results[-1]}")
+
+results = pd.DataFrame(results)
+logger.info(f"Throughput of the backends:\n{results.to_string(index=False)}")
@@ -0,0 +1,40 @@
+"""Shared helpers of the benchmarks of the embedding model on Darija captions.
+
+The captions are read from the test dataset: exactly one CSV file with a
+`caption` column.
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+from lgg import logger
+
+DEFAULT_DATA_DIR = Path(__file__).parents[3] / "datasets" / "test-dataset"
+
+
+def load_captions(data_dir: Path, num_texts: int = 0, min_words: int = 1) -> list[str]:
+	"""Load the distinct captions of a dataset.
+
+	Args:
+		data_dir (Path): The directory of the dataset.
+		num_texts (int): The number of captions loaded, 0 to load all of them.
+		min_words (int): The minimum number of words of a caption.
+
+	Returns:
+		list[str]: The captions, in the order of the dataset.
+	"""
+	csv_files = list(data_dir.glob("*.csv"))
+	if len(csv_files) != 1:
+		logger.error(f"Expected exactly one CSV file in {data_dir}.")
+		sys.exit(1)
+	captions = pd.read_csv(csv_files[0])["caption"].dropna().astype(str)
+	captions = [
+		caption
+		for caption in captions.drop_duplicates()
+		if len(caption.split()) >= min_words
+	]
+	if num_texts > 0:
+		captions = captions[:num_texts]
+	logger.info(f"Loaded {len(captions)} captions from {data_dir}")
+	return captions
@@ -0,0 +1,31 @@
+"""Export the embedding model to an int8 ONNX graph, for `EMBEDDING_ONNX=1`.
+
+The API exports the graph itself if it is missing, but exporting it ahead of time,
+eg. when building the image, keeps torch out of the startup of the API.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from embedding.API.runtime import MODEL_NAME, export_onnx, onnx_dir
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Export the embedding model to an int8 ONNX graph.",
+)
+parser.add_argument("--model", type=str, default=MODEL_NAME, help="model name")
+parser.add_argument(
+	"--output-dir",
+	type=str,
+	default=None,
+	help="output dir of the graph, `EMBEDDING_ONNX_DIR` by default",
+)
+args = parser.parse_args()
+
+output_dir = Path(args.output_dir) if args.output_dir else onnx_dir(args.model)
+export_onnx(args.model, output_dir)
@@ -0,0 +1,81 @@
+"""Check that the int8 ONNX graph embeds the Darija captions like torch.
+
+Each caption is embedded by the SentenceTransformer and by the ONNX graph, see
+`API/runtime.py`, and the cosine similarity of the two embeddings is reported,
+with the distance between them relative to the norm of the torch embedding, so
+a difference of scale, eg. a normalization, is caught too. The script fails if
+the mean cosine similarity is below `--min-cosine` or the mean relative error
+above `--max-relative-error`, so it can gate a new export.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+from evaluation import DEFAULT_DATA_DIR, load_captions
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from embedding.API.runtime import MODEL_NAME, load_model
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Compare the embeddings of the ONNX graph with torch.",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="directory of the CSV file with the Darija captions, in a `caption` column",
+)
+parser.add_argument(
+	"--num-texts",
+	type=int,
+	default=1000,
+	help="Number of captions, 0 for all of them",
+)
+parser.add_argument(
+	"--min-cosine",
+	type=float,
+	default=0.99,
+	help="The minimum mean cosine similarity of the embeddings",
+)
+parser.add_argument(
+	"--max-relative-error",
+	type=float,
+	default=0.15,
+	help="The maximum mean distance of the embeddings, relative to the torch norm",
+)
+args = parser.parse_args()
+
+captions = load_captions(Path(args.data_dir), args.num_texts)
+embeddings = {
+	name: load_model(MODEL_NAME, onnx=onnx).encode(captions)
+	for name, onnx in (("torch", False), ("onnx", True))
+}
+cosines = np.sum(embeddings["torch"] * embeddings["onnx"], axis=-1) / (
+	np.linalg.norm(embeddings["torch"], axis=-1)
+	* np.linalg.norm(embeddings["onnx"], axis=-1)
+)
+logger.info(
+	f"Cosine similarity of the ONNX and torch embeddings of {len(captions)} "
+	f"captions: mean {cosines.mean():.4f}, p1 {np.percentile(cosines, 1):.4f}, "
+	f"min {cosines.min():.4f}",
+)
+for i in np.argsort(cosines)[:5]:
+	logger.info(f"{cosines[i]:.4f}: {captions[i]}")
+norms = np.linalg.norm(embeddings["torch"], axis=-1)
+errors = np.linalg.norm(embeddings["onnx"] - embeddings["torch"], axis=-1) / norms
+logger.info(
+	f"Distance of the ONNX and torch embeddings, relative to the torch norm: "
+	f"mean {errors.mean():.4f}, max {errors.max():.4f}, ratio of the norms "
+	f"{np.mean(np.linalg.norm(embeddings['onnx'], axis=-1) / norms):.4f}",
+)
+if cosines.mean() < args.min_cosine:
+	logger.error(f"The mean cosine similarity is below {args.min_cosine}.")
+	sys.exit(1)
+if errors.mean() > args.max_relative_error:
+	logger.error(f"The mean relative error is above {args.max_relative_error}.")
+	sys.exit(1)
@@ -1,23 +1,39 @@
 import os  # noqa: D100
+from collections.abc import Iterator
+from typing import Annotated, BinaryIO
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 
 from .predict import Speaker, generate_wav
+from .store import audio_store
 
 router = APIRouter()
 
+# Stored audio never changes for a given hash, so it can be cached forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024  # bytes of audio sent at once
+
 
 class GenerateRequest(BaseModel):  # noqa: D101
 	text: str
 	speaker: Speaker
+	return_url: bool = False
+
+
+class GenerateURLResponse(BaseModel):  # noqa: D101
+	hash: str
+	url: str
 
 
-@router.post("/generate")
-def generate_speech(request: GenerateRequest):  # noqa: ANN201, D103
+@router.post("/generate", response_model=None)
+def generate_speech(request: GenerateRequest) -> FileResponse | GenerateURLResponse:  # noqa: D103
 	try:
 		wav_path = generate_wav(request.text, request.speaker)
+		if request.return_url:
+			digest = audio_store.put(wav_path, "wav")
+			return GenerateURLResponse(hash=digest, url=f"/audio/{digest}.wav")
 		return FileResponse(
 			wav_path,
 			media_type="audio/wav",
@@ -25,3 +41,110 @@ def generate_speech(request: GenerateRequest):  # noqa: ANN201, D103
 		)
 	except Exception as e:  # noqa: BLE001
 		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+
+
+def _parse_range(range_header: str, size: int) -> tuple[int, int]:
+	"""Parse a single-range HTTP Range header.
+
+	Args:
+		range_header (str): The value of the Range header, eg. "bytes=0-1023".
+		size (int): The size of the requested file in bytes.
+
+	Returns:
+		tuple[int, int]: The first and last (inclusive) byte positions.
+
+	Raises:
+		ValueError: If the range is malformed or can't be satisfied.
+	"""
+	unit, _, ranges = range_header.partition("=")
+	if unit.strip() != "bytes" or "," in ranges:
+		msg = f"Unsupported range: {range_header}"
+		raise ValueError(msg)
+	start, _, end = ranges.strip().partition("-")
+	if start:
+		first = int(start)
+		last = min(int(end), size - 1) if end else size - 1
+	else:
+		# suffix range, ie. the last `end` bytes
+		first = max(size - int(end), 0)
+		last = size - 1
+	if first > last or first >= size:
+		msg = f"Unsatisfiable range: {range_header}"
+		raise ValueError(msg)
+	return first, last
+
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+	"""Check an ETag against an If-None-Match header, with a weak comparison."""
+	if if_none_match.strip() == "*":
+		return True
+	tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+	return etag.removeprefix("W/") in tags
+
+
+def _read_file(file: BinaryIO) -> Iterator[bytes]:
+	"""Read an open file by chunks, then close it."""
+	with file:
+		while chunk := file.read(CHUNK_SIZE):
+			yield chunk
+
+
+@router.get("/audio/{name}", response_model=None)
+def get_audio(
+	name: str,
+	range_header: Annotated[str | None, Header(alias="Range")] = None,
+	if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+	"""Serve a generated audio file by its content hash.
+
+	Args:
+		name (str): The name of the file, ie. `{hash}.{ext}`.
+		range_header (str, optional): The HTTP Range header, used for seeking.
+		if_none_match (str, optional): The ETag(s) cached by the client.
+
+	Returns:
+		Response: The audio file, a part of it, or a 304 Not Modified response.
+
+	Raises:
+		HTTPException: 404 if the file isn't stored (anymore), 416 if the requested
+		range can't be satisfied.
+	"""
+	path = audio_store.get(name)
+	if path is None:
+		raise HTTPException(status_code=404, detail=f"Audio {name} not found")
+	etag = f'"{path.stem}"'
+	headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes"}
+	if if_none_match is not None and _etag_matches(etag, if_none_match):
+		return Response(status_code=304, headers=headers)
+	media_type = f"audio/{path.suffix.lstrip('.')}"
+	# opened now, so an eviction from the store can't remove it while it's sent
+	try:
+		file = path.open("rb")
+	except FileNotFoundError:
+		raise HTTPException(status_code=404, detail=f"Audio {name} not found")  # noqa: B904
+	size = os.fstat(file.fileno()).st_size
+	if range_header is None:
+		headers["Content-Length"] = str(size)
+		return StreamingResponse(
+			_read_file(file),
+			media_type=media_type,
+			headers=headers,
+		)
+	with file:
+		try:
+			first, last = _parse_range(range_header, size)
+		except ValueError as e:
+			raise HTTPException(  # noqa: B904
+				status_code=416,
+				detail=str(e),
+				headers={"Content-Range": f"bytes */{size}"},
+			)
+		file.seek(first)
+		content = file.read(last - first + 1)
+	headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+	return Response(
+		content=content,
+		status_code=206,
+		media_type=media_type,
+		headers=headers,
+	)
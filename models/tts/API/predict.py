@@ -1,6 +1,7 @@
 import tempfile  # noqa: D100
 import uuid
 from enum import Enum
+from io import BytesIO
 from pathlib import Path
 
 import torch
@@ -41,6 +42,19 @@ speaker_models = {
 # cache models
 models_cache = {}
 
+# sample rate of the generated audio
+SAMPLE_RATE = 22050
+
+# delimeters used to split the text, and the silence (in ms) added after them
+DELIMETERS = {
+	".": 100,
+	"،": 30,
+	"?": 100,
+	"؟": 100,
+	"!": 100,
+	"\n": 200,
+}
+
 
 def generate_path() -> Path:
 	"""Generate a random wav file path.
@@ -54,15 +68,14 @@ def generate_path() -> Path:
 	return (Path(out_dir) / name).as_posix()
 
 
-def generate_wav(text: str, speaker: Speaker) -> str:
-	"""Generate a wav file from the given text using the specified speaker.
+def load_model(speaker: Speaker) -> FastPitch2Wave:
+	"""Load the model of the given speaker, or get it from the cache.
 
 	Args:
-		text (str): The text to convert to speech.
 		speaker (Speaker): The speaker to use.
 
 	Returns:
-		str: The path to the generated wav file.
+		FastPitch2Wave: The TTS model of the speaker.
 	"""
 	if speaker not in models_cache:
 		if speaker in speaker_models:
@@ -74,8 +87,20 @@ def generate_wav(text: str, speaker: Speaker) -> str:
 		if use_cuda:
 			model = model.cuda()
 		models_cache[speaker] = model
-	else:
-		model = models_cache[speaker]
+	return models_cache[speaker]
+
+
+def synthesize(text: str, speaker: Speaker) -> torch.Tensor:
+	"""Synthesize the waveform of the given text using the specified speaker.
+
+	Args:
+		text (str): The text to convert to speech.
+		speaker (Speaker): The speaker to use.
+
+	Returns:
+		torch.Tensor: The 1D waveform, sampled at `SAMPLE_RATE`.
+	"""
+	model = load_model(speaker)
 	# Split the text into parts based on delimeters
 	texts, silence_durations = split_text(text)
 	# Generate the wav file
@@ -90,15 +115,42 @@ def generate_wav(text: str, speaker: Speaker) -> str:
 		batch_size=8,
 	)
 	# add silence between parts
-	sample_rate = 22050
 	wav = waves[0]
 	for i in range(1, len(waves)):
 		silence_duration = silence_durations[i - 1]
-		silence = torch.zeros(int(silence_duration / 1000 * sample_rate))
+		silence = torch.zeros(int(silence_duration / 1000 * SAMPLE_RATE))
 		wav = torch.cat([wav, silence, waves[i]], dim=0)
+	return wav.cpu()
+
+
+def wav_to_bytes(wav: torch.Tensor) -> bytes:
+	"""Encode a waveform as WAV file content, without touching the disk.
+
+	Args:
+		wav (torch.Tensor): The 1D waveform, sampled at `SAMPLE_RATE`.
+
+	Returns:
+		bytes: The content of the WAV file.
+	"""
+	buf = BytesIO()
+	torchaudio.save(buf, wav.unsqueeze(0), SAMPLE_RATE, format="wav")
+	return buf.getvalue()
+
+
+def generate_wav(text: str, speaker: Speaker) -> str:
+	"""Generate a wav file from the given text using the specified speaker.
+
+	Args:
+		text (str): The text to convert to speech.
+		speaker (Speaker): The speaker to use.
+
+	Returns:
+		str: The path to the generated wav file.
+	"""
+	wav = synthesize(text, speaker)
 	# save the wav to a file
 	wav_path = generate_path()
-	torchaudio.save(wav_path, wav.unsqueeze(0).cpu(), sample_rate)
+	torchaudio.save(wav_path, wav.unsqueeze(0), SAMPLE_RATE)
 	return wav_path
 
 
@@ -112,14 +164,7 @@ def split_text(text: str) -> tuple[list[str], list[int]]:
 		tuple: A tuple containing a list of text parts
 			and a list of silence durations in ms.
 	"""
-	delimeters = {
-		".": 100,
-		"،": 30,
-		"?": 100,
-		"؟": 100,
-		"!": 100,
-		"\n": 200,
-	}
+	delimeters = DELIMETERS
 	# Remove redundant spaces
 	text = " ".join(text.split())
 	# Remove redundant delimeters
@@ -0,0 +1,120 @@
+"""Content-addressed storage of the generated audio files."""
+
+import hashlib
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from os import environ
+from pathlib import Path
+
+from lgg import logger
+
+# Where the audio files are stored and how much disk space they may use
+STORE_DIR = Path(
+	environ.get(
+		"TTS_AUDIO_STORE_DIR",
+		(Path(tempfile.gettempdir()) / "darija-tts-audio").as_posix(),
+	),
+)
+STORE_MAX_BYTES = int(environ.get("TTS_AUDIO_STORE_MAX_MB", "512")) * 1024 * 1024
+
+
+def hash_file(path: str | Path, chunk_size: int = 1 << 16) -> str:
+	"""Compute the SHA-256 digest of a file.
+
+	Args:
+		path (str | Path): The path to the file.
+		chunk_size (int): The number of bytes read at once.
+
+	Returns:
+		str: The hexadecimal digest of the file content.
+	"""
+	digest = hashlib.sha256()
+	with Path(path).open("rb") as f:
+		while chunk := f.read(chunk_size):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class AudioStore:
+	"""A size-capped store of audio files named after the hash of their content.
+
+	Identical audio always maps to the same name, so clients can cache it forever.
+	When the store grows beyond `max_bytes`, the least recently used files are
+	evicted first.
+	"""
+
+	def __init__(self, root: Path, max_bytes: int) -> None:
+		"""Initialize the store and index the files left by a previous run.
+
+		Args:
+			root (Path): The directory where the audio files are stored.
+			max_bytes (int): The maximum total size of the stored files.
+		"""
+		self.root = root
+		self.max_bytes = max_bytes
+		self._lock = threading.Lock()
+		self._files: OrderedDict[str, int] = OrderedDict()  # name -> size in bytes
+		self._total_bytes = 0
+		self.root.mkdir(parents=True, exist_ok=True)
+		for file in sorted(self.root.iterdir(), key=lambda p: p.stat().st_mtime):
+			if file.is_file():
+				self._files[file.name] = file.stat().st_size
+				self._total_bytes += self._files[file.name]
+		self._evict()
+
+	def put(self, path: str | Path, ext: str) -> str:
+		"""Move a file into the store.
+
+		Args:
+			path (str | Path): The path to the file. The file is moved, not copied.
+			ext (str): The extension of the stored file, eg. "wav".
+
+		Returns:
+			str: The content hash identifying the file in the store.
+		"""
+		path = Path(path)
+		digest = hash_file(path)
+		name = f"{digest}.{ext}"
+		with self._lock:
+			if name in self._files:
+				# same content is already stored, keep the existing file
+				path.unlink(missing_ok=True)
+				self._files.move_to_end(name)
+				return digest
+			size = path.stat().st_size
+			shutil.move(path, self.root / name)
+			self._files[name] = size
+			self._total_bytes += size
+			self._evict(keep=name)
+		return digest
+
+	def get(self, name: str) -> Path | None:
+		"""Get the path of a stored file and mark it as recently used.
+
+		Args:
+			name (str): The name of the file, ie. `{hash}.{ext}`.
+
+		Returns:
+			Path | None: The path to the file, or None if it isn't stored.
+		"""
+		with self._lock:
+			if name not in self._files:
+				return None
+			self._files.move_to_end(name)
+			return self.root / name
+
+	def _evict(self, keep: str | None = None) -> None:
+		"""Remove the least recently used files until the size cap is respected."""
+		while self._total_bytes > self.max_bytes and len(self._files) > 1:
+			name, size = next(iter(self._files.items()))
+			if name == keep:
+				break
+			del self._files[name]
+			self._total_bytes -= size
+			(self.root / name).unlink(missing_ok=True)
+			logger.debug(f"Evicted {name} from the audio store.")
+
+
+audio_store = AudioStore(STORE_DIR, STORE_MAX_BYTES)
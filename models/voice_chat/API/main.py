@@ -0,0 +1,56 @@
+"""Main API module for the end-to-end voice chat."""
+
+import json
+from typing import Annotated
+
+from fastapi import APIRouter, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from tts.API.predict import Speaker
+from whisper_asr.API.audio import decode_upload
+from whisper_asr.API.predict import predict as transcribe
+
+from .predict import VoiceChatTurn
+
+router = APIRouter()
+
+
+@router.post("/voice-chat")
+def voice_chat(
+	audio: UploadFile,
+	session_id: Annotated[str, Form()],
+	speaker: Annotated[Speaker, Form()] = Speaker.MALE,
+	prompt: Annotated[str | None, Form()] = None,
+) -> StreamingResponse:
+	"""Transcribe a voice message, then stream the spoken response to it.
+
+	The chat reply is streamed from the chat model and each of its sentences is
+	synthesized as soon as it is complete, while the rest is still generated.
+
+	Args:
+		audio (UploadFile): The voice message of the user.
+		session_id (str): The ID of the chat session, its history is kept server-side.
+		speaker (Speaker): The TTS speaker.
+		prompt (str, optional): The system prompt of the chat model.
+
+	Returns:
+		StreamingResponse: Newline-delimited JSON events: "transcript", one "audio"
+		per sentence (base64 WAV), "reply" and "done" with the timings, in seconds
+		since the request was received, of each stage.
+
+	Raises:
+		HTTPException: If the transcription fails, an HTTPException is raised with
+		status code 500 and the error details.
+	"""
+	turn = VoiceChatTurn(session_id, speaker, prompt)
+	try:
+		transcript = transcribe([decode_upload(audio.file)])[0]
+	except Exception as e:  # noqa: BLE001
+		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+	turn.mark("asr")
+	return StreamingResponse(
+		(
+			json.dumps(event, ensure_ascii=False) + "\n"
+			for event in turn.respond(transcript)
+		),
+		media_type="application/x-ndjson",
+	)
@@ -0,0 +1,209 @@
+"""Run a voice chat turn, overlapping the chat and TTS stages sentence by sentence."""
+
+import base64
+import queue
+import threading
+import time
+from collections.abc import Iterator
+
+import torch
+from chat.API.cache import cache
+from chat.API.predict import clean_text, stream_predict
+from chat.API.sessions import ChatTurn, sessions
+from lgg import logger
+from tts.API.predict import DELIMETERS, SAMPLE_RATE, Speaker, synthesize, wav_to_bytes
+
+# delimeters ending a sentence, each sentence is sent to the TTS model on its own
+SENTENCE_END = {".", "?", "؟", "!", "\n"}
+
+# marks the end of the chat stream in the sentences queue
+_DONE = object()
+
+
+def split_sentences(deltas: Iterator[str]) -> Iterator[tuple[str, str]]:
+	"""Group streamed text deltas into complete sentences.
+
+	Args:
+		deltas (Iterator[str]): The text deltas, as streamed by the chat model.
+
+	Yields:
+		tuple[str, str]: The sentences, stripped, as soon as their ending delimeter
+		is received, and that delimeter, empty for the end of the text. The
+		delimeter is kept apart, since stripping the sentence drops a newline.
+	"""
+	current = ""
+	for delta in deltas:
+		for char in delta:
+			current += char
+			if char in SENTENCE_END:
+				# drop sentences made only of punctuation, eg. the end of "..."
+				if any(c.isalnum() for c in current):
+					yield current.strip(), char
+				current = ""
+	if any(c.isalnum() for c in current):
+		yield current.strip(), ""
+
+
+class VoiceChatTurn:
+	"""A voice chat turn, from the transcript of the user to the spoken reply.
+
+	Attributes:
+		timings (dict[str, float]): The time, in seconds since the turn started,
+			when each stage produced its first (or last) output.
+	"""
+
+	def __init__(self, session_id: str, speaker: Speaker, prompt: str | None) -> None:
+		"""Start a voice chat turn.
+
+		Args:
+			session_id (str): The ID of the chat session.
+			speaker (Speaker): The TTS speaker.
+			prompt (str, optional): The system prompt of the chat model.
+		"""
+		self.session_id = session_id
+		self.speaker = speaker
+		self.prompt = prompt
+		self.start = time.perf_counter()
+		self.timings = {}
+		self.cache_vector = None  # set on a cache miss, to cache the reply
+		self.chat_complete = False  # set once the whole reply is streamed
+
+	def mark(self, stage: str, *, overwrite: bool = False) -> None:
+		"""Record the time when a stage produced its output.
+
+		Args:
+			stage (str): The name of the stage.
+			overwrite (bool): Whether to overwrite a previously recorded time.
+		"""
+		if overwrite or stage not in self.timings:
+			self.timings[stage] = time.perf_counter() - self.start
+
+	def _stream_sentences(
+		self,
+		chat_turn: ChatTurn,
+		sentences: queue.Queue,
+		reply: list[str],
+		usage: dict,
+		stop: threading.Event,
+	) -> None:
+		"""Stream the chat reply and push its sentences to a queue.
+
+		This runs in its own thread so the reply keeps being generated while the
+		previous sentences are synthesized, until `stop` is set.
+		"""
+
+		def deltas() -> Iterator[str]:
+			if cache is not None:
+				cached, vector = cache.lookup(chat_turn.messages, chat_turn.system)
+				if cached is not None:
+					self.mark("chat_first_token")
+					reply.append(cached)
+					yield cached
+					return
+				self.cache_vector = vector
+			for delta in stream_predict(chat_turn.messages, chat_turn.system, usage):
+				if stop.is_set():
+					return
+				self.mark("chat_first_token")
+				reply.append(delta)
+				yield delta
+
+		try:
+			for sentence in split_sentences(deltas()):
+				self.mark("first_sentence")
+				sentences.put(sentence)
+			if stop.is_set():
+				return
+			self.mark("chat", overwrite=True)
+			self.chat_complete = True
+		except Exception as e:  # noqa: BLE001
+			sentences.put(e)
+		finally:
+			sentences.put(_DONE)
+
+	def _end_turn(self, chat_turn: ChatTurn, reply: list[str], usage: dict) -> str:
+		"""Record the turn in its session and cache the reply, if it is complete.
+
+		A reply cut short, by a failure or by the client leaving, isn't recorded, so
+		the history of the session is left as it was before the turn.
+
+		Returns:
+			str: The reply, as recorded.
+		"""
+		text = clean_text("".join(reply))
+		if not self.chat_complete:
+			logger.info(f"Voice chat turn of session {self.session_id} aborted")
+			return text
+		if self.cache_vector is not None:
+			cache.insert(chat_turn.messages, chat_turn.system, self.cache_vector, text)
+		sessions.end_turn(chat_turn, text, usage)
+		return text
+
+	def respond(self, transcript: str) -> Iterator[dict]:
+		"""Respond to the transcribed voice message with text and speech.
+
+		The turn is recorded in the session only once its whole reply is generated.
+		If its speech fails or the client leaves first, the chat stream is stopped
+		and the turn is aborted, see `_end_turn`.
+
+		Args:
+			transcript (str): The transcription of the user's voice message.
+
+		Yields:
+			dict: The events of the turn: "transcript", one "audio" per sentence,
+			"reply" and finally "done" with the timings of each stage.
+		"""
+		yield {"event": "transcript", "text": transcript}
+		if not transcript.strip():
+			yield {"event": "done", "timings": self.timings}
+			return
+		chat_turn = sessions.start_turn(
+			self.session_id,
+			[{"role": "user", "content": transcript}],
+			self.prompt,
+		)
+		sentences = queue.Queue()
+		reply = []
+		usage = {}
+		# stops the chat stream once the turn ends early
+		stop = threading.Event()
+		threading.Thread(
+			target=self._stream_sentences,
+			args=(chat_turn, sentences, reply, usage, stop),
+			daemon=True,
+		).start()
+		tts_time = 0.0
+		index = 0
+		try:
+			while (item := sentences.get()) is not _DONE:
+				tts_start = time.perf_counter()
+				try:
+					if isinstance(item, Exception):
+						raise item  # noqa: TRY301
+					sentence, delimeter = item
+					wav = synthesize(sentence, self.speaker)
+				except Exception as e:  # noqa: BLE001
+					logger.error(f"Voice chat of session {self.session_id} failed: {e}")
+					yield {"event": "error", "detail": str(e)}
+					return
+				# add the pause following the sentence, as sentences are played in a row
+				pause = DELIMETERS.get(delimeter, 0)
+				wav = torch.cat([wav, torch.zeros(int(pause / 1000 * SAMPLE_RATE))])
+				audio = base64.b64encode(wav_to_bytes(wav)).decode()
+				tts_time += time.perf_counter() - tts_start
+				self.mark("first_audio")
+				yield {
+					"event": "audio",
+					"index": index,
+					"text": sentence,
+					"audio": audio,
+				}
+				index += 1
+		finally:
+			stop.set()
+			reply = self._end_turn(chat_turn, reply, usage)
+		self.timings["tts"] = tts_time
+		self.mark("total")
+		logger.info(f"Voice chat turn of session {self.session_id}: {self.timings}")
+		yield {"event": "reply", "text": reply}
+		yield {"event": "done", "timings": self.timings}
@@ -0,0 +1,206 @@
+"""Decode the uploaded audio files in memory, without temporary files.
+
+The compressed bytes are piped to ffmpeg, which decodes any format it supports
+(wav, mp3, ogg/opus, webm, flac, ...) into 16 kHz mono float samples. The upload
+is fed by chunks from a thread while the samples are read, so the compressed file
+never has to sit in memory as a whole. A multipart upload is still spooled by the
+server before the endpoint runs, to disk past 1 MB, while a raw request body is
+piped to ffmpeg as it is received, see `decode_stream`.
+"""
+
+import asyncio
+import subprocess
+import threading
+from collections.abc import AsyncIterator, Iterable, Iterator
+from typing import BinaryIO
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+CHUNK_SIZE = 1 << 20  # bytes read from the upload at once
+# Frames on which the energy is computed: 25 ms, every 10 ms
+FRAME_LENGTH = 400
+HOP_LENGTH = 160
+# Number of frames whose energy is computed at once, to bound the memory used
+ENERGY_BLOCK_FRAMES = 6000
+
+FFMPEG_COMMAND = [
+	"ffmpeg",
+	"-nostdin",
+	"-hide_banner",
+	"-loglevel",
+	"error",
+	"-i",
+	"pipe:0",
+	"-f",
+	"f32le",
+	"-ac",
+	"1",
+	"-ar",
+	str(SAMPLE_RATE),
+	"pipe:1",
+]
+
+
+def read_chunks(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+	"""Read a file by chunks.
+
+	Args:
+		file (BinaryIO): The file, eg. the `file` attribute of an `UploadFile`.
+		chunk_size (int): The maximum size of a chunk, in bytes.
+
+	Yields:
+		bytes: The chunks of the file.
+	"""
+	while chunk := file.read(chunk_size):
+		yield chunk
+
+
+def _feed(stdin: BinaryIO, chunks: Iterable[bytes], errors: list) -> None:
+	"""Write the chunks to the stdin of ffmpeg, then close it."""
+	try:
+		for chunk in chunks:
+			stdin.write(chunk)
+	except BrokenPipeError:
+		pass  # ffmpeg stopped early, its error is reported on stderr
+	except Exception as e:  # noqa: BLE001
+		errors.append(e)
+	finally:
+		stdin.close()
+
+
+def decode_audio(chunks: Iterable[bytes]) -> np.ndarray:
+	"""Decode a compressed audio into 16 kHz mono samples.
+
+	Args:
+		chunks (Iterable[bytes]): The bytes of the audio file, by chunks.
+
+	Returns:
+		np.ndarray: The float32 samples, in [-1, 1].
+
+	Raises:
+		ValueError: If ffmpeg fails to decode the audio.
+	"""
+	process = subprocess.Popen(  # noqa: S603
+		FFMPEG_COMMAND,
+		stdin=subprocess.PIPE,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+	)
+	errors, stderr = [], []
+	threads = [
+		threading.Thread(target=_feed, args=(process.stdin, chunks, errors)),
+		threading.Thread(target=lambda: stderr.append(process.stderr.read())),
+	]
+	for thread in threads:
+		thread.start()
+	# read the samples while the upload is fed, so no pipe fills up
+	samples = process.stdout.read()
+	process.wait()
+	for thread in threads:
+		thread.join()
+	if errors:
+		raise errors[0]
+	_check_decoded(process.returncode, b"".join(stderr))
+	return np.frombuffer(samples, dtype=np.float32)
+
+
+def _check_decoded(returncode: int, stderr: bytes) -> None:
+	"""Raise the error of ffmpeg if it failed to decode the audio."""
+	if returncode != 0:
+		stderr = stderr.decode(errors="replace").strip()
+		msg = f"Failed to decode the audio: {stderr}"
+		raise ValueError(msg)
+
+
+async def decode_stream(chunks: AsyncIterator[bytes]) -> np.ndarray:
+	"""Decode a compressed audio into 16 kHz mono samples, as it is received.
+
+	Args:
+		chunks (AsyncIterator[bytes]): The bytes of the audio file, by chunks, eg.
+			`Request.stream()`.
+
+	Returns:
+		np.ndarray: The float32 samples, in [-1, 1].
+
+	Raises:
+		ValueError: If ffmpeg fails to decode the audio.
+	"""
+	process = await asyncio.create_subprocess_exec(
+		*FFMPEG_COMMAND,
+		stdin=subprocess.PIPE,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+	)
+
+	async def feed() -> None:
+		try:
+			async for chunk in chunks:
+				process.stdin.write(chunk)
+				await process.stdin.drain()
+		except (BrokenPipeError, ConnectionResetError):
+			pass  # ffmpeg stopped early, its error is reported on stderr
+		finally:
+			process.stdin.close()
+
+	# read the samples while the body is fed, so no pipe fills up
+	try:
+		_, samples, stderr = await asyncio.gather(
+			feed(),
+			process.stdout.read(),
+			process.stderr.read(),
+		)
+	except BaseException:
+		# eg. the client left, ffmpeg won't receive the rest of the audio
+		process.kill()
+		await process.wait()
+		raise
+	await process.wait()
+	_check_decoded(process.returncode, stderr)
+	return np.frombuffer(samples, dtype=np.float32)
+
+
+def decode_upload(file: BinaryIO) -> np.ndarray:
+	"""Decode an uploaded audio file into 16 kHz mono samples.
+
+	Args:
+		file (BinaryIO): The file, eg. the `file` attribute of an `UploadFile`.
+
+	Returns:
+		np.ndarray: The float32 samples, in [-1, 1].
+	"""
+	return decode_audio(read_chunks(file))
+
+
+def frame_energy(
+	audio: np.ndarray,
+	frame_length: int = FRAME_LENGTH,
+	hop_length: int = HOP_LENGTH,
+) -> np.ndarray:
+	"""Compute the RMS energy of the frames of an audio.
+
+	Args:
+		audio (np.ndarray): The samples of the audio.
+		frame_length (int): The number of samples of a frame.
+		hop_length (int): The number of samples between two frames.
+
+	Returns:
+		np.ndarray: The energy of each frame, in dB relative to full scale.
+	"""
+	if len(audio) < frame_length:
+		audio = np.pad(audio, (0, frame_length - len(audio)))
+	starts = np.arange(0, len(audio) - frame_length + 1, hop_length)
+	power = np.empty(len(starts))
+	# the sum of the squares of a frame is a difference of their cumulative sums,
+	# computed block by block, so the memory used doesn't grow with the audio
+	for first in range(0, len(starts), ENERGY_BLOCK_FRAMES):
+		offsets = starts[first : first + ENERGY_BLOCK_FRAMES]
+		segment = audio[offsets[0] : offsets[-1] + frame_length]
+		sums = np.zeros(len(segment) + 1)
+		np.cumsum(np.square(segment, dtype=np.float64), out=sums[1:])
+		offsets = offsets - offsets[0]
+		power[first : first + len(offsets)] = (
+			sums[offsets + frame_length] - sums[offsets]
+		) / frame_length
+	rms = np.sqrt(np.maximum(power, 0))
+	return (20 * np.log10(rms + 1e-10)).astype(np.float32)
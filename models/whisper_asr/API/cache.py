@@ -0,0 +1,88 @@
+"""Cache of the transcriptions, keyed on the decoded audio.
+
+The key hashes the decoded samples, so the same audio sent in another container
+or with other metadata is still a hit, together with the model and the settings
+of the transcription, including a fingerprint of the weights of the checkpoint,
+so a retrained checkpoint doesn't serve stale transcriptions. The transcriptions
+are kept in memory and optionally on disk, see `common.cache.TieredCache`.
+"""
+
+import hashlib
+from os import environ
+from pathlib import Path
+
+import numpy as np
+from common.cache import TieredCache
+
+ENABLED = environ.get("ASR_CACHE_ENABLED", "1") == "1"
+MEMORY_MAX_BYTES = int(environ.get("ASR_CACHE_MEMORY_MAX_MB", "16")) * 1024 * 1024
+# Where the transcriptions are stored on disk, empty to keep them in memory only
+DISK_DIR = environ.get("ASR_CACHE_DIR", "")
+DISK_MAX_BYTES = int(environ.get("ASR_CACHE_DISK_MAX_MB", "128")) * 1024 * 1024
+
+
+def fingerprint(audio: np.ndarray, *settings: str) -> str:
+	"""Compute the cache key of the transcription of an audio.
+
+	Args:
+		audio (np.ndarray): The decoded samples of the audio.
+		*settings (str): The model and the settings of the transcription.
+
+	Returns:
+		str: The hexadecimal SHA-256 digest of the samples and the settings.
+	"""
+	digest = hashlib.sha256("\0".join(settings).encode())
+	digest.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+	return digest.hexdigest()
+
+
+def weights_fingerprint(checkpoint: Path | str) -> str:
+	"""Fingerprint the weights of a checkpoint, for the cache keys.
+
+	Args:
+		checkpoint (Path | str): The directory or the name of the checkpoint.
+
+	Returns:
+		str: For a directory, the SHA-256 digest of the names, sizes and
+		modification times of its files, so it changes when the checkpoint is
+		written again. Else, the name of the checkpoint.
+	"""
+	path = Path(checkpoint)
+	if not path.is_dir():
+		return str(checkpoint)
+	digest = hashlib.sha256()
+	# the model is loaded from the files at the top of the directory
+	for file in sorted(path.iterdir()):
+		if file.is_file():
+			stat = file.stat()
+			digest.update(f"{file.name}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+	return f"{path.as_posix()}@{digest.hexdigest()}"
+
+
+class TranscriptionCache(TieredCache):
+	"""A two-tier, size-capped cache of transcriptions, one text file each."""
+
+	suffix = ".txt"
+
+	def size(self, value: str) -> int:
+		"""Get the size of a transcription, in bytes."""
+		return len(value.encode())
+
+	def write(self, path: Path, value: str) -> None:
+		"""Write a transcription to a file."""
+		path.write_text(value, encoding="utf-8")
+
+	def read(self, path: Path) -> str:
+		"""Read a transcription from a file."""
+		return path.read_text(encoding="utf-8")
+
+
+def _load_cache() -> TranscriptionCache | None:
+	"""Load the cache, if it is enabled."""
+	if not ENABLED:
+		return None
+	disk_dir = Path(DISK_DIR) if DISK_DIR else None
+	return TranscriptionCache(MEMORY_MAX_BYTES, disk_dir, DISK_MAX_BYTES)
+
+
+cache = _load_cache()
@@ -0,0 +1,186 @@
+"""Transcribe with a small model first, and with Whisper only when it is unsure.
+
+Most utterances are short and easy, so the small model transcribes them well.
+The confidence of each of its transcriptions is the geometric mean of the
+probabilities of its tokens, and only the clips below `ASR_CASCADE_THRESHOLD`
+are transcribed again by the fine-tuned Whisper checkpoint.
+
+The small model is either the Wav2Vec2 CTC model of `using_wav2vec`, or a smaller
+Whisper checkpoint, eg. one distilled from the fine-tuned checkpoint.
+"""
+
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from functools import partial
+from os import environ
+
+import numpy as np
+import torch
+from lgg import logger
+from transformers.pipelines import AutomaticSpeechRecognitionPipeline
+
+from .audio import SAMPLE_RATE
+from .profiles import PROFILES
+from .runtime import load_model
+
+ENABLED = environ.get("ASR_CASCADE", "0") == "1"
+# The small model: `wav2vec`, or the path or the name of a Whisper checkpoint
+SMALL_MODEL = environ.get("ASR_CASCADE_MODEL", "wav2vec")
+# Confidence below which a clip is transcribed again by Whisper
+THRESHOLD = float(environ.get("ASR_CASCADE_THRESHOLD", "0.8"))
+# Number of recent batches the statistics are computed on
+STATS_WINDOW = 1000
+
+Tier = Callable[[list[np.ndarray]], tuple[list[str], list[float]]]
+
+
+def whisper_with_confidence(
+	model: AutomaticSpeechRecognitionPipeline,
+	audios: list[np.ndarray],
+	profile: str = "greedy",
+) -> tuple[list[str], list[float]]:
+	"""Transcribe a batch of clips with Whisper, with their confidences.
+
+	Args:
+		model (AutomaticSpeechRecognitionPipeline): The Whisper pipeline.
+		audios (list[np.ndarray]): The 16 kHz mono samples of the clips.
+		profile (str): The name of the generation profile, decoded greedily so
+			the scores follow the transcription.
+
+	Returns:
+		tuple[list[str], list[float]]: The transcriptions, and the geometric mean
+		of the probabilities of their tokens.
+	"""
+	features = model.feature_extractor(
+		audios,
+		sampling_rate=SAMPLE_RATE,
+		return_tensors="pt",
+	).input_features
+	if isinstance(model.model, torch.nn.Module):
+		features = features.to(model.device, dtype=model.model.dtype)
+	kwargs = PROFILES[profile].generate_kwargs() | {"num_beams": 1}
+	with torch.inference_mode():
+		outputs = model.model.generate(
+			features,
+			return_dict_in_generate=True,
+			output_scores=True,
+			**kwargs,
+		)
+		log_probs = model.model.compute_transition_scores(
+			outputs.sequences,
+			outputs.scores,
+			normalize_logits=True,
+		)
+	generated = outputs.sequences[:, -log_probs.shape[1] :]
+	# the end of the transcription is padded with the end-of-text token
+	spoken = generated != model.model.generation_config.pad_token_id
+	mean_log_probs = (log_probs.float() * spoken).sum(dim=-1)
+	mean_log_probs /= spoken.sum(dim=-1).clamp(min=1)
+	confidences = torch.where(spoken.any(dim=-1), mean_log_probs.exp(), 0)
+	texts = model.tokenizer.batch_decode(outputs.sequences, skip_special_tokens=True)
+	return texts, confidences.tolist()
+
+
+def load_small_model(name: str = SMALL_MODEL) -> Tier:
+	"""Load the small model of the cascade.
+
+	`using_wav2vec` loads its model when it is imported, so only if it is used.
+
+	Args:
+		name (str): `wav2vec`, or the path or the name of a Whisper checkpoint.
+
+	Returns:
+		Tier: Transcribes a batch of clips, with the confidences of the
+		transcriptions.
+	"""
+	if name == "wav2vec":
+		from .using_wav2vec import transcribe_with_confidence
+
+		return transcribe_with_confidence
+	return partial(whisper_with_confidence, load_model(name))
+
+
+class Cascade:
+	"""Transcribe with a small model, escalating the unsure clips to Whisper."""
+
+	def __init__(
+		self,
+		small: Tier,
+		large: Callable[[list[np.ndarray], str], list[str]],
+		threshold: float = THRESHOLD,
+	) -> None:
+		"""Initialize the cascade.
+
+		Args:
+			small (Tier): Transcribes a batch of clips, with their confidences.
+			large (Callable): Transcribes a batch of clips with a profile.
+			threshold (float): The confidence below which a clip is escalated.
+		"""
+		self.small = small
+		self.large = large
+		self.threshold = threshold
+		self._lock = threading.Lock()
+		self._clips = 0
+		self._escalated = 0
+		self._small_latencies = deque(maxlen=STATS_WINDOW)
+		self._large_latencies = deque(maxlen=STATS_WINDOW)
+
+	def transcribe(self, audios: list[np.ndarray], profile: str) -> list[str]:
+		"""Transcribe a batch of clips.
+
+		Args:
+			audios (list[np.ndarray]): The 16 kHz mono samples of the clips.
+			profile (str): The generation profile of Whisper, the small model
+				decodes greedily.
+
+		Returns:
+			list[str]: The transcriptions of the clips.
+		"""
+		start = time.perf_counter()
+		texts, confidences = self.small(audios)
+		small_latency = time.perf_counter() - start
+		escalated = [
+			i for i, confidence in enumerate(confidences) if confidence < self.threshold
+		]
+		large_latency = None
+		if escalated:
+			start = time.perf_counter()
+			large_texts = self.large([audios[i] for i in escalated], profile)
+			large_latency = time.perf_counter() - start
+			for i, text in zip(escalated, large_texts, strict=True):
+				texts[i] = text
+		logger.debug(f"Escalated {len(escalated)} of {len(audios)} clips to Whisper")
+		with self._lock:
+			self._clips += len(audios)
+			self._escalated += len(escalated)
+			self._small_latencies.append(small_latency)
+			if large_latency is not None:
+				self._large_latencies.append(large_latency)
+		return texts
+
+	def stats(self) -> dict:
+		"""Get the escalation rate and the latencies of the cascade.
+
+		Returns:
+			dict: The threshold, the numbers of clips transcribed and escalated, the
+			escalation rate, and the mean latencies, in milliseconds, of a batch of
+			the small model and of an escalated batch of Whisper.
+		"""
+		with self._lock:
+			clips, escalated = self._clips, self._escalated
+			stats = {
+				"threshold": self.threshold,
+				"clips": clips,
+				"escalated": escalated,
+				"escalation_rate": escalated / clips if clips else 0.0,
+			}
+			latencies = {
+				"small": list(self._small_latencies),
+				"large": list(self._large_latencies),
+			}
+		for name, values in latencies.items():
+			if values:
+				stats[f"mean_{name}_latency_ms"] = float(np.mean(values)) * 1000
+		return stats
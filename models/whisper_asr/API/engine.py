@@ -0,0 +1,102 @@
+"""Transcribe batches with Whisper, without the overhead of `transformers.pipeline`.
+
+The pipeline preprocesses each clip on its own, in numpy, and goes through a
+dataloader and a postprocessing step. The engine computes the log-mel features
+of a whole batch at once with a torch STFT, on the device of the model, from
+buffers allocated once and reused across batches, then calls `generate` directly.
+"""
+
+import numpy as np
+import torch
+from transformers.pipelines import AutomaticSpeechRecognitionPipeline
+
+
+class WhisperEngine:
+	"""Transcribe batches of clips of at most 30 s with Whisper.
+
+	The buffers are shared across batches, so an engine must only be used by one
+	thread at a time, eg. the worker of a `BatchScheduler`.
+	"""
+
+	def __init__(
+		self,
+		model: AutomaticSpeechRecognitionPipeline,
+		dtype: torch.dtype,
+		max_batch_size: int = 8,
+	) -> None:
+		"""Initialize the engine and allocate its buffers.
+
+		Args:
+			model (AutomaticSpeechRecognitionPipeline): The Whisper pipeline, whose
+				model, tokenizer, and feature extractor settings and mel filters are
+				used.
+			dtype (torch.dtype): The dtype of the input features of the model.
+			max_batch_size (int): The largest expected batch, the buffers grow if
+				a larger batch is transcribed.
+		"""
+		self.model = model.model
+		self.tokenizer = model.tokenizer
+		self.device = model.device
+		self.dtype = dtype
+		feature_extractor = model.feature_extractor
+		self.n_fft = feature_extractor.n_fft
+		self.hop_length = feature_extractor.hop_length
+		self.n_samples = feature_extractor.n_samples
+		self.window = torch.hann_window(self.n_fft, device=self.device)
+		self.mel_filters = torch.from_numpy(
+			np.asarray(feature_extractor.mel_filters, dtype=np.float32),
+		).T.to(self.device)
+		self._allocate(max_batch_size)
+
+	def _allocate(self, batch_size: int) -> None:
+		"""Allocate the buffers of the padded audios, on the host and the device."""
+		pin_memory = self.device.type == "cuda"
+		self._host = torch.zeros(batch_size, self.n_samples, pin_memory=pin_memory)
+		self._audio = torch.zeros(batch_size, self.n_samples, device=self.device)
+
+	def features(self, audios: list[np.ndarray]) -> torch.Tensor:
+		"""Compute the log-mel features of a batch, like `WhisperFeatureExtractor`.
+
+		Args:
+			audios (list[np.ndarray]): The 16 kHz mono samples of the clips, of at
+				most 30 s, longer clips are truncated.
+
+		Returns:
+			torch.Tensor: The features of the clips, padded to 30 s, on the device
+			of the model.
+		"""
+		if len(audios) > len(self._host):
+			self._allocate(len(audios))
+		host = self._host[: len(audios)]
+		host.zero_()
+		for row, clip in zip(host, audios, strict=True):
+			samples = np.asarray(clip[: self.n_samples], dtype=np.float32)
+			row[: len(samples)] = torch.from_numpy(samples)
+		audio = self._audio[: len(audios)]
+		audio.copy_(host, non_blocking=True)
+		stft = torch.stft(
+			audio,
+			self.n_fft,
+			self.hop_length,
+			window=self.window,
+			return_complex=True,
+		)
+		magnitudes = stft[..., :-1].abs() ** 2
+		log_spec = torch.clamp(self.mel_filters @ magnitudes, min=1e-10).log10()
+		# the dynamic range of each clip is limited to 80 dB
+		log_spec = torch.maximum(log_spec, log_spec.amax(dim=(1, 2), keepdim=True) - 8)
+		return ((log_spec + 4) / 4).to(self.dtype)
+
+	def transcribe(self, audios: list[np.ndarray], generate_kwargs: dict) -> list[str]:
+		"""Transcribe a batch of clips in one forward pass.
+
+		Args:
+			audios (list[np.ndarray]): The 16 kHz mono samples of the clips.
+			generate_kwargs (dict): The generation settings, see `profiles`.
+
+		Returns:
+			list[str]: The transcriptions of the clips.
+		"""
+		with torch.inference_mode():
+			tokens = self.model.generate(self.features(audios), **generate_kwargs)
+		return self.tokenizer.batch_decode(tokens, skip_special_tokens=True)
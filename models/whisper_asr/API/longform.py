@@ -0,0 +1,175 @@
+"""Split long recordings into chunks Whisper can transcribe, and merge them back.
+
+Whisper only sees 30 s windows. Long recordings are either cut at the quietest
+point before each 30 s boundary, so no word is cut, or split into overlapping
+chunks, whose transcriptions are merged on the words they share.
+"""
+
+import math
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from enum import Enum
+
+import numpy as np
+
+from .audio import HOP_LENGTH, SAMPLE_RATE, frame_energy
+
+CHUNK_SECONDS = 30
+# Window before the chunk boundary where the quietest point is looked for
+SEARCH_SECONDS = 5
+# Overlap between two consecutive chunks, when splitting with strides
+OVERLAP_SECONDS = 5
+# Minimum number of words two overlapping transcriptions are merged on, so they
+# aren't merged on a single common word, eg. "و"
+MIN_MATCH_WORDS = 2
+
+
+class Strategy(str, Enum):
+	"""How a long recording is split into chunks."""
+
+	SILENCE = "silence"
+	STRIDE = "stride"
+
+
+@dataclass
+class Chunk:
+	"""A chunk of a recording, with its bounds in samples."""
+
+	start: int
+	end: int
+	text: str | None = None
+
+	def to_dict(self) -> dict:
+		"""Get the bounds, in seconds, and the transcription of the chunk."""
+		return {
+			"start": self.start / SAMPLE_RATE,
+			"end": self.end / SAMPLE_RATE,
+			"text": self.text,
+		}
+
+
+def split_at_silences(
+	audio: np.ndarray,
+	chunk_seconds: float = CHUNK_SECONDS,
+	search_seconds: float = SEARCH_SECONDS,
+) -> list[Chunk]:
+	"""Split an audio at its quietest points before each chunk boundary.
+
+	Args:
+		audio (np.ndarray): The 16 kHz samples of the audio.
+		chunk_seconds (float): The maximum duration of a chunk.
+		search_seconds (float): The duration of the window, before the boundary,
+			where the quietest point is looked for.
+
+	Returns:
+		list[Chunk]: The consecutive chunks of the audio.
+	"""
+	chunk_length = int(chunk_seconds * SAMPLE_RATE)
+	search_length = int(search_seconds * SAMPLE_RATE)
+	energy = frame_energy(audio)
+	chunks, start = [], 0
+	while len(audio) - start > chunk_length:
+		first = (start + chunk_length - search_length) // HOP_LENGTH
+		last = (start + chunk_length) // HOP_LENGTH - 1  # the frame fits the chunk
+		quietest = first + int(np.argmin(energy[first:last]))
+		end = quietest * HOP_LENGTH
+		chunks.append(Chunk(start, end))
+		start = end
+	chunks.append(Chunk(start, len(audio)))
+	return chunks
+
+
+def split_with_strides(
+	audio: np.ndarray,
+	chunk_seconds: float = CHUNK_SECONDS,
+	overlap_seconds: float = OVERLAP_SECONDS,
+) -> list[Chunk]:
+	"""Split an audio into overlapping chunks.
+
+	Args:
+		audio (np.ndarray): The 16 kHz samples of the audio.
+		chunk_seconds (float): The duration of a chunk.
+		overlap_seconds (float): The overlap between two consecutive chunks.
+
+	Returns:
+		list[Chunk]: The overlapping chunks of the audio.
+	"""
+	chunk_length = int(chunk_seconds * SAMPLE_RATE)
+	stride = chunk_length - int(overlap_seconds * SAMPLE_RATE)
+	chunks = [Chunk(0, min(chunk_length, len(audio)))]
+	while chunks[-1].end < len(audio):
+		start = chunks[-1].start + stride
+		chunks.append(Chunk(start, min(start + chunk_length, len(audio))))
+	return chunks
+
+
+def split(audio: np.ndarray, strategy: Strategy) -> list[Chunk]:
+	"""Split an audio into chunks with the given strategy.
+
+	Args:
+		audio (np.ndarray): The 16 kHz samples of the audio.
+		strategy (Strategy): How the audio is split.
+
+	Returns:
+		list[Chunk]: The chunks of the audio.
+	"""
+	if strategy == Strategy.STRIDE:
+		return split_with_strides(audio)
+	return split_at_silences(audio)
+
+
+def merge_overlapping(
+	texts: list[str],
+	chunk_seconds: float = CHUNK_SECONDS,
+	overlap_seconds: float = OVERLAP_SECONDS,
+) -> str:
+	"""Merge the transcriptions of overlapping chunks.
+
+	The overlap is only looked for in the words the previous chunk spoke in its
+	last `overlap_seconds`, and the first ones of the next chunk, twice as many
+	to allow for a change of pace. The longest run of words both share, of at
+	least `MIN_MATCH_WORDS`, is kept once: the words of the previous chunk after
+	it and of the next chunk before it are dropped, since the words cut by the
+	chunk boundaries are the least reliable. Without such a run, both are kept.
+
+	Args:
+		texts (list[str]): The transcriptions of the consecutive chunks.
+		chunk_seconds (float): The duration of a chunk.
+		overlap_seconds (float): The overlap between two consecutive chunks.
+
+	Returns:
+		str: The transcription of the whole audio.
+	"""
+	words, previous = [], 0
+	for text in texts:
+		new_words = text.split()
+		window = 2 * math.ceil(previous * overlap_seconds / chunk_seconds)
+		start = max(len(words) - window, 0)
+		match = SequenceMatcher(
+			None,
+			words[start:],
+			new_words[:window],
+			autojunk=False,
+		).find_longest_match()
+		if match.size >= MIN_MATCH_WORDS:
+			del words[start + match.a + match.size :]
+			new_words = new_words[match.b + match.size :]
+		words.extend(new_words)
+		previous = len(text.split())
+	return " ".join(words)
+
+
+def merge(chunks: list[Chunk], strategy: Strategy) -> str:
+	"""Merge the transcriptions of the chunks split with the given strategy.
+
+	Args:
+		chunks (list[Chunk]): The transcribed chunks.
+		strategy (Strategy): How the audio was split.
+
+	Returns:
+		str: The transcription of the whole audio.
+	"""
+	texts = [chunk.text for chunk in chunks]
+	if strategy == Strategy.STRIDE:
+		return merge_overlapping(texts)
+	return " ".join(text.strip() for text in texts if text.strip())
@@ -1,34 +1,224 @@
 """Main API module for the Whisper ASR."""
 
-from fastapi import APIRouter, HTTPException, UploadFile
+import asyncio
+from typing import Annotated
 
-from .predict import generate_random_path, predict
+import numpy as np
+from fastapi import (
+	APIRouter,
+	Form,
+	HTTPException,
+	Request,
+	UploadFile,
+	WebSocket,
+	WebSocketDisconnect,
+)
+
+from .audio import decode_stream, decode_upload
+from .cache import cache
+from .longform import Strategy
+from .predict import (
+	Backend,
+	cascade,
+	predict,
+	predict_long,
+	scheduler,
+	schedulers,
+)
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .streaming import StreamingSession, stream_stats
+from .vad import trim_stats
 
 router = APIRouter()
 
 
+def _check_profile(profile: str) -> None:
+	"""Reject an unknown generation profile, with a status code of 422."""
+	if profile not in PROFILES:
+		detail = f"Unknown profile {profile!r}, expected one of {list(PROFILES)}."
+		raise HTTPException(status_code=422, detail=detail)
+
+
+def _check_backend(backend: Backend) -> None:
+	"""Reject a backend that isn't loaded, with a status code of 422."""
+	if backend not in schedulers:
+		detail = f"The {backend.value} backend isn't enabled."
+		raise HTTPException(status_code=422, detail=detail)
+
+
 @router.post("/transcribe")
-def transcribe_audio(files: list[UploadFile]) -> list[str]:
+def transcribe_audio(
+	files: list[UploadFile],
+	profile: Annotated[str, Form()] = DEFAULT_PROFILE,
+	backend: Annotated[Backend, Form()] = Backend.WHISPER,
+) -> list[str]:
 	"""Transcribes the given audio file(s) using a pre-trained model.
 
+	Any audio format supported by ffmpeg is accepted, eg. wav, mp3, ogg or webm.
+	The `wav2vec` backend, a CTC model, is faster than Whisper but less accurate.
+
 	Args:
 		files (list[UploadFile]): A list of audio files to be transcribed.
+		profile (str): The generation profile, eg. `fast` or `accurate`.
+		backend (Backend): The model transcribing the audios.
 
 	Returns:
 		list: A list containing the transcription of the audio file(s).
 
 	Raises:
-		HTTPException: If an error occurs during the transcription process,
+		HTTPException: If the profile is unknown or the backend isn't enabled, an
+		HTTPException is raised with a status code of 422. If an error occurs
+		during the transcription process, an HTTPException is raised with a status
+		code of 500 and the error details.
+	"""
+	_check_profile(profile)
+	_check_backend(backend)
+	try:
+		# decode the files in memory
+		audios = [decode_upload(file.file) for file in files]
+		return predict(audios, profile, backend)
+	except Exception as e:  # noqa: BLE001
+		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+
+
+@router.post("/transcribe/long")
+def transcribe_long_audio(
+	file: UploadFile,
+	strategy: Annotated[Strategy, Form()] = Strategy.SILENCE,
+	profile: Annotated[str, Form()] = DEFAULT_PROFILE,
+) -> dict:
+	"""Transcribes a long recording, eg. a voice note or an interview.
+
+	The recording is split into chunks of at most 30 s, which are transcribed in
+	batches. With the `silence` strategy, the chunks are cut at the quietest
+	points, with the `stride` strategy, they overlap by 5 s and their
+	transcriptions are merged on the overlaps.
+
+	Args:
+		file (UploadFile): The audio file to be transcribed.
+		strategy (Strategy): How the recording is split into chunks.
+		profile (str): The generation profile, eg. `fast` or `accurate`.
+
+	Returns:
+		dict: The transcription, the duration and the transcription latency, in
+		seconds, and the chunks, with their bounds in seconds and their
+		transcriptions.
+
+	Raises:
+		HTTPException: If the profile is unknown, an HTTPException is raised with a
+		status code of 422. If an error occurs during the transcription process,
 		an HTTPException is raised with a status code of 500 and the error details.
 	"""
+	_check_profile(profile)
 	try:
-		# save file to disk
-		audio_paths = []
-		for file in files:
-			file_path = generate_random_path()
-			with open(file_path, "wb") as f:  # noqa: PTH123
-				f.write(file.file.read())
-			audio_paths.append(file_path)
-		return predict(audio_paths)
+		return predict_long(decode_upload(file.file), strategy, profile)
 	except Exception as e:  # noqa: BLE001
 		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+
+
+@router.post("/transcribe/long/raw")
+async def transcribe_long_body(
+	request: Request,
+	strategy: Strategy = Strategy.SILENCE,
+	profile: str = DEFAULT_PROFILE,
+) -> dict:
+	"""Transcribes a long recording sent as the raw body of the request.
+
+	Unlike `/transcribe/long`, whose multipart upload is spooled to disk before
+	the endpoint runs, the body is piped to ffmpeg as it is received, so a large
+	recording is decoded while it is uploaded.
+
+	Args:
+		request (Request): The request, whose body is the audio file.
+		strategy (Strategy): How the recording is split into chunks.
+		profile (str): The generation profile, eg. `fast` or `accurate`.
+
+	Returns:
+		dict: The transcription, as returned by `/transcribe/long`.
+
+	Raises:
+		HTTPException: If the profile is unknown, an HTTPException is raised with a
+		status code of 422. If an error occurs during the transcription process,
+		an HTTPException is raised with a status code of 500 and the error details.
+	"""
+	_check_profile(profile)
+	try:
+		audio = await decode_stream(request.stream())
+		return await asyncio.to_thread(predict_long, audio, strategy, profile)
+	except Exception as e:  # noqa: BLE001
+		raise HTTPException(status_code=500, detail=str(e))  # noqa: B904
+
+
+@router.websocket("/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket) -> None:
+	"""Transcribes audio streamed over a WebSocket, utterance by utterance.
+
+	The client sends binary messages of 16 kHz mono PCM, as 16-bit little-endian
+	integers, which may split a sample across two messages, and may send the text
+	message `end` to flush the current utterance and close the connection. While
+	the user speaks, the server sends JSON messages
+	`{"type": "partial", "text": ...}`. Once the speech is followed by silence, it
+	sends `{"type": "final", "text": ...}`, with the duration of the utterance and
+	the latencies of its first partial and final transcripts. The partial
+	transcripts are decoded with `ASR_PARTIAL_PROFILE`, the final ones with
+	`ASR_PROFILE`.
+
+	Args:
+		websocket (WebSocket): The connection with the client.
+	"""
+	await websocket.accept()
+	session = StreamingSession(
+		lambda audio, profile: asyncio.wrap_future(scheduler.submit(audio, profile)),
+		websocket.send_json,
+	)
+	odd_byte = b""  # the trailing byte of a frame split mid-sample
+	try:
+		while True:
+			message = await websocket.receive()
+			if message["type"] == "websocket.disconnect":
+				return
+			if message.get("bytes"):
+				data = odd_byte + message["bytes"]
+				end = len(data) - len(data) % 2
+				data, odd_byte = data[:end], data[end:]
+				samples = np.frombuffer(data, dtype="<i2")
+				await session.feed(samples.astype(np.float32) / 32768)
+			elif message.get("text") == "end":
+				await session.finalize()
+				await websocket.close()
+				return
+	except WebSocketDisconnect:
+		return
+	finally:
+		session.close()
+
+
+@router.get("/transcribe/stats")
+def get_transcription_stats() -> dict:
+	"""Get the batching, streaming, silence trimming, cache and cascade statistics.
+
+	Returns:
+		dict: The statistics of the batching scheduler, see `BatchScheduler.stats`,
+		the latencies of the streamed transcriptions, under `streaming`, the
+		audio removed by the silence trimming, under `trimming`, the hit rate
+		of the transcription cache, under `cache`, the escalation rate of the
+		cascade, under `cascade`, and the statistics of the batching scheduler of
+		the Wav2Vec2 backend, under `wav2vec`.
+	"""
+	stats = scheduler.stats()
+	window_latency = None
+	if "mean_batch_size" in stats:
+		window_latency = stats["mean_batch_latency_ms"] / stats["mean_batch_size"]
+		window_latency /= 1000
+	return {
+		**stats,
+		"streaming": stream_stats.stats(),
+		"trimming": trim_stats.stats(window_latency),
+		"cache": cache.stats() if cache else {"enabled": False},
+		"cascade": cascade.stats() if cascade else {"enabled": False},
+		"wav2vec": (
+			schedulers[Backend.WAV2VEC].stats()
+			if Backend.WAV2VEC in schedulers
+			else {"enabled": False}
+		),
+	}
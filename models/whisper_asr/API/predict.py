@@ -1,43 +1,215 @@
 """Evaluate the Whisper model on few Arabic audios."""
 
+import time
+from concurrent.futures import Future
+from enum import Enum
+from os import environ
 from pathlib import Path
 
+import numpy as np
 from lgg import logger
-from transformers import pipeline
+
+from .audio import SAMPLE_RATE
+from .cache import cache, fingerprint, weights_fingerprint
+from .cascade import ENABLED as CASCADE
+from .cascade import SMALL_MODEL, THRESHOLD, Cascade, load_small_model
+from .engine import WhisperEngine
+from .longform import Chunk, Strategy, merge, split
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .runtime import describe, input_dtype, load_model
+from .scheduler import MAX_BATCH_SIZE, MAX_WAIT, BatchScheduler
+from .vad import trim_silence, trim_stats
 
 logger.setLevel("INFO")
 
-model = Path(__file__).parent.parent / "checkpoints"
+# Whether the silences are trimmed before the transcription
+TRIM_SILENCE = environ.get("ASR_TRIM_SILENCE", "0") == "1"
+# Whether the Wav2Vec2 CTC backend is loaded, so it can be requested
+WAV2VEC = environ.get("ASR_WAV2VEC", "0") == "1"
+
+
+class Backend(str, Enum):
+	"""The model transcribing the audios."""
+
+	WHISPER = "whisper"
+	WAV2VEC = "wav2vec"
+
+
+checkpoint = Path(__file__).parent.parent / "checkpoints"
+
+# Load the model, on GPU if there is one, else quantized on CPU
+model = load_model(checkpoint)
+dtype = input_dtype(model)
+logger.info(f"Whisper runs on {describe(model)}")
+
 
-# Load the model
-logger.info(f"Loading model from {model}")
-model = pipeline(model=model, task="automatic-speech-recognition", device=0)
+engine = WhisperEngine(model, dtype, MAX_BATCH_SIZE)
 
 
-def predict(audio_paths: list[str]) -> list[str]:
-	"""Predict the transcription of given audio files.
+def transcribe_batch(audios: list[np.ndarray], profile: str) -> list[str]:
+	"""Transcribe a batch of clips of at most 30 s, in one forward pass.
 
 	Args:
-		audio_paths (list[str]): A list of file paths to the audio files
-		to be transcribed.
+		audios (list[np.ndarray]): The 16 kHz mono samples of the clips.
+		profile (str): The name of the generation profile.
 
 	Returns:
-		list[str]: A list of transcriptions corresponding to the input audio files.
+		list[str]: The transcriptions of the clips.
 	"""
-	logger.debug(f"Received {len(audio_paths)} audio files.")
-	result = model(audio_paths)
-	return [res["text"] for res in result]
+	return engine.transcribe(audios, PROFILES[profile].generate_kwargs())
+
+
+# Transcribe with a small model first, if the cascade is enabled
+cascade = Cascade(load_small_model(), transcribe_batch) if CASCADE else None
+schedulers = {
+	Backend.WHISPER: BatchScheduler(
+		cascade.transcribe if cascade else transcribe_batch,
+		MAX_BATCH_SIZE,
+		MAX_WAIT,
+	),
+}
+scheduler = schedulers[Backend.WHISPER]
+
+# The model and settings the cached transcriptions depend on, with the profile
+CACHE_SETTINGS = {
+	Backend.WHISPER: (
+		weights_fingerprint(checkpoint),
+		describe(model),
+		model.model.generation_config.to_json_string(),
+		f"trim_silence={TRIM_SILENCE}",
+		f"cascade={weights_fingerprint(SMALL_MODEL)}@{THRESHOLD}"
+		if cascade
+		else "cascade=off",
+	),
+}
+
+if WAV2VEC:
+	from .using_wav2vec import transcribe_batch as transcribe_ctc
+	from .using_wav2vec import transcription_model
+
+	# the profiles only apply to Whisper
+	schedulers[Backend.WAV2VEC] = BatchScheduler(
+		lambda audios, _: transcribe_ctc(audios),
+		MAX_BATCH_SIZE,
+		MAX_WAIT,
+	)
+	CACHE_SETTINGS[Backend.WAV2VEC] = (
+		transcription_model.config.name_or_path,
+		getattr(transcription_model.config, "_commit_hash", ""),
+		f"trim_silence={TRIM_SILENCE}",
+	)
+
+
+def _submit(
+	audio: np.ndarray,
+	strategy: Strategy,
+	profile: str,
+	backend: Backend = Backend.WHISPER,
+) -> list[tuple[Chunk, Future]]:
+	"""Split an audio into chunks of at most 30 s, and queue them."""
+	chunks = split(audio, strategy)
+	return [
+		(chunk, schedulers[backend].submit(audio[chunk.start : chunk.end], profile))
+		for chunk in chunks
+	]
+
 
+def _trim(audio: np.ndarray) -> np.ndarray:
+	"""Trim the silences of an audio, recording the audio removed."""
+	start = time.perf_counter()
+	trimmed = trim_silence(audio)
+	trim_stats.record(len(audio), len(trimmed), time.perf_counter() - start)
+	return trimmed
 
-def generate_random_path() -> str:
-	"""Generate a random path for the audio file.
+
+def _submit_audio(
+	audio: np.ndarray,
+	profile: str,
+	backend: Backend,
+) -> list[tuple[Chunk, Future]]:
+	"""Trim the silences of an audio if enabled, then queue it by chunks."""
+	if TRIM_SILENCE:
+		audio = _trim(audio)
+	return _submit(audio, Strategy.SILENCE, profile, backend) if len(audio) else []
+
+
+def _collect(submitted: list[tuple[Chunk, Future]]) -> list[Chunk]:
+	"""Wait for the transcriptions of queued chunks."""
+	for chunk, future in submitted:
+		chunk.text = future.result()
+	return [chunk for chunk, _ in submitted]
+
+
+def predict(
+	audios: list[np.ndarray],
+	profile: str = DEFAULT_PROFILE,
+	backend: Backend = Backend.WHISPER,
+) -> list[str]:
+	"""Predict the transcription of given audios.
+
+	The audios are batched with the audios of the concurrent requests. The audios
+	longer than 30 s are split into chunks at their quietest points. If
+	`ASR_TRIM_SILENCE` is set, the silences are trimmed first, and the silent
+	audios aren't transcribed at all. The transcriptions are cached, so audios
+	sent again aren't transcribed again.
+
+	Args:
+		audios (list[np.ndarray]): The 16 kHz mono samples of the audios to be
+		transcribed, see `audio.decode_audio`.
+		profile (str): The name of the generation profile, see `profiles`.
+		backend (Backend): The model transcribing the audios, `wav2vec` only if
+			`ASR_WAV2VEC` is set.
 
 	Returns:
-		str: The path to the generated audio file.
+		list[str]: A list of transcriptions corresponding to the input audios.
 	"""
-	import tempfile
-	import uuid
+	logger.debug(f"Received {len(audios)} audios.")
+	settings = CACHE_SETTINGS[backend]
+	if backend == Backend.WHISPER:
+		settings = (*settings, repr(PROFILES[profile]))
+	keys = [fingerprint(audio, *settings) if cache else None for audio in audios]
+	cached = [cache.get(key) if cache else None for key in keys]
+	# queue all the audios before waiting, so they are batched together
+	submitted = [
+		None if text is not None else _submit_audio(audio, profile, backend)
+		for audio, text in zip(audios, cached, strict=True)
+	]
+	texts = []
+	for key, text, chunks in zip(keys, cached, submitted, strict=True):
+		if chunks is None:
+			texts.append(text)
+			continue
+		texts.append(merge(_collect(chunks), Strategy.SILENCE))
+		if cache:
+			cache.put(key, texts[-1])
+	return texts
 
-	name = f"test-{uuid.uuid4()!s}.wav"
-	out_dir = tempfile.gettempdir()
-	return (Path(out_dir) / name).as_posix()
+
+def predict_long(
+	audio: np.ndarray,
+	strategy: Strategy = Strategy.SILENCE,
+	profile: str = DEFAULT_PROFILE,
+) -> dict:
+	"""Transcribe a long recording, by chunks of at most 30 s.
+
+	All the chunks are queued at once, so they are transcribed in batches.
+
+	Args:
+		audio (np.ndarray): The 16 kHz mono samples of the recording.
+		strategy (Strategy): How the recording is split into chunks, see
+			`longform`.
+		profile (str): The name of the generation profile, see `profiles`.
+
+	Returns:
+		dict: The transcription of the recording, its duration and the
+		transcription latency, in seconds, and the chunks, with their bounds in
+		seconds and their transcriptions.
+	"""
+	start = time.perf_counter()
+	chunks = _collect(_submit(audio, strategy, profile))
+	return {
+		"text": merge(chunks, strategy),
+		"duration": len(audio) / SAMPLE_RATE,
+		"latency": time.perf_counter() - start,
+		"chunks": [chunk.to_dict() for chunk in chunks],
+	}
@@ -0,0 +1,40 @@
+"""Named generation settings of Whisper, to trade accuracy for speed.
+
+The language and the task are forced in every profile, so Whisper doesn't spend
+a decoder pass detecting the language. Timestamps are never predicted: the
+transcriptions are returned as text only.
+"""
+
+from dataclasses import asdict, dataclass
+from os import environ
+
+
+@dataclass(frozen=True)
+class Profile:
+	"""The generation settings of a transcription."""
+
+	num_beams: int = 1
+	max_new_tokens: int | None = None
+	language: str = "ar"
+	task: str = "transcribe"
+
+	def generate_kwargs(self) -> dict:
+		"""Get the keyword arguments of `WhisperForConditionalGeneration.generate`."""
+		kwargs = asdict(self)
+		if self.max_new_tokens is None:
+			del kwargs["max_new_tokens"]
+		return kwargs
+
+
+PROFILES = {
+	# greedy decoding, as the checkpoint does by default
+	"greedy": Profile(),
+	# greedy decoding, with the output capped for short utterances
+	"fast": Profile(max_new_tokens=128),
+	# beam search, slower but more accurate
+	"accurate": Profile(num_beams=5),
+}
+
+# The profile of the transcriptions, and of the partial streamed transcriptions
+DEFAULT_PROFILE = environ.get("ASR_PROFILE", "greedy")
+PARTIAL_PROFILE = environ.get("ASR_PARTIAL_PROFILE", "fast")
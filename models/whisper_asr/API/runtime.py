@@ -0,0 +1,124 @@
+"""Load Whisper on the best available device.
+
+On GPU, the model runs in float16. On CPU, the linear layers are quantized to
+int8 dynamically, ie. their weights are stored in int8 and their activations are
+quantized on the fly, which makes the decoding faster for a small loss of
+accuracy. The model can also be exported to ONNX Runtime instead.
+"""
+
+from os import environ
+from pathlib import Path
+
+import torch
+from lgg import logger
+from transformers import AutoProcessor, pipeline
+from transformers.pipelines import AutomaticSpeechRecognitionPipeline
+
+# The device of the model: auto, cpu, cuda or cuda:<index>
+DEVICE = environ.get("ASR_DEVICE", "auto")
+# Whether the linear layers are quantized to int8 on CPU
+INT8 = environ.get("ASR_INT8", "1") == "1"
+# Whether the model runs with ONNX Runtime, on CPU
+ONNX = environ.get("ASR_ONNX", "0") == "1"
+
+
+def select_device(name: str = DEVICE) -> torch.device:
+	"""Select the device of the model.
+
+	Args:
+		name (str): The name of the device, or `auto` to use the GPU if there is
+			one.
+
+	Returns:
+		torch.device: The device.
+	"""
+	if name == "auto":
+		name = "cuda" if torch.cuda.is_available() else "cpu"
+	return torch.device(name)
+
+
+def quantize(model: torch.nn.Module) -> torch.nn.Module:
+	"""Quantize the linear layers of a model to int8, dynamically.
+
+	Args:
+		model (torch.nn.Module): The float32 model, on CPU.
+
+	Returns:
+		torch.nn.Module: The quantized model.
+	"""
+	return torch.ao.quantization.quantize_dynamic(
+		model,
+		{torch.nn.Linear},
+		dtype=torch.qint8,
+	)
+
+
+def _load_onnx(checkpoint: Path | str) -> AutomaticSpeechRecognitionPipeline:
+	"""Export the model to ONNX Runtime, and wrap it in a pipeline.
+
+	Optimum is only imported here, so it is only needed with `ASR_ONNX=1`.
+	"""
+	from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+	processor = AutoProcessor.from_pretrained(checkpoint)
+	return pipeline(
+		model=ORTModelForSpeechSeq2Seq.from_pretrained(checkpoint, export=True),
+		tokenizer=processor.tokenizer,
+		feature_extractor=processor.feature_extractor,
+		task="automatic-speech-recognition",
+	)
+
+
+def load_model(
+	checkpoint: Path | str,
+	device: torch.device | None = None,
+	int8: bool = INT8,  # noqa: FBT001
+	onnx: bool = ONNX,  # noqa: FBT001
+) -> AutomaticSpeechRecognitionPipeline:
+	"""Load the model for inference.
+
+	Args:
+		checkpoint (Path | str): The directory or the name of the checkpoint.
+		device (torch.device, optional): The device of the model, see
+			`select_device` for the default.
+		int8 (bool): Whether the linear layers are quantized to int8 on CPU.
+		onnx (bool): Whether the model runs with ONNX Runtime, on CPU.
+
+	Returns:
+		AutomaticSpeechRecognitionPipeline: The pipeline of the model.
+	"""
+	device = device or select_device()
+	if device.type == "cpu" and onnx:
+		logger.info(f"Loading model from {checkpoint} with ONNX Runtime")
+		return _load_onnx(checkpoint)
+	dtype = torch.float16 if device.type == "cuda" else torch.float32
+	logger.info(f"Loading model from {checkpoint} on {device} in {dtype}")
+	model = pipeline(
+		model=checkpoint,
+		task="automatic-speech-recognition",
+		device=device,
+		torch_dtype=dtype,
+	)
+	if device.type == "cpu" and int8:
+		logger.info("Quantizing the linear layers to int8")
+		model.model = quantize(model.model)
+	return model
+
+
+def input_dtype(model: AutomaticSpeechRecognitionPipeline) -> torch.dtype:
+	"""Get the dtype of the input features of a model."""
+	if isinstance(model.model, torch.nn.Module):
+		return model.model.dtype
+	return torch.float32
+
+
+def describe(model: AutomaticSpeechRecognitionPipeline) -> str:
+	"""Describe the runtime of a model, eg. `cpu/int8`, for the cache keys."""
+	if not isinstance(model.model, torch.nn.Module):
+		return "cpu/onnx"
+	quantized = any(
+		isinstance(module, torch.ao.nn.quantized.dynamic.Linear)
+		for module in model.model.modules()
+	)
+	precision = "int8" if quantized else str(model.model.dtype).removeprefix("torch.")
+	return f"{model.device.type}/{precision}"
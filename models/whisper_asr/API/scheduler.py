@@ -0,0 +1,174 @@
+"""Batch the clips of concurrent transcription requests together.
+
+Each request submits its clips to a queue. A worker thread gathers the queued
+clips, waiting at most `ASR_MAX_WAIT_MS` after the first one, groups them by
+generation profile, then by duration so the clips decoded together need a
+similar number of tokens, and transcribes each group as one batch of at most
+`ASR_MAX_BATCH_SIZE` clips.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from itertools import groupby
+from os import environ
+
+import numpy as np
+from lgg import logger
+
+MAX_BATCH_SIZE = int(environ.get("ASR_MAX_BATCH_SIZE", "8"))
+MAX_WAIT = float(environ.get("ASR_MAX_WAIT_MS", "10")) / 1000
+# Maximum number of queued clips sorted by duration together
+MAX_BACKLOG_BATCHES = 4
+# Number of recent batches the statistics are computed on
+STATS_WINDOW = 1000
+
+
+@dataclass
+class _Clip:
+	"""A clip waiting to be transcribed."""
+
+	audio: np.ndarray
+	profile: str
+	future: Future = field(default_factory=Future)
+	queued_at: float = field(default_factory=time.perf_counter)
+
+
+class BatchScheduler:
+	"""Transcribe the clips of concurrent requests in batches."""
+
+	def __init__(
+		self,
+		transcribe: Callable[[list[np.ndarray], str], list[str]],
+		max_batch_size: int,
+		max_wait: float,
+	) -> None:
+		"""Initialize the scheduler and start its worker thread.
+
+		Args:
+			transcribe (Callable): Transcribes a batch of audios with a profile.
+			max_batch_size (int): The maximum number of clips in a batch.
+			max_wait (float): The maximum seconds to wait for more clips.
+		"""
+		self.transcribe = transcribe
+		self.max_batch_size = max_batch_size
+		self.max_wait = max_wait
+		self._queue: queue.Queue[_Clip] = queue.Queue()
+		self._lock = threading.Lock()
+		self._batch_sizes = deque(maxlen=STATS_WINDOW)
+		self._queue_waits = deque(maxlen=STATS_WINDOW)
+		self._batch_latencies = deque(maxlen=STATS_WINDOW)
+		self._clips = 0
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def submit(self, audio: np.ndarray, profile: str) -> Future:
+		"""Queue a clip to be transcribed.
+
+		Args:
+			audio (np.ndarray): The 16 kHz mono samples of the clip.
+			profile (str): The generation profile, clips with different profiles
+				are never batched together.
+
+		Returns:
+			Future: The future transcription of the clip.
+		"""
+		clip = _Clip(audio, profile)
+		self._queue.put(clip)
+		return clip.future
+
+	def _gather(self) -> list[_Clip]:
+		"""Wait for the queued clips, see the module documentation."""
+		clips = [self._queue.get()]
+		deadline = clips[0].queued_at + self.max_wait
+		while len(clips) < self.max_batch_size:
+			timeout = deadline - time.perf_counter()
+			if timeout <= 0:
+				break
+			try:
+				clips.append(self._queue.get(timeout=timeout))
+			except queue.Empty:
+				break
+		# under load, take the backlog too, to group more clips by duration. This is
+		# the only consumer of the queue, so the counted clips are there
+		backlog = self.max_batch_size * MAX_BACKLOG_BATCHES - len(clips)
+		backlog = min(self._queue.qsize(), max(backlog, 0))
+		clips.extend(self._queue.get_nowait() for _ in range(backlog))
+		return clips
+
+	def _run(self) -> None:
+		"""Transcribe the queued clips, batch by batch, forever."""
+		while True:
+			# drop the clips whose requests were cancelled meanwhile
+			clips = [
+				c for c in self._gather() if c.future.set_running_or_notify_cancel()
+			]
+			try:
+				clips = sorted(clips, key=lambda clip: (clip.profile, len(clip.audio)))
+				groups = [
+					list(group)
+					for _, group in groupby(clips, key=lambda clip: clip.profile)
+				]
+			except Exception as e:  # noqa: BLE001
+				self._fail(clips, e)
+				continue
+			for group in groups:
+				for i in range(0, len(group), self.max_batch_size):
+					self._run_batch(group[i : i + self.max_batch_size])
+
+	def _fail(self, clips: list[_Clip], error: Exception) -> None:
+		"""Fail the requests of clips that have no transcription yet."""
+		logger.warning(f"Failed to transcribe a batch of {len(clips)} clips: {error}")
+		for clip in clips:
+			if not clip.future.done():
+				clip.future.set_exception(error)
+
+	def _run_batch(self, clips: list[_Clip]) -> None:
+		"""Transcribe a batch and scatter the transcriptions to the requests.
+
+		If anything fails, the requests of the batch fail with the error, and the
+		worker goes on with the next batch.
+		"""
+		start = time.perf_counter()
+		try:
+			texts = self.transcribe([clip.audio for clip in clips], clips[0].profile)
+			end = time.perf_counter()
+			# checked whole before any request gets its transcription
+			results = list(zip(clips, texts, strict=True))
+			for clip, text in results:
+				clip.future.set_result(text)
+		except Exception as e:  # noqa: BLE001
+			self._fail(clips, e)
+			return
+		with self._lock:
+			self._clips += len(clips)
+			self._batch_sizes.append(len(clips))
+			self._batch_latencies.append(end - start)
+			self._queue_waits.extend(start - clip.queued_at for clip in clips)
+
+	def stats(self) -> dict:
+		"""Get the batch fill and the queue wait of the recent batches.
+
+		Returns:
+			dict: The number of clips transcribed, the mean batch size and fill
+			(relative to the maximum batch size), the mean and p95 queue waits,
+			the mean batch latency and the number of queued clips.
+		"""
+		with self._lock:
+			sizes = list(self._batch_sizes)
+			waits = list(self._queue_waits)
+			latencies = list(self._batch_latencies)
+			stats = {"clips": self._clips}
+		if sizes:
+			stats["mean_batch_size"] = float(np.mean(sizes))
+			stats["mean_batch_fill"] = stats["mean_batch_size"] / self.max_batch_size
+			stats["mean_queue_wait_ms"] = float(np.mean(waits)) * 1000
+			stats["p95_queue_wait_ms"] = float(np.percentile(waits, 95)) * 1000
+			stats["mean_batch_latency_ms"] = float(np.mean(latencies)) * 1000
+		stats["queued"] = self._queue.qsize()
+		stats["max_batch_size"] = self.max_batch_size
+		stats["max_wait_ms"] = self.max_wait * 1000
+		return stats
@@ -0,0 +1,228 @@
+"""Transcribe a streamed audio utterance by utterance, with partial results.
+
+The energy VAD detects the start of an utterance. While the user speaks, the
+utterance is transcribed again every `ASR_PARTIAL_INTERVAL_MS` of new audio,
+with the faster `ASR_PARTIAL_PROFILE`, and the partial transcript is sent. Once
+`ASR_ENDPOINT_MS` of silence follow the speech, the final transcript is sent.
+
+Compute is reused across the partial decodes: the detection only processes the
+new samples, partial decodes only run on new speech and never pile up, and
+utterances longer than Whisper's 30 s window are committed by chunks, cut at
+their quietest point, so only the uncommitted tail is decoded again.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from os import environ
+
+import numpy as np
+from lgg import logger
+
+from .audio import HOP_LENGTH, SAMPLE_RATE
+from .longform import CHUNK_SECONDS, split_at_silences
+from .profiles import DEFAULT_PROFILE, PARTIAL_PROFILE
+from .vad import EnergyVAD
+
+# Audio between two partial transcriptions, in samples
+PARTIAL_INTERVAL = (
+	int(environ.get("ASR_PARTIAL_INTERVAL_MS", "500")) * SAMPLE_RATE // 1000
+)
+# Silence ending an utterance, in VAD frames
+ENDPOINT_FRAMES = (
+	int(environ.get("ASR_ENDPOINT_MS", "700")) * SAMPLE_RATE // 1000 // HOP_LENGTH
+)
+# Shortest utterance, shorter speech is ignored as noise
+MIN_SPEECH_FRAMES = 20
+# Audio kept before the start of the speech, so its onset isn't cut
+PREROLL = int(0.3 * SAMPLE_RATE)
+WINDOW = CHUNK_SECONDS * SAMPLE_RATE
+# Number of recent utterances the statistics are computed on
+STATS_WINDOW = 1000
+
+
+class StreamStats:
+	"""The latencies of the recent streamed utterances."""
+
+	def __init__(self) -> None:  # noqa: D107
+		self._lock = threading.Lock()
+		self._first_partial = deque(maxlen=STATS_WINDOW)
+		self._final = deque(maxlen=STATS_WINDOW)
+		self._utterances = 0
+
+	def record(self, first_partial: float | None, final: float) -> None:
+		"""Record the latencies of an utterance, in seconds."""
+		with self._lock:
+			self._utterances += 1
+			self._final.append(final)
+			if first_partial is not None:
+				self._first_partial.append(first_partial)
+
+	def stats(self) -> dict:
+		"""Get the mean and p95 latencies of the recent utterances.
+
+		Returns:
+			dict: The number of utterances, and the latencies in milliseconds of
+			the first partial transcript, since the start of the speech, and of the
+			final transcript, since the end of the speech was detected.
+		"""
+		with self._lock:
+			stats = {"utterances": self._utterances}
+			latencies = {
+				"first_partial": list(self._first_partial),
+				"final": list(self._final),
+			}
+		for name, values in latencies.items():
+			if values:
+				stats[f"mean_{name}_latency_ms"] = float(np.mean(values)) * 1000
+				stats[f"p95_{name}_latency_ms"] = (
+					float(np.percentile(values, 95)) * 1000
+				)
+		return stats
+
+
+stream_stats = StreamStats()
+
+
+def _log_partial_error(task: asyncio.Task) -> None:
+	"""Retrieve the error of a partial transcription, which nothing awaits."""
+	if not task.cancelled() and task.exception() is not None:
+		logger.warning(f"Failed to send a partial transcript: {task.exception()}")
+
+
+class StreamingSession:
+	"""Transcribe the audio streamed by one client."""
+
+	def __init__(
+		self,
+		transcribe: Callable[[np.ndarray, str], Awaitable[str]],
+		send: Callable[[dict], Awaitable[None]],
+	) -> None:
+		"""Initialize the session.
+
+		Args:
+			transcribe (Callable): Transcribes a clip of at most 30 s, with a
+				generation profile.
+			send (Callable): Sends a message to the client.
+		"""
+		self.transcribe = transcribe
+		self.send = send
+		self.vad = EnergyVAD()
+		self._preroll = np.zeros(0, dtype=np.float32)
+		self._reset()
+
+	def _reset(self) -> None:
+		"""Wait for the next utterance."""
+		self._utterance = None  # the samples of the utterance, once it started
+		self._committed = []  # the transcriptions of the committed chunks
+		self._tail_start = 0  # the first sample not committed
+		self._speech_frames = 0
+		self._silent_frames = 0
+		self._partial_task = None
+		self._partial_at = 0  # the length of the utterance at the last partial
+		self._started_at = None
+		self._first_partial_latency = None
+
+	async def feed(self, samples: np.ndarray) -> None:
+		"""Process newly received samples.
+
+		Args:
+			samples (np.ndarray): The new 16 kHz mono samples.
+		"""
+		speech = self.vad.process(samples)
+		if self._utterance is None:
+			self._preroll = np.concatenate([self._preroll, samples])[-PREROLL:]
+			if not speech.any():
+				return
+			self._utterance = self._preroll
+			self._started_at = time.perf_counter()
+		else:
+			self._utterance = np.concatenate([self._utterance, samples])
+		for is_speech in speech:
+			self._speech_frames += is_speech
+			self._silent_frames = 0 if is_speech else self._silent_frames + 1
+		if self._silent_frames >= ENDPOINT_FRAMES:
+			await self.finalize()
+			return
+		if len(self._utterance) - self._tail_start > WINDOW:
+			self._commit()
+		new_speech = self._silent_frames * HOP_LENGTH < len(samples)
+		if (
+			new_speech
+			and len(self._utterance) - self._partial_at >= PARTIAL_INTERVAL
+			and (self._partial_task is None or self._partial_task.done())
+		):
+			self._partial_at = len(self._utterance)
+			self._partial_task = asyncio.ensure_future(self._partial())
+			self._partial_task.add_done_callback(_log_partial_error)
+
+	def _commit(self) -> None:
+		"""Transcribe the head of the tail, cut at its quietest point, once for all."""
+		chunk = split_at_silences(self._utterance[self._tail_start :])[0]
+		start, end = self._tail_start, self._tail_start + chunk.end
+		self._committed.append(
+			asyncio.ensure_future(
+				self.transcribe(self._utterance[start:end], DEFAULT_PROFILE),
+			),
+		)
+		self._tail_start = end
+
+	async def _text(self, profile: str) -> str:
+		"""Transcribe the utterance received so far."""
+		tail = asyncio.ensure_future(
+			self.transcribe(self._utterance[self._tail_start :], profile),
+		)
+		try:
+			# shielded, the committed chunks outlive a cancelled partial decode
+			texts = [await asyncio.shield(text) for text in self._committed]
+			texts.append(await tail)
+		finally:
+			# the tail isn't decoded for nothing once the partial is cancelled
+			tail.cancel()
+		return " ".join(text.strip() for text in texts if text.strip())
+
+	async def _partial(self) -> None:
+		"""Send the partial transcription of the utterance."""
+		text = await self._text(PARTIAL_PROFILE)
+		if self._first_partial_latency is None:
+			self._first_partial_latency = time.perf_counter() - self._started_at
+		await self.send({"type": "partial", "text": text})
+
+	async def finalize(self) -> None:
+		"""Send the final transcription of the current utterance, if any."""
+		if self._utterance is None:
+			return
+		if self._partial_task is not None:
+			self._partial_task.cancel()
+		if self._speech_frames < MIN_SPEECH_FRAMES:
+			for text in self._committed:
+				text.cancel()
+			self._reset()
+			return
+		endpoint_at = time.perf_counter()
+		text = await self._text(DEFAULT_PROFILE)
+		final_latency = time.perf_counter() - endpoint_at
+		stream_stats.record(self._first_partial_latency, final_latency)
+		message = {
+			"type": "final",
+			"text": text,
+			"duration": len(self._utterance) / SAMPLE_RATE,
+			"final_latency_ms": final_latency * 1000,
+			"first_partial_latency_ms": (
+				self._first_partial_latency * 1000
+				if self._first_partial_latency is not None
+				else None
+			),
+		}
+		self._preroll = self._utterance[-PREROLL:]
+		self._reset()
+		await self.send(message)
+
+	def close(self) -> None:
+		"""Cancel the pending transcriptions, once the client is gone."""
+		if self._partial_task is not None:
+			self._partial_task.cancel()
+		for text in self._committed:
+			text.cancel()
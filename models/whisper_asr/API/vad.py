@@ -0,0 +1,184 @@
+"""Lightweight energy-based voice activity detection.
+
+It follows `librosa.effects.split`, as used in `data/eda/audio/amplitude.py`: a
+frame is speech if its energy is within `top_db` of the loudest frame, and
+audios quieter than 0.01 in amplitude are silent. When the audio is streamed,
+the loudest frame is the loudest so far, decaying by `PEAK_DECAY_DB` per second,
+so the audio can be processed as it is received, and a single loud noise doesn't
+silence the quieter speech that follows it.
+"""
+
+import math
+import threading
+
+import numpy as np
+
+from .audio import FRAME_LENGTH, HOP_LENGTH, SAMPLE_RATE, frame_energy
+
+TOP_DB = 40
+# Amplitude, and its energy, below which an audio or a frame is silent
+SILENT_AMPLITUDE = 0.01
+SILENCE_DB = -40
+# Decay of the loudest energy of a streamed audio, in dB per second
+PEAK_DECAY_DB = 2.0
+# Longest pause kept when trimming the silences, in samples
+MAX_PAUSE = int(0.3 * SAMPLE_RATE)
+# Whisper window, the unit of the transcription compute
+WINDOW = 30 * SAMPLE_RATE
+
+
+class EnergyVAD:
+	"""Classify the frames of a streamed audio as speech or silence."""
+
+	def __init__(
+		self,
+		top_db: float = TOP_DB,
+		silence_db: float = SILENCE_DB,
+		peak_decay_db: float = PEAK_DECAY_DB,
+	) -> None:
+		"""Initialize the detector.
+
+		Args:
+			top_db (float): The maximum energy below the loudest frame of a speech
+				frame, in dB.
+			silence_db (float): The energy below which a frame is always silent.
+			peak_decay_db (float): The decay of the energy of the loudest frame, in
+				dB per second.
+		"""
+		self.top_db = top_db
+		self.silence_db = silence_db
+		self.peak_decay = peak_decay_db * HOP_LENGTH / SAMPLE_RATE  # per frame
+		self.peak_db = silence_db
+		self._pending = np.zeros(0, dtype=np.float32)  # samples of unfinished frames
+
+	def process(self, samples: np.ndarray) -> np.ndarray:
+		"""Classify the frames completed by new samples.
+
+		Frames are 25 ms long, every 10 ms, so each 10 ms of audio completes one
+		frame once the first 25 ms are received.
+
+		Args:
+			samples (np.ndarray): The new 16 kHz samples.
+
+		Returns:
+			np.ndarray: Whether each completed frame is speech.
+		"""
+		samples = np.concatenate([self._pending, samples])
+		frames = (len(samples) - FRAME_LENGTH) // HOP_LENGTH + 1
+		if frames <= 0:
+			self._pending = samples
+			return np.zeros(0, dtype=bool)
+		energy = frame_energy(samples[: (frames - 1) * HOP_LENGTH + FRAME_LENGTH])
+		self._pending = samples[frames * HOP_LENGTH :]
+		# the peak of a frame is the loudest of the previous peak and of the frames
+		# up to it, each decayed by the frames since, ie. a running maximum
+		decay = self.peak_decay * np.arange(1, frames + 1)
+		peak = np.maximum.accumulate(np.maximum(energy + decay, self.peak_db)) - decay
+		peak = np.maximum(peak, self.silence_db)
+		self.peak_db = float(peak[-1])
+		return energy >= np.maximum(peak - self.top_db, self.silence_db)
+
+
+def speech_intervals(audio: np.ndarray) -> list[tuple[int, int]]:
+	"""Find the speech of a whole audio, like `librosa.effects.split`.
+
+	Args:
+		audio (np.ndarray): The 16 kHz samples of the audio.
+
+	Returns:
+		list[tuple[int, int]]: The start and end samples of each speech interval,
+		empty if the audio is silent.
+	"""
+	if len(audio) == 0 or np.max(np.abs(audio)) < SILENT_AMPLITUDE:
+		return []
+	energy = frame_energy(audio)
+	speech = energy >= max(float(energy.max()) - TOP_DB, SILENCE_DB)
+	edges = np.flatnonzero(np.diff(speech, prepend=False, append=False))
+	return [
+		(
+			int(start * HOP_LENGTH),
+			min(int(end - 1) * HOP_LENGTH + FRAME_LENGTH, len(audio)),
+		)
+		for start, end in zip(edges[::2], edges[1::2], strict=True)
+	]
+
+
+def trim_silence(audio: np.ndarray, max_pause: int = MAX_PAUSE) -> np.ndarray:
+	"""Trim the leading and trailing silences of an audio, and shorten its pauses.
+
+	Args:
+		audio (np.ndarray): The 16 kHz samples of the audio.
+		max_pause (int): The longest pause kept, in samples. Longer pauses are
+			shortened to it, and half of it is kept before and after the speech.
+
+	Returns:
+		np.ndarray: The samples of the speech, empty if the audio is silent.
+	"""
+	pad = max_pause // 2
+	kept = []
+	for speech_start, speech_end in speech_intervals(audio):
+		start, end = max(speech_start - pad, 0), min(speech_end + pad, len(audio))
+		if kept and start <= kept[-1][1]:
+			kept[-1] = (kept[-1][0], end)
+		else:
+			kept.append((start, end))
+	if not kept:
+		return audio[:0]
+	return np.concatenate([audio[start:end] for start, end in kept])
+
+
+class TrimStats:
+	"""The audio removed by the silence trimming."""
+
+	def __init__(self) -> None:  # noqa: D107
+		self._lock = threading.Lock()
+		self._stats = {
+			"audios": 0,
+			"silent_audios": 0,
+			"seconds_in": 0.0,
+			"seconds_removed": 0.0,
+			"windows_saved": 0,
+			"trim_seconds": 0.0,
+		}
+
+	def record(self, samples_in: int, samples_out: int, elapsed: float) -> None:
+		"""Record the trimming of an audio.
+
+		Args:
+			samples_in (int): The length of the audio.
+			samples_out (int): The length of the trimmed audio, 0 if it is silent.
+			elapsed (float): The time the trimming took, in seconds.
+		"""
+		with self._lock:
+			self._stats["audios"] += 1
+			self._stats["silent_audios"] += samples_out == 0
+			self._stats["seconds_in"] += samples_in / SAMPLE_RATE
+			self._stats["seconds_removed"] += (samples_in - samples_out) / SAMPLE_RATE
+			self._stats["windows_saved"] += math.ceil(samples_in / WINDOW) - math.ceil(
+				samples_out / WINDOW,
+			)
+			self._stats["trim_seconds"] += elapsed
+
+	def stats(self, window_latency: float | None) -> dict:
+		"""Get the audio removed and the latency saved by the trimming.
+
+		Args:
+			window_latency (float, optional): The mean latency of the transcription
+				of a 30 s window, in seconds.
+
+		Returns:
+			dict: The numbers of audios trimmed, and found silent and skipped, the
+			seconds of audio received and removed, the number of 30 s windows not
+			transcribed, and the time spent trimming. The latency saved is
+			estimated as the windows saved times the latency of a window, minus
+			the time spent trimming.
+		"""
+		with self._lock:
+			stats = dict(self._stats)
+		if window_latency is not None:
+			saved = stats["windows_saved"] * window_latency - stats["trim_seconds"]
+			stats["estimated_seconds_saved"] = saved
+		return stats
+
+
+trim_stats = TrimStats()
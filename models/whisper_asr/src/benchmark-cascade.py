@@ -0,0 +1,108 @@
+"""Measure the escalation rate, the latency and the WER of the ASR cascade.
+
+Each clip is transcribed by the small model, with its confidence, and by the
+fine-tuned Whisper checkpoint, so the cascade is evaluated for every threshold
+at once: a clip below the threshold costs both models, and gets the
+transcription of Whisper. Always using Whisper is the baseline. See
+`API/cascade.py` for the cascade.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from evaluation import DEFAULT_DATA_DIR, load_test_set, transcribe_whisper, wer
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from whisper_asr.API.cascade import SMALL_MODEL, load_small_model
+from whisper_asr.API.profiles import DEFAULT_PROFILE, PROFILES
+from whisper_asr.API.runtime import load_model
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Measure the escalation rate, the latency and the WER of the cascade.",
+)
+parser.add_argument(
+	"--model",
+	type=str,
+	default=(Path(__file__).parent.parent / "checkpoints").as_posix(),
+	help="path to the fine-tuned Whisper checkpoint",
+)
+parser.add_argument(
+	"--small-model",
+	type=str,
+	default=SMALL_MODEL,
+	help="`wav2vec`, or the path or the name of a smaller Whisper checkpoint",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="path to the test dataset",
+)
+parser.add_argument(
+	"--num-samples",
+	type=int,
+	default=100,
+	help="Number of audios to evaluate on, 0 for all of them.",
+)
+parser.add_argument(
+	"--thresholds",
+	type=float,
+	nargs="+",
+	default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95],
+	help="The escalation thresholds to evaluate.",
+)
+args = parser.parse_args()
+
+audios, captions = load_test_set(Path(args.data_dir), args.num_samples)
+small = load_small_model(args.small_model)
+large = load_model(Path(args.model))
+generate_kwargs = PROFILES[DEFAULT_PROFILE].generate_kwargs()
+
+# warm up
+small(audios[:1])
+transcribe_whisper(large, audios[:1], generate_kwargs)
+
+small_texts, confidences, small_latencies = [], [], []
+large_texts, large_latencies = [], []
+for audio in audios:
+	start = time.perf_counter()
+	texts, confidence = small([audio])
+	small_latencies.append(time.perf_counter() - start)
+	small_texts.extend(texts)
+	confidences.extend(confidence)
+	start = time.perf_counter()
+	large_texts.extend(transcribe_whisper(large, [audio], generate_kwargs))
+	large_latencies.append(time.perf_counter() - start)
+small_latencies, large_latencies = np.array(small_latencies), np.array(large_latencies)
+
+logger.info(
+	f"Whisper only: WER {wer(captions, large_texts):.2f}%, "
+	f"mean latency {large_latencies.mean() * 1000:.0f} ms",
+)
+logger.info(
+	f"{args.small_model} only: WER {wer(captions, small_texts):.2f}%, "
+	f"mean latency {small_latencies.mean() * 1000:.0f} ms",
+)
+for threshold in args.thresholds:
+	escalated = np.array(confidences) < threshold
+	texts = [
+		large_text if escalate else small_text
+		for small_text, large_text, escalate in zip(
+			small_texts,
+			large_texts,
+			escalated,
+			strict=True,
+		)
+	]
+	latency = (small_latencies + large_latencies * escalated).mean()
+	logger.info(
+		f"Cascade at {threshold:.2f}: escalation rate {escalated.mean():.1%}, "
+		f"WER {wer(captions, texts):.2f}%, mean latency {latency * 1000:.0f} ms "
+		f"({large_latencies.mean() / latency:.2f}x faster than Whisper only)",
+	)
@@ -0,0 +1,118 @@
+"""Check the Whisper engine against the pipeline, and measure the overhead removed.
+
+The engine must give the same features, up to float rounding, and the same
+transcriptions as `transformers.pipeline`. See `API/engine.py` for the engine.
+"""
+
+import argparse
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+import torch
+from evaluation import DEFAULT_DATA_DIR, SAMPLE_RATE, load_test_set
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from whisper_asr.API.engine import WhisperEngine
+from whisper_asr.API.profiles import DEFAULT_PROFILE, PROFILES
+from whisper_asr.API.runtime import input_dtype, load_model
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Check the Whisper engine against the pipeline, and time both.",
+)
+parser.add_argument(
+	"--model",
+	type=str,
+	default=(Path(__file__).parent.parent / "checkpoints").as_posix(),
+	help="path to the model checkpoint",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="path to the test dataset",
+)
+parser.add_argument(
+	"--num-samples",
+	type=int,
+	default=64,
+	help="Number of audios to evaluate on, 0 for all of them.",
+)
+parser.add_argument("--batch-size", type=int, default=8, help="Batch size")
+args = parser.parse_args()
+
+audios, _ = load_test_set(Path(args.data_dir), args.num_samples)
+model = load_model(Path(args.model))
+engine = WhisperEngine(model, input_dtype(model), args.batch_size)
+generate_kwargs = PROFILES[DEFAULT_PROFILE].generate_kwargs()
+batches = [
+	audios[i : i + args.batch_size] for i in range(0, len(audios), args.batch_size)
+]
+
+
+def _timed(function: Callable) -> tuple[list, float]:
+	"""Run a function on every batch, after a warm up, and time it.
+
+	Returns:
+		tuple[list, float]: The outputs of the batches, and the time per clip, in
+		seconds.
+	"""
+	function(batches[0])
+	if torch.cuda.is_available():
+		torch.cuda.synchronize()
+	start = time.perf_counter()
+	outputs = [function(batch) for batch in batches]
+	if torch.cuda.is_available():
+		torch.cuda.synchronize()
+	return outputs, (time.perf_counter() - start) / len(audios)
+
+
+def _pipeline_features(batch: list[np.ndarray]) -> torch.Tensor:
+	return model.feature_extractor(
+		batch,
+		sampling_rate=SAMPLE_RATE,
+		return_tensors="pt",
+	).input_features
+
+
+def _pipeline(batch: list[np.ndarray]) -> list[str]:
+	outputs = model(
+		[{"raw": audio, "sampling_rate": SAMPLE_RATE} for audio in batch],
+		batch_size=len(batch),
+		generate_kwargs=generate_kwargs,
+	)
+	return [output["text"] for output in outputs]
+
+
+# parity
+reference_features, pipeline_features_time = _timed(_pipeline_features)
+features, engine_features_time = _timed(engine.features)
+max_error = max(
+	float((feature.float().cpu() - reference).abs().max())
+	for feature, reference in zip(features, reference_features, strict=True)
+)
+logger.info(f"Max absolute difference of the features: {max_error:.2e}")
+reference_texts, pipeline_time = _timed(_pipeline)
+texts, engine_time = _timed(lambda batch: engine.transcribe(batch, generate_kwargs))
+reference_texts = [text.strip() for batch in reference_texts for text in batch]
+texts = [text.strip() for batch in texts for text in batch]
+matches = sum(
+	text == reference for text, reference in zip(texts, reference_texts, strict=True)
+)
+logger.info(f"Identical transcriptions: {matches}/{len(texts)}")
+
+# overhead
+logger.info(
+	f"Features per clip: pipeline {pipeline_features_time * 1000:.1f} ms, "
+	f"engine {engine_features_time * 1000:.1f} ms",
+)
+logger.info(
+	f"Transcription per clip: pipeline {pipeline_time * 1000:.1f} ms, "
+	f"engine {engine_time * 1000:.1f} ms, "
+	f"overhead removed {(pipeline_time - engine_time) * 1000:.1f} ms",
+)
@@ -0,0 +1,71 @@
+"""Measure the WER and the latency of Whisper with each generation profile.
+
+See `API/profiles.py` for the profiles.
+"""
+
+import argparse
+import sys
+from functools import partial
+from pathlib import Path
+
+from evaluation import (
+	DEFAULT_DATA_DIR,
+	load_test_set,
+	report,
+	timed_batches,
+	transcribe_whisper,
+)
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from whisper_asr.API.profiles import PROFILES
+from whisper_asr.API.runtime import load_model
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Measure the WER and the latency of each Whisper profile.",
+)
+parser.add_argument(
+	"--model",
+	type=str,
+	default=(Path(__file__).parent.parent / "checkpoints").as_posix(),
+	help="path to the model checkpoint",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="path to the test dataset",
+)
+parser.add_argument(
+	"--num-samples",
+	type=int,
+	default=100,
+	help="Number of audios to evaluate on, 0 for all of them.",
+)
+parser.add_argument("--batch-size", type=int, default=8, help="Batch size")
+parser.add_argument(
+	"--profiles",
+	type=str,
+	nargs="+",
+	choices=list(PROFILES),
+	default=list(PROFILES),
+	help="The profiles to benchmark.",
+)
+args = parser.parse_args()
+
+# loaded as the API serves it, see `API/runtime.py`
+model = load_model(Path(args.model))
+audios, captions = load_test_set(Path(args.data_dir), args.num_samples)
+for profile in args.profiles:
+	texts, latencies = timed_batches(
+		partial(
+			transcribe_whisper,
+			model,
+			generate_kwargs=PROFILES[profile].generate_kwargs(),
+		),
+		audios,
+		args.batch_size,
+	)
+	report(profile, captions, texts, latencies, audios)
@@ -0,0 +1,82 @@
+"""Compare the WER and the real-time factor of Whisper in float32 and int8 on CPU.
+
+The int8 model has its linear layers quantized dynamically, as served by the API
+on CPU-only nodes, see `API/runtime.py`. With `--onnx`, the model exported to
+ONNX Runtime is compared too.
+"""
+
+import argparse
+import sys
+from functools import partial
+from pathlib import Path
+
+import torch
+from evaluation import (
+	DEFAULT_DATA_DIR,
+	load_test_set,
+	report,
+	timed_batches,
+	transcribe_whisper,
+)
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from whisper_asr.API.profiles import DEFAULT_PROFILE, PROFILES
+from whisper_asr.API.runtime import load_model
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Compare Whisper in float32 and int8 on CPU.",
+)
+parser.add_argument(
+	"--model",
+	type=str,
+	default=(Path(__file__).parent.parent / "checkpoints").as_posix(),
+	help="path to the model checkpoint",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="path to the test dataset",
+)
+parser.add_argument(
+	"--num-samples",
+	type=int,
+	default=50,
+	help="Number of audios to evaluate on, 0 for all of them.",
+)
+parser.add_argument("--batch-size", type=int, default=1, help="Batch size")
+parser.add_argument(
+	"--threads",
+	type=int,
+	default=torch.get_num_threads(),
+	help="Number of CPU threads",
+)
+parser.add_argument("--onnx", action="store_true", help="Compare ONNX Runtime too")
+args = parser.parse_args()
+
+torch.set_num_threads(args.threads)
+audios, captions = load_test_set(Path(args.data_dir), args.num_samples)
+configurations = {"float32": {"int8": False}, "int8": {"int8": True}}
+if args.onnx:
+	configurations["onnx"] = {"onnx": True}
+
+results = {}
+for name, options in configurations.items():
+	model = load_model(Path(args.model), torch.device("cpu"), **options)
+	transcribe = partial(
+		transcribe_whisper,
+		model,
+		generate_kwargs=PROFILES[DEFAULT_PROFILE].generate_kwargs(),
+	)
+	texts, latencies = timed_batches(transcribe, audios, args.batch_size)
+	results[name] = report(name, captions, texts, latencies, audios)
+
+baseline = results["float32"]
+for name, result in results.items():
+	logger.info(
+		f"{name} vs float32: WER {result['wer'] - baseline['wer']:+.2f} points, "
+		f"{baseline['rtf'] / result['rtf']:.2f}x faster",
+	)
@@ -0,0 +1,75 @@
+"""Compare the throughput, the latency and the WER of Wav2Vec2 CTC and Whisper.
+
+Both models run as the API serves them, see `API/runtime.py`: on GPU if there is
+one, else quantized to int8 on CPU.
+"""
+
+import argparse
+import sys
+from functools import partial
+from pathlib import Path
+
+from evaluation import (
+	DEFAULT_DATA_DIR,
+	SAMPLE_RATE,
+	load_test_set,
+	report,
+	timed_batches,
+	transcribe_whisper,
+)
+from lgg import logger
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from whisper_asr.API.profiles import DEFAULT_PROFILE, PROFILES
+from whisper_asr.API.runtime import load_model
+from whisper_asr.API.using_wav2vec import transcribe_batch
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Compare the throughput and the WER of Wav2Vec2 CTC and Whisper.",
+)
+parser.add_argument(
+	"--model",
+	type=str,
+	default=(Path(__file__).parent.parent / "checkpoints").as_posix(),
+	help="path to the Whisper checkpoint",
+)
+parser.add_argument(
+	"--data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="path to the test dataset",
+)
+parser.add_argument(
+	"--num-samples",
+	type=int,
+	default=100,
+	help="Number of audios to evaluate on, 0 for all of them.",
+)
+parser.add_argument(
+	"--batch-sizes",
+	type=int,
+	nargs="+",
+	default=[1, 8],
+	help="The batch sizes to evaluate.",
+)
+args = parser.parse_args()
+
+audios, captions = load_test_set(Path(args.data_dir), args.num_samples)
+seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+whisper = load_model(Path(args.model))
+backends = {
+	"wav2vec": transcribe_batch,
+	"whisper": partial(
+		transcribe_whisper,
+		whisper,
+		generate_kwargs=PROFILES[DEFAULT_PROFILE].generate_kwargs(),
+	),
+}
+
+for batch_size in args.batch_sizes:
+	for name, transcribe in backends.items():
+		texts, latencies = timed_batches(transcribe, audios, batch_size)
+		report(f"{name}, batch size {batch_size}", captions, texts, latencies, audios)
+		logger.info(f"Throughput: {seconds / sum(latencies):.1f} s of audio per second")
@@ -0,0 +1,280 @@
+"""Distill the fine-tuned Whisper model into a student with fewer decoder layers.
+
+The student keeps the encoder of the teacher, frozen, and the decoder layers of
+the teacher the furthest apart, eg. the first and the last ones for 2 layers. It
+is trained on the transcriptions of the teacher, with the cross-entropy on these
+pseudo-labels and the KL divergence to the token distributions of the teacher.
+Most of the decoding time is spent in the decoder, which runs once per token, so
+the student is much faster, especially on CPU.
+
+The dataset is the output of `build-dataset.py`. Use `--max-samples` and
+`--max-steps` to run at a small scale, eg. on CPU to test it. The student is
+saved with the processor of the teacher, so the API can load it, eg. as the small
+model of the cascade. Its WER and speedup against the teacher are then reported
+on the test dataset.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F  # noqa: N812
+from evaluation import (
+	DEFAULT_DATA_DIR,
+	load_test_set,
+	report,
+	timed_batches,
+	transcribe_whisper,
+)
+from lgg import logger
+from torch.utils.data import DataLoader
+from transformers import (
+	WhisperForConditionalGeneration,
+	WhisperProcessor,
+	get_linear_schedule_with_warmup,
+)
+
+from datasets import load_from_disk
+
+sys.path.insert(0, Path(__file__).parent.parent.parent.as_posix())
+from whisper_asr.API.profiles import PROFILES
+from whisper_asr.API.runtime import load_model, select_device
+
+logger.setLevel("INFO")
+
+parser = argparse.ArgumentParser(
+	description="Distill the fine-tuned Whisper model into a smaller student.",
+)
+parser.add_argument("--data-dir", type=str, required=True, help="HF dataset directory")
+parser.add_argument(
+	"--output-dir",
+	type=str,
+	required=True,
+	help="output dir of the student checkpoint",
+)
+parser.add_argument(
+	"--teacher",
+	type=str,
+	default=(Path(__file__).parent.parent / "checkpoints").as_posix(),
+	help="path to the fine-tuned Whisper checkpoint",
+)
+parser.add_argument(
+	"--decoder-layers",
+	type=int,
+	default=2,
+	help="Number of decoder layers of the student",
+)
+parser.add_argument("--batch-size", type=int, default=16, help="Batch size")
+parser.add_argument(
+	"--learning-rate",
+	type=float,
+	default=1e-4,
+	help="Learning rate for the optimizer",
+)
+parser.add_argument(
+	"--warmup-steps",
+	type=int,
+	default=500,
+	help="Number of warmup steps for the scheduler",
+)
+parser.add_argument(
+	"--max-steps",
+	type=int,
+	default=10000,
+	help="Total number of training steps",
+)
+parser.add_argument(
+	"--max-samples",
+	type=int,
+	default=0,
+	help="Number of training samples, 0 for all of them",
+)
+parser.add_argument(
+	"--temperature",
+	type=float,
+	default=2.0,
+	help="Temperature of the distributions compared by the KL divergence",
+)
+parser.add_argument(
+	"--kl-weight",
+	type=float,
+	default=0.8,
+	help="Weight of the KL divergence, the cross-entropy weighs the rest",
+)
+parser.add_argument(
+	"--logging-steps",
+	type=int,
+	default=25,
+	help="Log every X updates steps",
+)
+parser.add_argument(
+	"--test-data-dir",
+	type=str,
+	default=DEFAULT_DATA_DIR.as_posix(),
+	help="path to the test dataset the student is evaluated on",
+)
+parser.add_argument(
+	"--num-test-samples",
+	type=int,
+	default=50,
+	help="Number of test audios, 0 for all of them, -1 to skip the evaluation",
+)
+args = parser.parse_args()
+
+data_dir = Path(args.data_dir)
+output_dir = Path(args.output_dir)
+device = select_device()
+IGNORE_INDEX = -100
+
+if not data_dir.exists():
+	logger.error(f"Data directory {data_dir} does not exist.")
+	sys.exit(1)
+output_dir.mkdir(parents=True, exist_ok=True)
+
+# load the teacher
+processor = WhisperProcessor.from_pretrained(args.teacher)
+teacher = WhisperForConditionalGeneration.from_pretrained(args.teacher)
+teacher.to(device).eval().requires_grad_(False)  # noqa: FBT003
+generate_kwargs = PROFILES["greedy"].generate_kwargs()
+
+
+def init_student(
+	teacher: WhisperForConditionalGeneration,
+	decoder_layers: int,
+) -> WhisperForConditionalGeneration:
+	"""Initialize the student from the teacher, with fewer decoder layers.
+
+	Args:
+		teacher (WhisperForConditionalGeneration): The teacher.
+		decoder_layers (int): The number of decoder layers of the student.
+
+	Returns:
+		WhisperForConditionalGeneration: The student.
+	"""
+	config = teacher.config.to_dict() | {"decoder_layers": decoder_layers}
+	student = WhisperForConditionalGeneration(type(teacher.config)(**config))
+	# the weights of the removed layers are left out
+	student.load_state_dict(teacher.state_dict(), strict=False)
+	# keep the layers of the teacher the furthest apart, the last one included
+	last = teacher.config.decoder_layers - 1
+	for i, layer in enumerate(student.model.decoder.layers):
+		j = round(i * last / max(decoder_layers - 1, 1))
+		layer.load_state_dict(teacher.model.decoder.layers[j].state_dict())
+		logger.info(f"Student decoder layer {i} <- teacher layer {j}")
+	student.generation_config = teacher.generation_config
+	student.model.encoder.requires_grad_(False)  # noqa: FBT003
+	return student
+
+
+def pseudo_labels(
+	teacher: WhisperForConditionalGeneration,
+	features: torch.Tensor,
+) -> torch.Tensor:
+	"""Transcribe a batch with the teacher, as the labels of the student.
+
+	Returns:
+		torch.Tensor: The tokens of the transcriptions, after the start token,
+		ignored after the end-of-text token.
+	"""
+	# not in inference mode, the labels are used by the backward pass
+	with torch.no_grad():
+		sequences = teacher.generate(features, **generate_kwargs)
+	labels = sequences[:, 1:].clone()  # the start token is prepended by the model
+	is_eos = labels == teacher.generation_config.eos_token_id
+	after_eos = (is_eos.cumsum(dim=-1) - is_eos.long()) > 0
+	return labels.masked_fill(after_eos, IGNORE_INDEX)
+
+
+def distillation_loss(
+	teacher: WhisperForConditionalGeneration,
+	student: WhisperForConditionalGeneration,
+	features: torch.Tensor,
+	labels: torch.Tensor,
+) -> torch.Tensor:
+	"""Compute the loss of the student on a batch.
+
+	Returns:
+		torch.Tensor: The weighted sum of the KL divergence to the teacher and of
+		the cross-entropy on the pseudo-labels.
+	"""
+	with torch.no_grad():
+		teacher_logits = teacher(input_features=features, labels=labels).logits
+	outputs = student(input_features=features, labels=labels)
+	mask = labels != IGNORE_INDEX
+	temperature = args.temperature
+	kl = F.kl_div(
+		F.log_softmax(outputs.logits[mask] / temperature, dim=-1),
+		F.log_softmax(teacher_logits[mask] / temperature, dim=-1),
+		log_target=True,
+		reduction="batchmean",
+	)
+	kl *= temperature**2
+	return args.kl_weight * kl + (1 - args.kl_weight) * outputs.loss
+
+
+student = init_student(teacher, args.decoder_layers).to(device)
+logger.info(
+	f"Teacher: {teacher.num_parameters() / 1e6:.0f}M parameters, "
+	f"student: {student.num_parameters() / 1e6:.0f}M parameters",
+)
+
+# load dataset from disk: data_dir
+dataset = load_from_disk(data_dir)["train"]
+if args.max_samples > 0:
+	dataset = dataset.select(range(min(args.max_samples, len(dataset))))
+dataset = dataset.with_format("torch", columns=["input_features"])
+loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True)
+logger.info(f"Training on {len(dataset)} samples")
+
+optimizer = torch.optim.AdamW(
+	[parameter for parameter in student.parameters() if parameter.requires_grad],
+	lr=args.learning_rate,
+)
+scheduler = get_linear_schedule_with_warmup(
+	optimizer,
+	args.warmup_steps,
+	args.max_steps,
+)
+
+step = 0
+student.train()
+while step < args.max_steps:
+	for batch in loader:
+		features = batch["input_features"].to(device)
+		labels = pseudo_labels(teacher, features)
+		loss = distillation_loss(teacher, student, features, labels)
+		loss.backward()
+		optimizer.step()
+		scheduler.step()
+		optimizer.zero_grad()
+		step += 1
+		if step % args.logging_steps == 0:
+			logger.info(f"Step {step}/{args.max_steps}: loss {loss.item():.4f}")
+		if step >= args.max_steps:
+			break
+
+student.eval()
+student.save_pretrained(output_dir)
+processor.save_pretrained(output_dir)
+logger.info(f"Student saved to {output_dir}")
+
+if args.num_test_samples < 0:
+	sys.exit(0)
+
+# compare the student and the teacher as the API serves them
+audios, captions = load_test_set(Path(args.test_data_dir), args.num_test_samples)
+results = {}
+for name, checkpoint in (("teacher", args.teacher), ("student", output_dir)):
+	model = load_model(checkpoint)
+	texts, latencies = timed_batches(
+		lambda batch, model=model: transcribe_whisper(model, batch, generate_kwargs),
+		audios,
+		batch_size=1,
+	)
+	results[name] = report(name, captions, texts, latencies, audios)
+logger.info(
+	f"Student vs teacher: WER "
+	f"{results['student']['wer'] - results['teacher']['wer']:+.2f} points, "
+	f"{results['teacher']['rtf'] / results['student']['rtf']:.2f}x faster",
+)
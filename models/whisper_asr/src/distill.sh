@@ -0,0 +1,18 @@
+#!/bin/bash
+set -e
+
+# Go to the directory of this script
+cd "$(dirname "$0")"
+
+src_dir=$(pwd)
+hf_dataset_path="$src_dir/../../../datasets/whisper-all-datasets-hf/"
+student_dir="$src_dir/../checkpoints-student"
+
+python "$src_dir/distill.py" \
+   --data-dir "$hf_dataset_path" \
+   --output-dir "$student_dir" \
+   --decoder-layers 2 \
+   --batch-size 16 \
+   --learning-rate 1e-4 \
+   --warmup-steps 500 \
+   --max-steps 10000
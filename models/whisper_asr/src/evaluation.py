@@ -0,0 +1,147 @@
+"""Shared helpers of the benchmarks of the ASR models on a test dataset.
+
+The dataset follows the layout of `build-dataset.py`: exactly one CSV file with
+the columns `audio` and `caption`, and the audios under `audios/`.
+"""
+
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import jiwer
+import librosa
+import numpy as np
+import pandas as pd
+import torch
+from lgg import logger
+from transformers.pipelines import AutomaticSpeechRecognitionPipeline
+
+SAMPLE_RATE = 16000
+MAX_SAMPLES = 30 * SAMPLE_RATE
+DEFAULT_DATA_DIR = Path(__file__).parents[3] / "datasets" / "test-dataset"
+
+
+def load_test_set(
+	data_dir: Path,
+	num_samples: int = 0,
+) -> tuple[list[np.ndarray], list[str]]:
+	"""Load the audios of at most 30 s of a dataset, and their captions.
+
+	Args:
+		data_dir (Path): The directory of the dataset.
+		num_samples (int): The number of audios loaded, 0 to load all of them.
+
+	Returns:
+		tuple[list[np.ndarray], list[str]]: The 16 kHz audios and their captions.
+	"""
+	csv_files = list(data_dir.glob("*.csv"))
+	if len(csv_files) != 1:
+		logger.error(
+			f"Expected exactly one CSV file in {data_dir}, found {len(csv_files)}.",
+		)
+		sys.exit(1)
+	dataframe = pd.read_csv(csv_files[0]).dropna(subset=["audio", "caption"])
+	audios, captions = [], []
+	for audio, caption in zip(dataframe["audio"], dataframe["caption"], strict=True):
+		samples, _ = librosa.load(data_dir / "audios" / audio, sr=SAMPLE_RATE)
+		if len(samples) > MAX_SAMPLES:
+			continue
+		audios.append(samples)
+		captions.append(caption)
+		if len(audios) == num_samples:
+			break
+	logger.info(f"Loaded {len(audios)} audios of at most 30 s from {data_dir}")
+	return audios, captions
+
+
+def wer(references: list[str], predictions: list[str]) -> float:
+	"""Compute the word error rate of transcriptions, in percent."""
+	pairs = [
+		(reference, prediction)
+		for reference, prediction in zip(references, predictions, strict=True)
+		if reference.strip()
+	]
+	references, predictions = zip(*pairs, strict=True)
+	return 100 * jiwer.wer(list(references), list(predictions))
+
+
+def transcribe_whisper(
+	model: AutomaticSpeechRecognitionPipeline,
+	audios: list[np.ndarray],
+	generate_kwargs: dict,
+) -> list[str]:
+	"""Transcribe a batch of audios of at most 30 s with a Whisper pipeline.
+
+	Args:
+		model (AutomaticSpeechRecognitionPipeline): The Whisper pipeline.
+		audios (list[np.ndarray]): The 16 kHz audios.
+		generate_kwargs (dict): The generation settings, see `API/profiles.py`.
+
+	Returns:
+		list[str]: The transcriptions.
+	"""
+	features = model.feature_extractor(
+		audios,
+		sampling_rate=SAMPLE_RATE,
+		return_tensors="pt",
+	).input_features
+	if isinstance(model.model, torch.nn.Module):
+		features = features.to(model.device, dtype=model.model.dtype)
+	with torch.inference_mode():
+		tokens = model.model.generate(features, **generate_kwargs)
+	return model.tokenizer.batch_decode(tokens, skip_special_tokens=True)
+
+
+def timed_batches(
+	transcribe: Callable[[list[np.ndarray]], list[str]],
+	audios: list[np.ndarray],
+	batch_size: int,
+) -> tuple[list[str], list[float]]:
+	"""Transcribe audios by batches, timing each batch.
+
+	Args:
+		transcribe (Callable): Transcribes a batch of audios.
+		audios (list[np.ndarray]): The 16 kHz audios.
+		batch_size (int): The number of audios in a batch.
+
+	Returns:
+		tuple[list[str], list[float]]: The transcriptions, and the latency of each
+		batch, in seconds.
+	"""
+	transcribe(audios[:batch_size])  # warm up
+	texts, latencies = [], []
+	for i in range(0, len(audios), batch_size):
+		start = time.perf_counter()
+		texts.extend(transcribe(audios[i : i + batch_size]))
+		latencies.append(time.perf_counter() - start)
+	return texts, latencies
+
+
+def report(
+	name: str,
+	references: list[str],
+	predictions: list[str],
+	latencies: list[float],
+	audios: list[np.ndarray],
+) -> dict:
+	"""Log and return the WER, the latency and the real-time factor of a run.
+
+	Returns:
+		dict: The WER in percent, the mean and p95 latencies of a batch in
+		milliseconds, and the real-time factor, ie. the compute time per second of
+		audio.
+	"""
+	seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+	result = {
+		"wer": wer(references, predictions),
+		"mean_latency_ms": float(np.mean(latencies)) * 1000,
+		"p95_latency_ms": float(np.percentile(latencies, 95)) * 1000,
+		"rtf": sum(latencies) / seconds,
+	}
+	logger.info(
+		f"{name}: WER {result['wer']:.2f}%, "
+		f"latency mean {result['mean_latency_ms']:.0f} ms, "
+		f"p95 {result['p95_latency_ms']:.0f} ms, RTF {result['rtf']:.3f}",
+	)
+	return result
@@ -11,6 +11,7 @@ import joblib
 import librosa
 import pandas as pd
 import psutil
+import torch
 from joblib import Parallel, delayed
 from lgg import logger
 from transformers import pipeline
@@ -91,11 +92,13 @@ if not audios_dir.exists():
 
 # Load the model
 logger.info(f"Loading model from {model}")
+# float16 on GPU, float32 on CPU where float16 is slow or unsupported
+device = "cuda" if torch.cuda.is_available() else "cpu"
 model = pipeline(
 	model=model,
 	task="automatic-speech-recognition",
-	device=0,
-	torch_dtype="float16",
+	device=device,
+	torch_dtype=torch.float16 if device == "cuda" else torch.float32,
 )
 
 # Load the audio files